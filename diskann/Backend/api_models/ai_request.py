@@ -1,13 +1,16 @@
 """
 AIRequest model
 """
+from typing import Optional
 from pydantic import BaseModel
 
 class AIRequest(BaseModel):
     """
     AIRequest model encapsulates the session_id
     and incoming user prompt for the AI agent
-    to respond to.
+    to respond to. The optional user_id is recorded
+    on the chat session so sessions can be listed per user.
     """
     session_id: str
     prompt: str
+    user_id: Optional[str] = None
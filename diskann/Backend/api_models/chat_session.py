@@ -1,7 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 class ChatSession(BaseModel):
     id: str # The session ID
     title: str # The title of the chat session
+    user_id: Optional[str] = None # The user that owns the chat session
+    last_activity: Optional[str] = None # ISO 8601 UTC timestamp of the last update, used to order session lists
     history: List[dict] = Field(default_factory=list) # The chat history
+    summary: str = "" # Rolling summary of the history messages that fell out of the prompt window
+    summarized_message_count: int = 0 # Number of leading history messages covered by the summary
+    turn_count: int = 0 # Number of turns (user prompt and assistant response) in the history
@@ -1,6 +1,8 @@
+from typing import Optional
 from pydantic import BaseModel
 
 # Define the model for a Chat Session response
 class ChatSessionResponse(BaseModel):
     session_id: str
     title: str
+    last_activity: Optional[str] = None
@@ -1,19 +1,66 @@
 """
 API entrypoint for backend API.
 """
-from fastapi import FastAPI, HTTPException
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from typing import List
-from chat_session_state.cosmosdb_chat_session_state_provider import CosmosDBChatSessionStateProvider
+from typing import List, Optional
 from api_models.chat_session_request import ChatSessionResponse
 
 import uuid
 
 from api_models.ai_request import AIRequest
-from cosmic_works.cosmic_works_ai_agent import CosmicWorksAIAgent
+from cosmic_works.cosmic_works_ai_agent import (
+    CosmicWorksAIAgent,
+    get_runtime,
+    async_client,
+    chat_session_state_provider,
+    session_writer,
+    rate_limiter,
+    embedding_cache,
+    context_formatter,
+    product_vector_index,
+    product_v_change_feed,
+    product_partition_key_index,
+    sales_order_partition_key_index,
+    sales_order_change_feed,
+    tool_result_cache,
+    semantic_answer_cache
+)
+from cosmic_works.agent_pool import AgentPool
+from cosmic_works.session_locks import SessionLocks
+
+logger = logging.getLogger(__name__)
+
+# Seconds the queued chat session writes are given to drain on shutdown
+SESSION_WRITER_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("CHAT_SESSION_DRAIN_TIMEOUT_SECONDS", "30"))
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Builds the shared agent runtime and starts following the product_v and
+    salesOrder change feeds before the first request is served, drains the
+    queued chat session writes and closes the async Cosmos DB client on shutdown.
+    """
+    get_runtime()
+    change_feeds = [feed for feed in (product_v_change_feed, sales_order_change_feed) if feed is not None]
+    for change_feed in change_feeds:
+        change_feed.start()
+    yield
+    for change_feed in change_feeds:
+        change_feed.stop()
+    if session_writer is not None:
+        await asyncio.to_thread(session_writer.close, SESSION_WRITER_DRAIN_TIMEOUT_SECONDS)
+    await async_client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "*"
@@ -25,12 +72,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Continuation-Token"],
 )
 
 
 # Agent pool keyed by session_id to retain memories/history in-memory.
-# Note: the context is lost every time the service is restarted.
-agent_pool = {}
+# The pool is bounded by size and idle time, an evicted agent is rebuilt
+# from its chat_session document the next time the session is used.
+agent_pool = AgentPool(
+    CosmicWorksAIAgent,
+    max_size = int(os.environ.get("AGENT_POOL_MAX_SIZE", "1000")),
+    idle_ttl_seconds = float(os.environ.get("AGENT_POOL_IDLE_TTL_SECONDS", "1800"))
+)
+
+# Per-session locks, the turns of a session run in order while
+# different sessions run concurrently.
+session_locks = SessionLocks()
 
 @app.get("/")
 def root():
@@ -39,41 +96,132 @@ def root():
     """
     return {"status": "ready"}
 
+@app.get("/stats")
+def stats():
+    """
+    Runtime statistics endpoint.
+    """
+    return {
+        "agent_pool": agent_pool.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "context_formatter": context_formatter.stats(),
+        "session_cache": chat_session_state_provider.session_cache.stats(),
+        "session_writer": session_writer.stats() if session_writer is not None else None,
+        "local_vector_index": product_vector_index.stats() if product_vector_index is not None else None,
+        "product_partition_key_index": product_partition_key_index.stats() if product_partition_key_index is not None else None,
+        "sales_order_partition_key_index": sales_order_partition_key_index.stats() if sales_order_partition_key_index is not None else None,
+        "tool_result_cache": tool_result_cache.stats() if tool_result_cache is not None else None,
+        "semantic_answer_cache": semantic_answer_cache.stats() if semantic_answer_cache is not None else None
+    }
+
+def get_session_id(session_id: str) -> str:
+    """
+    Returns the session_id to use for a request.
+    If no session_id is provided or default is provided, generate a new one.
+    """
+    if (session_id is None or session_id == "1234"):
+        return str(uuid.uuid4())
+    return session_id
+
+def set_session_user(agent: CosmicWorksAIAgent, user_id: Optional[str]) -> None:
+    """
+    Records the user on a chat session that has no owner yet,
+    the session is saved with the next turn.
+    """
+    if user_id is not None and agent.chat_session.user_id is None:
+        agent.chat_session.user_id = user_id
+
 @app.post("/ai")
-def run_cosmic_works_ai_agent(request: AIRequest):
+async def run_cosmic_works_ai_agent(request: AIRequest):
     """
     Run the Cosmic Works AI agent.
     """
     prompt = request.prompt
-    session_id = request.session_id
+    session_id = get_session_id(request.session_id)
 
-    # If no session_id is provided or default is provided, generate a new one.
-    if (session_id is None or session_id == "1234"):
-        session_id = str(uuid.uuid4())
+    async with session_locks.get(session_id):
+        # Get the pooled agent for the session, the pool creates (or rebuilds) it when needed.
+        # Building an agent loads its chat session from Cosmos DB, keep that off the event loop.
+        agent = await run_in_threadpool(agent_pool.get, session_id)
+        set_session_user(agent, request.user_id)
 
-    # If the session_id is not in the agent pool, create a new agent.
-    if session_id not in agent_pool:
-        agent_pool[session_id] = CosmicWorksAIAgent(session_id)
+        # Run the agent with the provided prompt.
+        return { "message": await agent.arun(prompt), "session_id": session_id }
 
-    # Run the agent with the provided prompt.
-    return { "message": agent_pool[session_id].run(prompt), "session_id": session_id }
+@app.post("/ai/stream")
+async def stream_cosmic_works_ai_agent(request: AIRequest):
+    """
+    Run the Cosmic Works AI agent and stream its progress as Server-Sent Events.
+    A "session" event carries the session_id, followed by "tool_start" / "tool_end"
+    events for each tool call, "token" events for the answer and a final "end" event.
+
+    The turn is added to the chat history and saved only once the answer is complete,
+    right before the "end" event. When the run fails an "error" event ends the stream
+    instead and the history is left unchanged, so the prompt can be sent again. When
+    the client disconnects the run is cancelled and the turn is discarded as well.
+    """
+    session_id = get_session_id(request.session_id)
+
+    async def event_stream():
+        yield format_server_sent_event("session", {"session_id": session_id})
+        # The session lock is held for the whole stream so turns of a session don't interleave
+        async with session_locks.get(session_id):
+            try:
+                agent = await run_in_threadpool(agent_pool.get, session_id)
+                set_session_user(agent, request.user_id)
+                async for event in agent.astream(request.prompt):
+                    yield format_server_sent_event(event["event"], event["data"])
+            except Exception:
+                logger.exception("Streaming the answer of session %s failed.", session_id)
+                yield format_server_sent_event(
+                    "error",
+                    {"message": "The agent failed to answer, please try again.", "session_id": session_id}
+                )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def format_server_sent_event(event: str, data: dict) -> str:
+    """
+    Formats an event in the Server-Sent Events wire format.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 
 # ========================
 # Chat Session State / History Support is below:
 # ========================
 
-# Create an instance of the CosmosDBChatSessionStateProvider class
-# This will be used to load or create Chat Sessions
-chat_session_state_provider = CosmosDBChatSessionStateProvider()
+# The CosmosDBChatSessionStateProvider instance is shared with the agents
+# so the endpoints below and the agents use the same session cache
 
 @app.get("/session/list", response_model=List[ChatSessionResponse])
-def list_sessions():
+def list_sessions(
+        response: Response,
+        page_size: int = Query(50, ge=1, le=1000),
+        continuation_token: Optional[str] = None,
+        user_id: Optional[str] = None):
     """
-    Endpoint to list all chat sessions.
+    Endpoint to list chat sessions, most recently active first, one page at a time.
+    When more sessions are available, the token of the next page is returned
+    in the X-Continuation-Token response header.
     """
     try:
-        return chat_session_state_provider.list_sessions()
+        sessions, next_continuation_token = chat_session_state_provider.list_sessions(
+            page_size=page_size,
+            continuation_token=continuation_token,
+            user_id=user_id
+        )
+        if next_continuation_token is not None:
+            response.headers["X-Continuation-Token"] = next_continuation_token
+        return sessions
+    except ValueError as e:
+        # Return a bad request error if the continuation token is invalid
+        raise HTTPException(status_code=400, detail=str(e))
     except RuntimeError as e:
         # Return an internal server error if a runtime error occurs
         raise HTTPException(status_code=500, detail=str(e))
@@ -85,6 +233,11 @@ def load_session(session_id: str):
     Endpoint to load a chat session by session_id.
     """
     try:
+        # A session with queued turns is newer than the one stored in Cosmos DB
+        if session_writer is not None:
+            session = session_writer.get_pending_session(session_id)
+            if session is not None:
+                return session.model_dump()
         return chat_session_state_provider.load_session(session_id)
     except ValueError as e:
         # Return a 404 error if the session is not found
@@ -0,0 +1,7 @@
+"""
+This module contains the offline benchmark suite of the backend
+and the local stand-ins for Cosmos DB and Azure OpenAI.
+"""
+from .fake_cosmos import FakeContainerProxy, FakeAsyncContainerProxy, FakeCosmosClient, FakeAsyncCosmosClient
+from .fake_models import FakeEmbeddings, ScriptedChatModel
+from .environment import BenchmarkEnvironment
@@ -0,0 +1,171 @@
+"""
+Benchmarks the backend without Azure resources: Cosmos DB and Azure OpenAI
+are replaced by local stand-ins with a simulated latency (see environment.py).
+Latency percentiles and throughput of each scenario are compared with the
+stored baseline, the exit status is 1 when a scenario regressed. The baseline
+records the parameters it was run with (including the backend settings that
+are set), it is not compared with a run using different parameters.
+
+Usage (from the Backend folder):
+    python -m benchmarks --requests 200 --concurrency 16
+    python -m benchmarks --scenarios retriever tools --save-baseline
+
+The backend settings apply as usual, e.g. to benchmark the local vector index:
+    LOCAL_VECTOR_INDEX=exact python -m benchmarks --scenarios retriever ai_endpoint
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Optional
+from dotenv import load_dotenv
+from .environment import BenchmarkEnvironment
+from .runner import compare_to_baseline, format_report, get_parameter_mismatches, run_scenario
+from .scenarios import SCENARIOS
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# The backend settings that change the measured behavior (caches, indexes, session
+# persistence, rate limits), recorded with the run parameters when they are set
+BACKEND_SETTINGS = (
+    "AGENT_POOL_IDLE_TTL_SECONDS",
+    "AGENT_POOL_MAX_SIZE",
+    "AOAI_COMPLETIONS_RPM",
+    "AOAI_COMPLETIONS_TPM",
+    "AOAI_EMBEDDINGS_RPM",
+    "AOAI_EMBEDDINGS_TPM",
+    "CHAT_HISTORY_MAX_TOKENS",
+    "CHAT_HISTORY_SUMMARIZE",
+    "CHAT_SESSION_FLUSH_INTERVAL_SECONDS",
+    "CHAT_SESSION_FLUSH_MAX_RETRIES",
+    "CHAT_SESSION_FLUSH_MAX_SESSIONS",
+    "CHAT_SESSION_MAX_PENDING",
+    "CHAT_SESSION_PERSISTENCE",
+    "CHAT_SESSION_STORAGE_MODE",
+    "CONTEXT_CARD_CACHE_SIZE",
+    "EMBEDDING_CACHE_MAX_SIZE",
+    "EMBEDDING_CACHE_PATH",
+    "EMBEDDING_CACHE_QUANTIZATION",
+    "EMBEDDING_CACHE_TTL_SECONDS",
+    "LOCAL_VECTOR_INDEX",
+    "LOCAL_VECTOR_INDEX_PROBES",
+    "PARTITION_KEY_INDEX",
+    "PRODUCT_CHANGE_FEED_POLL_SECONDS",
+    "RETRIEVER_MMR_LAMBDA",
+    "RETRIEVER_OVERSAMPLE_FACTOR",
+    "RETRIEVER_SCORE_THRESHOLD",
+    "SALES_ORDER_CHANGE_FEED_POLL_SECONDS",
+    "SEMANTIC_ANSWER_CACHE",
+    "SEMANTIC_ANSWER_CACHE_MAX_SIZE",
+    "SEMANTIC_ANSWER_CACHE_THRESHOLD",
+    "SEMANTIC_ANSWER_CACHE_TTL_SECONDS",
+    "SESSION_CACHE_MAX_SIZE",
+    "SESSION_CACHE_TTL_SECONDS",
+    "TOOL_RESULT_CACHE",
+    "TOOL_RESULT_CACHE_MAX_SIZE",
+    "TOOL_RESULT_CACHE_TTL_SECONDS",
+    "TOOL_RESULT_MAX_TOKENS"
+)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Cosmic Works backend against local stand-ins.")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent per scenario.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests.")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring.")
+    parser.add_argument("--products", type=int, default=1000, help="Number of synthetic products.")
+    parser.add_argument("--sales-orders", type=int, default=1000, help="Number of synthetic sales orders.")
+    parser.add_argument("--cosmos-latency-ms", type=float, default=2, help="Simulated latency of a Cosmos DB operation.")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Simulated latency of a chat completion.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=10, help="Simulated latency of an embeddings request.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline results file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression from the baseline, as a fraction.")
+    parser.add_argument("--output", help="File the results are written to as JSON.")
+    return parser.parse_args()
+
+def get_parameters(args: argparse.Namespace) -> dict:
+    """
+    Returns the parameters of a run, stored with the results since they determine them:
+    the command line arguments and the backend settings that are set (from the
+    environment or the .env file, unset settings use their defaults).
+    """
+    load_dotenv()
+    settings = {name: os.environ[name] for name in BACKEND_SETTINGS if name in os.environ}
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "products": args.products,
+        "sales_orders": args.sales_orders,
+        "cosmos_latency_ms": args.cosmos_latency_ms,
+        "llm_latency_ms": args.llm_latency_ms,
+        "embedding_latency_ms": args.embedding_latency_ms,
+        **settings
+    }
+
+def load_baseline(path: str, parameters: dict) -> Optional[dict]:
+    """
+    Returns the scenario results of the baseline, None when there is no baseline
+    or it was run with different parameters.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    mismatches = get_parameter_mismatches(parameters, baseline.get("parameters"))
+    if mismatches:
+        print(f"Not comparing with the baseline {path}, its parameters differ: {'; '.join(mismatches)}")
+        return None
+    return baseline["scenarios"]
+
+async def run(args: argparse.Namespace) -> dict:
+    results = {}
+    async with BenchmarkEnvironment(
+            num_products=args.products,
+            num_sales_orders=args.sales_orders,
+            cosmos_latency_seconds=args.cosmos_latency_ms / 1000,
+            llm_latency_seconds=args.llm_latency_ms / 1000,
+            embedding_latency_seconds=args.embedding_latency_ms / 1000) as environment:
+        for scenario in args.scenarios:
+            logging.info("Running %s...", scenario)
+            results[scenario] = await run_scenario(
+                SCENARIOS[scenario](environment),
+                args.requests,
+                args.concurrency,
+                args.warmup,
+                environment.cosmos_client
+            )
+    return results
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    logging.getLogger(__package__).setLevel(logging.INFO)
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+    parameters = get_parameters(args)
+    baseline = load_baseline(args.baseline, parameters) if not args.save_baseline else None
+    results = asyncio.run(run(args))
+
+    print(format_report(results, baseline))
+    output = {"parameters": parameters, "scenarios": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(output, file, indent=4)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+
+    regressions = compare_to_baseline(results, baseline or {}, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Class: BenchmarkEnvironment
+Description:
+    The BenchmarkEnvironment class runs the backend against local
+    stand-ins: the Cosmos DB clients are replaced by FakeCosmosClient
+    (seeded with a synthetic Cosmic Works dataset) and the agent runtime
+    is built on FakeEmbeddings and ScriptedChatModel. It must be entered
+    before the backend modules are imported since they connect to Cosmos DB
+    on import.
+
+    Entering the environment runs the application lifespan, so the change
+    feed listeners are started and caught up before the benchmarks run.
+    The backend settings (.env / environment variables) apply as usual,
+    e.g. LOCAL_VECTOR_INDEX=exact benchmarks the local vector index.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import uuid
+from contextlib import AsyncExitStack
+from typing import List, Optional
+from unittest.mock import patch
+import azure.cosmos
+import azure.cosmos.aio
+import httpx
+from .fake_cosmos import FakeCosmosClient, FakeAsyncCosmosClient
+from .fake_models import FakeEmbeddings, ScriptedChatModel
+
+DATABASE_NAME = "cosmic_works_pv"
+PARTITION_KEY_PATHS = {
+    "product_v": "/categoryId",
+    "salesOrder": "/customerId",
+    "chat_session": "/id",
+    "chat_session_turn": "/sessionId"
+}
+CATEGORIES = [
+    "Bikes, Mountain Bikes", "Bikes, Road Bikes", "Bikes, Touring Bikes", "Components, Brakes",
+    "Components, Chains", "Components, Wheels", "Components, Pedals", "Clothing, Jerseys",
+    "Clothing, Gloves", "Clothing, Shorts", "Accessories, Helmets", "Accessories, Lights",
+    "Accessories, Locks", "Accessories, Bottles and Cages", "Accessories, Tires and Tubes"
+]
+WORDS = [
+    "lightweight", "carbon", "aluminum", "durable", "comfortable", "waterproof", "racing", "trail",
+    "commuter", "adjustable", "reflective", "breathable", "padded", "tubeless", "hydraulic", "compact",
+    "ergonomic", "aerodynamic", "rugged", "classic", "red", "black", "silver", "blue", "yellow", "large",
+    "medium", "small", "women's", "men's", "kids", "professional", "endurance", "all-weather", "quick-release"
+]
+
+def generate_products(embeddings: FakeEmbeddings, num_products: int, seed: int = 0) -> List[dict]:
+    """
+    Generates synthetic products with their content vector.
+    """
+    rng = random.Random(seed)
+    products = []
+    for index in range(num_products):
+        category_name = CATEGORIES[index % len(CATEGORIES)]
+        words = rng.sample(WORDS, 6)
+        product = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "categoryId": hashlib.md5(category_name.encode()).hexdigest(),
+            "categoryName": category_name,
+            "sku": f"{category_name[:2].upper()}-{index:05d}",
+            "name": f"{words[0].capitalize()} {words[1]} {category_name.split(', ')[1].rstrip('s')} {index}",
+            "description": f"A {words[2]}, {words[3]} and {words[4]} product for {words[5]} riders.",
+            "price": round(rng.uniform(5, 3500), 2),
+            "tags": [{"_id": str(uuid.UUID(int=rng.getrandbits(128))), "name": f"Tag-{rng.randint(1, 200)}"}]
+        }
+        text = f"{product['categoryName']} {product['name']} {product['description']}"
+        product["contentVector"] = embeddings.embed(text)
+        product["contentHash"] = hashlib.sha256(text.encode()).hexdigest()
+        products.append(product)
+    return products
+
+def generate_sales_orders(products: List[dict], num_sales_orders: int, num_customers: int = 500, seed: int = 0) -> List[dict]:
+    """
+    Generates synthetic sales orders of the products.
+    """
+    rng = random.Random(seed)
+    customer_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(num_customers)]
+    sales_orders = []
+    for _ in range(num_sales_orders):
+        details = [
+            {"sku": product["sku"], "name": product["name"], "price": product["price"], "quantity": rng.randint(1, 4)}
+            for product in rng.sample(products, rng.randint(1, 4))
+        ]
+        sales_orders.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "type": "salesOrder",
+            "customerId": rng.choice(customer_ids),
+            "orderDate": "2024-06-01T00:00:00",
+            "shipDate": "2024-06-03T00:00:00",
+            "details": details
+        })
+    return sales_orders
+
+class BenchmarkEnvironment:
+    """
+    An async context manager running the backend application on local stand-ins.
+    """
+    def __init__(
+            self,
+            num_products: int = 1000,
+            num_sales_orders: int = 1000,
+            cosmos_latency_seconds: float = 0.002,
+            llm_latency_seconds: float = 0.05,
+            embedding_latency_seconds: float = 0.01,
+            seed: int = 0):
+        """
+        Args:
+            num_products: Number of synthetic products in product_v.
+            num_sales_orders: Number of synthetic sales orders in salesOrder.
+            cosmos_latency_seconds: Simulated latency of every Cosmos DB operation.
+            llm_latency_seconds: Simulated latency of every chat completion.
+            embedding_latency_seconds: Simulated latency of every embeddings request.
+            seed: Seed of the synthetic dataset.
+        """
+        self.embeddings = FakeEmbeddings(latency_seconds=embedding_latency_seconds)
+        self.llm = ScriptedChatModel(latency_seconds=llm_latency_seconds)
+        self.cosmos_client = FakeCosmosClient(PARTITION_KEY_PATHS, cosmos_latency_seconds)
+        self.products = generate_products(self.embeddings, num_products, seed)
+        self.sales_orders = generate_sales_orders(self.products, num_sales_orders, seed=seed)
+        self.app = None
+        self.agent_module = None
+        self.runtime = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+
+    def __seed(self) -> None:
+        database = self.cosmos_client.get_database_client(DATABASE_NAME)
+        product_v_container = database.get_container_client("product_v")
+        for product in self.products:
+            product_v_container._upsert(product)
+        sales_order_container = database.get_container_client("salesOrder")
+        for sales_order in self.sales_orders:
+            sales_order_container._upsert(sales_order)
+
+    async def __aenter__(self) -> "BenchmarkEnvironment":
+        self.__seed()
+        self._exit_stack = AsyncExitStack()
+        # The settings are read on import, placeholders are enough since no request leaves the process
+        os.environ.setdefault("COSMOS_DB_CONNECTION_STRING", "AccountEndpoint=https://localhost:8081/;AccountKey=benchmark;")
+        os.environ.setdefault("AOAI_ENDPOINT", "https://localhost")
+        os.environ.setdefault("AOAI_KEY", "benchmark")
+        for patcher in (
+                patch.object(azure.cosmos.CosmosClient, "from_connection_string", lambda *args, **kwargs: self.cosmos_client),
+                patch.object(
+                    azure.cosmos.aio.CosmosClient,
+                    "from_connection_string",
+                    lambda *args, **kwargs: FakeAsyncCosmosClient(self.cosmos_client))):
+            self._exit_stack.enter_context(patcher)
+
+        import app
+        import cosmic_works.cosmic_works_ai_agent as agent_module
+        self.app = app.app
+        self.agent_module = agent_module
+        self.runtime = agent_module.CosmicWorksAIRuntime(llm=self.llm, embedding_model=self.embeddings)
+        self.runtime.agent_executor.verbose = False
+        agent_module.set_runtime(self.runtime)
+
+        await self._exit_stack.enter_async_context(self.app.router.lifespan_context(self.app))
+        # The client of the HTTP scenarios, closed before the application shuts down
+        self.http_client = await self._exit_stack.enter_async_context(httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app),
+            base_url="http://benchmark",
+            timeout=60
+        ))
+        for change_feed in (agent_module.product_v_change_feed, agent_module.sales_order_change_feed):
+            if change_feed is not None:
+                await asyncio.to_thread(change_feed.wait_until_caught_up, 60)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._exit_stack.__aexit__(*exc_info)
@@ -0,0 +1,396 @@
+"""
+Class: FakeContainerProxy
+Description:
+    The FakeContainerProxy class is an in-memory stand-in for the subset
+    of the azure.cosmos ContainerProxy used by the backend: point reads
+    (with ETag revalidation), upserts, transactional batches, the change
+    feed and the queries issued by the retriever, the lookup tools and
+    the chat session provider, including VectorDistance searches.
+
+    Every operation can be delayed by a simulated network latency and is
+    counted, so benchmarks report the number of Cosmos DB operations
+    (point reads, single-partition and cross-partition queries) per request.
+
+    FakeCosmosClient and FakeAsyncCosmosClient return the fake containers
+    in place of the azure.cosmos and azure.cosmos.aio clients.
+"""
+import asyncio
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import numpy as np
+from azure.cosmos import ContainerProxy, exceptions
+from azure.cosmos.aio import ContainerProxy as AsyncContainerProxy
+
+QUERY_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?:TOP\s+(?P<top>@\w+|\d+)\s+)?(?P<projection>.+?)\s+FROM\s+(?P<alias>\w+)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>.+?))?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+VECTOR_DISTANCE_PATTERN = re.compile(
+    r"VectorDistance\(\s*\w+\.(?P<field>\w+)\s*,\s*(?P<parameter>@\w+)\s*\)(?:\s+AS\s+(?P<name>\w+))?",
+    re.IGNORECASE
+)
+CONDITION_PATTERN = re.compile(r"^\s*\w+\.(?P<field>\w+)\s*=\s*(?P<parameter>@\w+)\s*$")
+IS_STRING_CONDITION_PATTERN = re.compile(r"^\s*(?P<negated>NOT\s+)?IS_STRING\(\s*\w+\.(?P<field>\w+)\s*\)\s*$", re.IGNORECASE)
+ORDER_PATTERN = re.compile(r"^\s*\w+\.(?P<field>\w+)(?:\s+(?P<direction>ASC|DESC))?\s*$", re.IGNORECASE)
+
+class FakeContainerProxy(ContainerProxy):
+    """
+    A thread-safe in-memory Cosmos DB container. It derives from ContainerProxy so it
+    validates where the backend expects a container, the SDK constructor is not called.
+    """
+    def __init__(self, id: str, partition_key_path: str = "/id", latency_seconds: float = 0.0):
+        """
+        Args:
+            id: The container name.
+            partition_key_path: The partition key path of the container, e.g. "/categoryId".
+            latency_seconds: Simulated network latency added to every operation.
+        """
+        self.id = id
+        self.container_link = f"dbs/benchmark/colls/{id}"
+        self.partition_key_field = partition_key_path.lstrip("/")
+        self.latency_seconds = latency_seconds
+        self.indexing_policy: dict = {}
+        self.operations: Counter = Counter()
+        self._items: Dict[tuple[Any, str], dict] = {}
+        self._lock = threading.Lock()
+        self._lsn = itertools.count(1)
+        self._last_lsn = 0
+        self._vector_fields: Dict[str, tuple[int, Dict[int, int], np.ndarray]] = {}
+
+    def _simulate_latency(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.operations[operation] += 1
+
+    # Internal operations, without the simulated latency (shared with the async proxy)
+
+    def _upsert(self, body: dict) -> dict:
+        with self._lock:
+            self._last_lsn = next(self._lsn)
+            item = dict(body, _etag=f"\"{self._last_lsn}\"", _ts=int(time.time()), _lsn=self._last_lsn)
+            self._items[(item.get(self.partition_key_field), item["id"])] = item
+            return dict(item)
+
+    def _read(self, item: str, partition_key: Any, initial_headers: Optional[dict] = None) -> dict:
+        with self._lock:
+            stored = self._items.get((partition_key, item))
+        if stored is None:
+            raise exceptions.CosmosResourceNotFoundError(message=f"Item {item} not found.")
+        if initial_headers and initial_headers.get("If-None-Match") == stored["_etag"]:
+            raise exceptions.CosmosHttpResponseError(status_code=304, message="Not Modified")
+        return dict(stored)
+
+    def _delete(self, item: str, partition_key: Any) -> None:
+        with self._lock:
+            if self._items.pop((partition_key, item), None) is None:
+                raise exceptions.CosmosResourceNotFoundError(message=f"Item {item} not found.")
+
+    def _query(self, query: str, parameters: Optional[List[dict]] = None, partition_key: Any = None) -> List[dict]:
+        match = QUERY_PATTERN.match(query)
+        if match is None:
+            raise NotImplementedError(f"Unsupported query: {query}")
+        values = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        with self._lock:
+            items = [
+                item for (item_partition_key, _), item in self._items.items()
+                if partition_key is None or item_partition_key == partition_key
+            ]
+
+        if match.group("where"):
+            for condition in re.split(r"\s+AND\s+", match.group("where"), flags=re.IGNORECASE):
+                is_string_match = IS_STRING_CONDITION_PATTERN.match(condition)
+                if is_string_match is not None:
+                    negated, field = bool(is_string_match.group("negated")), is_string_match.group("field")
+                    items = [item for item in items if isinstance(item.get(field), str) != negated]
+                    continue
+                condition_match = CONDITION_PATTERN.match(condition)
+                if condition_match is None:
+                    raise NotImplementedError(f"Unsupported condition: {condition}")
+                field, value = condition_match.group("field"), values[condition_match.group("parameter")]
+                items = [item for item in items if item.get(field) == value]
+
+        # The vector distance is the cosine similarity, the most similar items come first
+        projection = match.group("projection")
+        vector_match = VECTOR_DISTANCE_PATTERN.search(projection)
+        scores = None
+        if vector_match is not None:
+            scores = self.__get_similarities(vector_match.group("field"), values[vector_match.group("parameter")], items)
+            projection = projection[:vector_match.start()] + projection[vector_match.end():]
+
+        order = match.group("order")
+        if order and VECTOR_DISTANCE_PATTERN.search(order):
+            ranked = sorted(zip(items, scores), key=lambda entry: -entry[1])
+            items, scores = [entry[0] for entry in ranked], [entry[1] for entry in ranked]
+        elif order:
+            # Stable sorts from the last ORDER BY field to the first
+            for clause in reversed(order.split(",")):
+                order_match = ORDER_PATTERN.match(clause)
+                if order_match is None:
+                    raise NotImplementedError(f"Unsupported ORDER BY: {clause}")
+                descending = (order_match.group("direction") or "").upper() == "DESC"
+                field = order_match.group("field")
+                ordered = sorted(range(len(items)), key=lambda index: items[index].get(field), reverse=descending)
+                items = [items[index] for index in ordered]
+                scores = [scores[index] for index in ordered] if scores is not None else None
+
+        top = match.group("top")
+        if top is not None:
+            count = int(values[top]) if top.startswith("@") else int(top)
+            items = items[:count]
+            scores = scores[:count] if scores is not None else None
+
+        fields = [field.strip() for field in projection.split(",") if field.strip()]
+        results = []
+        for index, item in enumerate(items):
+            if fields == ["*"]:
+                result = dict(item)
+            else:
+                result = {}
+                for field in fields:
+                    name = field.split(".", 1)[-1]
+                    if name in item:
+                        result[name] = item[name]
+            if scores is not None:
+                result[vector_match.group("name") or "$1"] = float(scores[index])
+            results.append(result)
+        return results
+
+    def __get_similarities(self, field: str, embedding: List[float], items: List[dict]) -> List[float]:
+        """
+        Returns the cosine similarity of the embedding and the vector of each item. The
+        normalized vectors of the container are held in a matrix rebuilt after writes.
+        """
+        with self._lock:
+            cached = self._vector_fields.get(field)
+            if cached is None or cached[0] != self._last_lsn:
+                vector_items = [item for item in self._items.values() if item.get(field)]
+                matrix = np.asarray([item[field] for item in vector_items], dtype=np.float32).reshape(len(vector_items), -1)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                rows = {id(item): row for row, item in enumerate(vector_items)}
+                cached = (self._last_lsn, rows, matrix / norms)
+                self._vector_fields[field] = cached
+        _, rows, matrix = cached
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        all_scores = matrix @ query if rows else np.empty(0, dtype=np.float32)
+        return [float(all_scores[rows[id(item)]]) if id(item) in rows else -1.0 for item in items]
+
+    def _query_change_feed(self, is_start_from_beginning: bool, continuation: Optional[str]) -> tuple[List[dict], int]:
+        with self._lock:
+            if continuation is not None:
+                start = int(continuation)
+            elif is_start_from_beginning:
+                start = 0
+            else:
+                start = self._last_lsn
+            changes = sorted((item for item in self._items.values() if item["_lsn"] > start), key=lambda item: item["_lsn"])
+            return [dict(item) for item in changes], self._last_lsn
+
+    # ContainerProxy methods
+
+    def read(self, **kwargs) -> dict:
+        return {"id": self.id, "indexingPolicy": self.indexing_policy}
+
+    def upsert_item(self, body: dict, **kwargs) -> dict:
+        self._simulate_latency()
+        self._count("upsert")
+        return self._upsert(body)
+
+    create_item = upsert_item
+
+    def read_item(self, item: str, partition_key: Any, initial_headers: Optional[dict] = None, **kwargs) -> dict:
+        self._simulate_latency()
+        self._count("read")
+        return self._read(item, partition_key, initial_headers)
+
+    def patch_item(self, item: str, partition_key: Any, patch_operations: List[dict], **kwargs) -> dict:
+        self._simulate_latency()
+        self._count("patch")
+        body = self._read(item, partition_key)
+        for operation in patch_operations:
+            if operation["op"] not in ("add", "set", "replace"):
+                raise NotImplementedError(f"Unsupported patch operation: {operation['op']}")
+            body[operation["path"].lstrip("/")] = operation["value"]
+        return self._upsert(body)
+
+    def delete_item(self, item: str, partition_key: Any, **kwargs) -> None:
+        self._simulate_latency()
+        self._count("delete")
+        self._delete(item, partition_key)
+
+    def query_items(
+            self,
+            query: str,
+            parameters: Optional[List[dict]] = None,
+            partition_key: Any = None,
+            enable_cross_partition_query: Optional[bool] = None,
+            **kwargs) -> Iterator[dict]:
+        self._simulate_latency()
+        self._count("query" if partition_key is not None else "cross_partition_query")
+        return iter(self._query(query, parameters, partition_key))
+
+    def execute_item_batch(self, batch_operations: List[tuple], partition_key: Any, **kwargs) -> List[dict]:
+        self._simulate_latency()
+        self._count("batch")
+        results = []
+        for operation, args in batch_operations:
+            if operation in ("upsert", "create", "replace"):
+                results.append(self._upsert(args[-1]))
+            elif operation == "read":
+                results.append(self._read(args[0], partition_key))
+            elif operation == "delete":
+                self._delete(args[0], partition_key)
+                results.append({})
+            else:
+                raise NotImplementedError(f"Unsupported batch operation: {operation}")
+        return results
+
+    def query_items_change_feed(
+            self,
+            is_start_from_beginning: bool = False,
+            continuation: Optional[str] = None,
+            max_item_count: Optional[int] = None,
+            response_hook=None,
+            **kwargs) -> Iterator[dict]:
+        self._simulate_latency()
+        self._count("change_feed")
+        changes, last_lsn = self._query_change_feed(is_start_from_beginning, continuation)
+
+        def iterate_changes() -> Iterator[dict]:
+            yield from changes
+            # Like the SDK, the ETag of the last page is the continuation of the next read
+            if response_hook is not None:
+                response_hook({"etag": str(last_lsn)}, None)
+        return iterate_changes()
+
+class FakeAsyncContainerProxy(AsyncContainerProxy):
+    """
+    An azure.cosmos.aio stand-in sharing the items and counters of a FakeContainerProxy.
+    """
+    def __init__(self, container: FakeContainerProxy):
+        self.container = container
+        self.id = container.id
+        self.container_link = container.container_link
+
+    async def _simulate_latency(self) -> None:
+        if self.container.latency_seconds:
+            await asyncio.sleep(self.container.latency_seconds)
+
+    async def upsert_item(self, body: dict, **kwargs) -> dict:
+        await self._simulate_latency()
+        self.container._count("upsert")
+        return self.container._upsert(body)
+
+    async def read_item(self, item: str, partition_key: Any, initial_headers: Optional[dict] = None, **kwargs) -> dict:
+        await self._simulate_latency()
+        self.container._count("read")
+        return self.container._read(item, partition_key, initial_headers)
+
+    async def query_items(
+            self,
+            query: str,
+            parameters: Optional[List[dict]] = None,
+            partition_key: Any = None,
+            **kwargs) -> AsyncIterator[dict]:
+        await self._simulate_latency()
+        self.container._count("query" if partition_key is not None else "cross_partition_query")
+        for item in self.container._query(query, parameters, partition_key):
+            yield item
+
+class FakeDatabaseProxy:
+    """
+    A database of fake containers, created on first use.
+    """
+    def __init__(self, id: str, partition_key_paths: Dict[str, str], latency_seconds: float = 0.0):
+        self.id = id
+        self.partition_key_paths = partition_key_paths
+        self.latency_seconds = latency_seconds
+        self.containers: Dict[str, FakeContainerProxy] = {}
+        self._lock = threading.Lock()
+
+    def get_container_client(self, container: str, partition_key_path: Optional[str] = None) -> FakeContainerProxy:
+        with self._lock:
+            if container not in self.containers:
+                self.containers[container] = FakeContainerProxy(
+                    container,
+                    partition_key_path or self.partition_key_paths.get(container, "/id"),
+                    self.latency_seconds
+                )
+            return self.containers[container]
+
+    def create_container_if_not_exists(self, id: str, partition_key=None, indexing_policy=None, **kwargs) -> FakeContainerProxy:
+        container = self.get_container_client(id, getattr(partition_key, "path", None))
+        with self._lock:
+            if indexing_policy is not None and not container.indexing_policy:
+                container.indexing_policy = indexing_policy
+        return container
+
+    def replace_container(self, container, partition_key=None, indexing_policy=None, **kwargs) -> FakeContainerProxy:
+        container = self.get_container_client(getattr(container, "id", container))
+        if indexing_policy is not None:
+            container.indexing_policy = indexing_policy
+        return container
+
+class FakeCosmosClient:
+    """
+    A stand-in for azure.cosmos CosmosClient holding fake databases.
+    """
+    def __init__(self, partition_key_paths: Optional[Dict[str, str]] = None, latency_seconds: float = 0.0):
+        """
+        Args:
+            partition_key_paths: The partition key path of each container by name, "/id" by default.
+            latency_seconds: Simulated network latency added to every operation.
+        """
+        self.partition_key_paths = partition_key_paths or {}
+        self.latency_seconds = latency_seconds
+        self.databases: Dict[str, FakeDatabaseProxy] = {}
+        self._lock = threading.Lock()
+
+    def get_database_client(self, database: str) -> FakeDatabaseProxy:
+        with self._lock:
+            if database not in self.databases:
+                self.databases[database] = FakeDatabaseProxy(database, self.partition_key_paths, self.latency_seconds)
+            return self.databases[database]
+
+    def create_database_if_not_exists(self, id: str, **kwargs) -> FakeDatabaseProxy:
+        return self.get_database_client(id)
+
+    def operations(self) -> Counter:
+        """
+        Returns the number of operations of each type run against every container.
+        """
+        total = Counter()
+        for database in list(self.databases.values()):
+            for container in list(database.containers.values()):
+                total.update(container.operations)
+        return total
+
+class FakeAsyncDatabaseProxy:
+    def __init__(self, database: FakeDatabaseProxy):
+        self.database = database
+        self.id = database.id
+
+    def get_container_client(self, container: str) -> FakeAsyncContainerProxy:
+        return FakeAsyncContainerProxy(self.database.get_container_client(container))
+
+class FakeAsyncCosmosClient:
+    """
+    A stand-in for azure.cosmos.aio CosmosClient sharing the databases of a FakeCosmosClient.
+    """
+    def __init__(self, client: FakeCosmosClient):
+        self.client = client
+
+    def get_database_client(self, database: str) -> FakeAsyncDatabaseProxy:
+        return FakeAsyncDatabaseProxy(self.client.get_database_client(database))
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,115 @@
+"""
+Local stand-ins for the Azure OpenAI models used by the agent:
+
+    FakeEmbeddings      - deterministic embeddings (hashed bag of words), texts
+                          sharing words have similar vectors
+    ScriptedChatModel   - a chat model that requests the tool calls a question
+                          needs (vector search, sku and sales order lookups) in a
+                          single step and answers from the tool results
+
+Both simulate the latency of the service so the benchmarks measure the
+backend, not the models.
+"""
+import asyncio
+import re
+import time
+import uuid
+import zlib
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import AzureOpenAIEmbeddings
+
+SKU_PATTERN = re.compile(r"\b[A-Z]{2}-[A-Z0-9]+(?:-[A-Z0-9]+)*\b")
+SALES_ORDER_ID_PATTERN = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b")
+
+class FakeEmbeddings(AzureOpenAIEmbeddings):
+    """
+    Deterministic embeddings, an AzureOpenAIEmbeddings so it validates where the real model is expected.
+    """
+    vector_dimensions: int = 1536
+    latency_seconds: float = 0.0
+
+    def __init__(self, **kwargs):
+        # The client settings are required by AzureOpenAIEmbeddings, no request is ever sent
+        defaults = {
+            "azure_endpoint": "https://localhost",
+            "api_key": "benchmark",
+            "openai_api_version": "2024-06-01",
+            "azure_deployment": "embeddings"
+        }
+        super().__init__(**{**defaults, **kwargs})
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Returns the normalized hashed bag of words of a text.
+        """
+        vector = np.zeros(self.vector_dimensions, dtype=np.float32)
+        for token in re.findall(r"\w+", text.casefold()):
+            hashed = zlib.crc32(token.encode())
+            vector[hashed % self.vector_dimensions] += 1.0 if hashed & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self.embed(text)
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = 0) -> List[List[float]]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self.embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self.embed(text)
+
+    async def aembed_documents(self, texts: List[str], chunk_size: Optional[int] = 0) -> List[List[float]]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return [self.embed(text) for text in texts]
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A chat model following a fixed script: when tools are bound and the step has no tool
+    results yet, it calls vector_search_products with the question and the lookup tools
+    for every sku and sales order id it mentions, all in one response. Otherwise it
+    answers with a summary of the tool results.
+    """
+    latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def __respond(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        if tools and not isinstance(messages[-1], ToolMessage):
+            question = next(
+                (message.content for message in reversed(messages) if isinstance(message, HumanMessage)), ""
+            )
+            tool_calls = [{"name": "vector_search_products", "args": {"query": question}}]
+            tool_calls += [{"name": "get_product_by_sku", "args": {"sku": sku}} for sku in SKU_PATTERN.findall(question)]
+            tool_calls += [
+                {"name": "get_sales_by_id", "args": {"sales_id": sales_id}}
+                for sales_id in SALES_ORDER_ID_PATTERN.findall(question)
+            ]
+            return AIMessage(
+                content="",
+                tool_calls=[dict(tool_call, id=f"call_{uuid.uuid4().hex[:12]}") for tool_call in tool_calls]
+            )
+        tool_results = [message.content for message in messages if isinstance(message, ToolMessage)]
+        return AIMessage(content=f"Here is what I found in {len(tool_results)} tool results: {' '.join(tool_results)[:200]}")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self.__respond(messages, kwargs.get("tools")))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self.__respond(messages, kwargs.get("tools")))])
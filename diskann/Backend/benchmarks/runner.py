@@ -0,0 +1,129 @@
+"""
+Runs the benchmark scenarios under concurrency, reports their latency
+percentiles and throughput and compares them with a stored baseline.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from .fake_cosmos import FakeCosmosClient
+from .scenarios import Request
+
+logger = logging.getLogger(__name__)
+
+async def run_scenario(
+        request: Request,
+        num_requests: int,
+        concurrency: int,
+        num_warmup_requests: int = 0,
+        cosmos_client: Optional[FakeCosmosClient] = None) -> dict:
+    """
+    Sends num_requests requests from concurrency concurrent workers, after the warmup requests.
+
+    Returns:
+        dict: The number of requests and errors, the throughput (requests per second),
+            the latency percentiles (milliseconds) and the Cosmos DB operations per request.
+    """
+    for index in range(num_warmup_requests):
+        await request(index)
+
+    latencies: List[float] = []
+    errors = 0
+    indexes = itertools.count(num_warmup_requests)
+    last_index = num_warmup_requests + num_requests
+    operations_before = cosmos_client.operations() if cosmos_client is not None else None
+
+    async def worker() -> None:
+        nonlocal errors
+        while (index := next(indexes)) < last_index:
+            start = time.perf_counter()
+            try:
+                await request(index)
+            except Exception:
+                if not errors:
+                    logger.exception("Benchmark request failed.")
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.asarray(latencies) * 1000
+    result = {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(num_requests / elapsed, 2),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(latencies_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3)
+    }
+    if cosmos_client is not None:
+        operations = cosmos_client.operations() - operations_before
+        result["cosmos_operations_per_request"] = {
+            operation: round(count / num_requests, 3) for operation, count in sorted(operations.items())
+        }
+    return result
+
+def get_parameter_mismatches(parameters: dict, baseline_parameters: Optional[dict]) -> List[str]:
+    """
+    Returns a description of every run parameter (request count, concurrency, dataset size,
+    simulated latencies, backend settings) that differs from the baseline's: results of
+    runs with different parameters are not comparable.
+    """
+    if baseline_parameters is None:
+        return ["the baseline does not record its parameters"]
+    return [
+        f"{name} {parameters.get(name)} != baseline {baseline_parameters.get(name)}"
+        for name in sorted(set(parameters) | set(baseline_parameters))
+        if parameters.get(name) != baseline_parameters.get(name)
+    ]
+
+def compare_to_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Returns a description of every regression of the results against the baseline: a
+    p50 or p99 latency higher, or a throughput lower, than the baseline by more than
+    the tolerance (a fraction), and requests that failed.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{scenario}: {result['errors']} of {result['requests']} requests failed")
+        reference = baseline.get(scenario)
+        if reference is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{scenario}: {metric} {result[metric]} > baseline {reference[metric]}")
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: throughput_rps {result['throughput_rps']} < baseline {reference['throughput_rps']}"
+            )
+    return regressions
+
+def format_report(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> str:
+    """
+    Formats the results as a table, with the change from the baseline when there is one.
+    """
+    def change(scenario: str, metric: str) -> str:
+        reference = (baseline or {}).get(scenario, {}).get(metric)
+        if not reference:
+            return ""
+        return f" ({(results[scenario][metric] / reference - 1) * 100:+.0f}%)"
+
+    lines = [f"{'scenario':<18}{'requests':>9}{'errors':>8}{'req/s':>18}{'p50 ms':>20}{'p99 ms':>20}"]
+    for scenario, result in results.items():
+        lines.append(
+            f"{scenario:<18}{result['requests']:>9}{result['errors']:>8}"
+            f"{str(result['throughput_rps']) + change(scenario, 'throughput_rps'):>18}"
+            f"{str(result['p50_ms']) + change(scenario, 'p50_ms'):>20}"
+            f"{str(result['p99_ms']) + change(scenario, 'p99_ms'):>20}"
+        )
+        operations = result.get("cosmos_operations_per_request")
+        if operations:
+            lines.append(f"{'':<18}cosmos operations per request: {operations}")
+    return "\n".join(lines)
@@ -0,0 +1,95 @@
+"""
+The benchmark scenarios. Each scenario builds, from the benchmark
+environment, an async function sending the i-th request of the run:
+
+    retriever         - vector search of the products retriever (async path)
+    tools             - get_product_by_sku / get_product_by_id / get_sales_by_id
+    session_provider  - load (or create) a chat session and save a turn
+    ai_endpoint       - POST /ai through the FastAPI application, end to end
+"""
+import asyncio
+import random
+from typing import Awaitable, Callable, Dict
+from .environment import BenchmarkEnvironment
+
+Request = Callable[[int], Awaitable[None]]
+
+QUESTIONS = [
+    "Do you sell {adjective} {category}?",
+    "I'm looking for {adjective} {category}, what do you have?",
+    "Which {category} are {adjective}?",
+    "Tell me about {sku}.",
+    "Compare {sku} and {other_sku}.",
+    "What is in sales order {sales_order_id}?"
+]
+
+def get_question(environment: BenchmarkEnvironment, rng: random.Random) -> str:
+    """
+    Returns a random question about the synthetic catalog.
+    """
+    product, other_product = rng.sample(environment.products, 2)
+    return rng.choice(QUESTIONS).format(
+        adjective=product["description"].split(" ")[1].rstrip(","),
+        category=product["categoryName"].split(", ")[1].lower(),
+        sku=product["sku"],
+        other_sku=other_product["sku"],
+        sales_order_id=rng.choice(environment.sales_orders)["id"]
+    )
+
+def retriever_scenario(environment: BenchmarkEnvironment) -> Request:
+    rng = random.Random(1)
+    retriever = environment.runtime.products_retriever
+
+    async def request(index: int) -> None:
+        await retriever.ainvoke(get_question(environment, rng))
+    return request
+
+def tools_scenario(environment: BenchmarkEnvironment) -> Request:
+    rng = random.Random(2)
+    agent_module = environment.agent_module
+
+    async def request(index: int) -> None:
+        # The tools are synchronous, the agent runs them in the thread pool as well
+        kind = index % 3
+        if kind == 0:
+            await asyncio.to_thread(agent_module.get_product_by_sku, rng.choice(environment.products)["sku"])
+        elif kind == 1:
+            await asyncio.to_thread(agent_module.get_product_by_id, rng.choice(environment.products)["id"])
+        else:
+            await asyncio.to_thread(agent_module.get_sales_by_id, rng.choice(environment.sales_orders)["id"])
+    return request
+
+def session_provider_scenario(environment: BenchmarkEnvironment, num_sessions: int = 100) -> Request:
+    provider = environment.agent_module.chat_session_state_provider
+
+    def save_turn(index: int) -> None:
+        session = provider.load_or_create_chat_session(f"benchmark-session-{index % num_sessions}")
+        messages = [
+            {"role": "user", "content": f"Question {index}"},
+            {"role": "assistant", "content": f"Answer {index}"}
+        ]
+        session.history.extend(messages)
+        session.turn_count += 1
+        provider.save_turn(session, messages)
+
+    async def request(index: int) -> None:
+        await asyncio.to_thread(save_turn, index)
+    return request
+
+def ai_endpoint_scenario(environment: BenchmarkEnvironment, num_sessions: int = 100) -> Request:
+    rng = random.Random(3)
+
+    async def request(index: int) -> None:
+        response = await environment.http_client.post("/ai", json={
+            "session_id": f"benchmark-ai-session-{index % num_sessions}",
+            "prompt": get_question(environment, rng)
+        })
+        response.raise_for_status()
+    return request
+
+SCENARIOS: Dict[str, Callable[[BenchmarkEnvironment], Request]] = {
+    "retriever": retriever_scenario,
+    "tools": tools_scenario,
+    "session_provider": session_provider_scenario,
+    "ai_endpoint": ai_endpoint_scenario
+}
@@ -0,0 +1,2 @@
+from .change_feed_listener import ChangeFeedListener
+from .partition_key_index import PartitionKeyIndex
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Class: ChangeFeedListener
+Description:
+    The ChangeFeedListener class follows the change feed of a Cosmos DB
+    container from a background thread and passes every batch of
+    changed items to its subscribers. It is used to keep in-process
+    replicas and caches of a container (local vector index, lookup
+    indexes, cached tool results) in sync with the container.
+
+    Items are delivered at least once, in modification order within a
+    partition key. The change feed doesn't report deleted items.
+"""
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+from azure.cosmos import ContainerProxy
+
+logger = logging.getLogger(__name__)
+
+class ChangeFeedListener:
+    """
+    Polls the change feed of a container and notifies subscribers of the changed items.
+    """
+    def __init__(
+            self,
+            container: ContainerProxy,
+            poll_interval_seconds: float = 5,
+            start_from_beginning: bool = True,
+            max_item_count: int = 1000):
+        """
+        Args:
+            container: The container whose change feed is followed.
+            poll_interval_seconds: Seconds between two reads of the change feed once caught up.
+            start_from_beginning: When True the first read returns every item of the
+                container, so subscribers can build their replica from the change feed.
+            max_item_count: Maximum number of items delivered to the subscribers at once.
+        """
+        self.container = container
+        self.poll_interval_seconds = poll_interval_seconds
+        self.start_from_beginning = start_from_beginning
+        self.max_item_count = max_item_count
+        self._subscribers: List[Callable[[List[dict]], None]] = []
+        self._caught_up_subscribers: List[Callable[[], None]] = []
+        self._continuation: Optional[str] = None
+        self._caught_up = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._polls = 0
+        self._items = 0
+        self._errors = 0
+        self._last_poll: Optional[float] = None
+
+    def subscribe(self, callback: Callable[[List[dict]], None]) -> None:
+        """
+        Registers a callback called, from the listener thread, with each batch of changed items.
+        """
+        self._subscribers.append(callback)
+
+    def subscribe_caught_up(self, callback: Callable[[], None]) -> None:
+        """
+        Registers a callback called once, after the first read of the change feed has been delivered.
+        """
+        self._caught_up_subscribers.append(callback)
+
+    @property
+    def caught_up(self) -> bool:
+        """
+        True once the first read of the change feed has been delivered to the subscribers.
+        """
+        return self._caught_up.is_set()
+
+    def wait_until_caught_up(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the first read of the change feed has been delivered, returns False on timeout.
+        """
+        return self._caught_up.wait(timeout)
+
+    def start(self) -> None:
+        """
+        Starts following the change feed in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__run, name=f"change-feed-{self.container.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops following the change feed.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                self._errors += 1
+                logger.exception("Failed to read the change feed of %s, retrying at the next poll.", self.container.id)
+            self._stop.wait(self.poll_interval_seconds)
+
+    def poll(self) -> int:
+        """
+        Reads the changes since the previous poll and delivers them to the subscribers.
+
+        Returns:
+            int: The number of changed items.
+        """
+        etags: List[str] = []
+        changes = self.container.query_items_change_feed(
+            is_start_from_beginning=self._continuation is None and self.start_from_beginning,
+            continuation=self._continuation,
+            max_item_count=self.max_item_count,
+            # The ETag of each change feed page is the continuation of the next read, it is
+            # captured per response since the client is shared with other threads
+            response_hook=lambda headers, _: etags.append(headers.get("etag"))
+        )
+        # The hook is also called once with the headers of the previous request of the client
+        etags.clear()
+
+        count = 0
+        batch: List[dict] = []
+        for item in changes:
+            batch.append(item)
+            if len(batch) == self.max_item_count:
+                self.__deliver(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.__deliver(batch)
+            count += len(batch)
+
+        if etags and etags[-1] is not None:
+            self._continuation = etags[-1]
+        self._polls += 1
+        self._items += count
+        self._last_poll = time.monotonic()
+        if not self._caught_up.is_set():
+            self._caught_up.set()
+            for callback in self._caught_up_subscribers:
+                callback()
+        return count
+
+    def __deliver(self, items: List[dict]) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(items)
+            except Exception:
+                logger.exception("A change feed subscriber of %s failed.", self.container.id)
+
+    def stats(self) -> dict:
+        """
+        Returns the poll and item counters of the listener.
+        """
+        return {
+            "container": self.container.id,
+            "caught_up": self.caught_up,
+            "polls": self._polls,
+            "items": self._items,
+            "errors": self._errors,
+            "seconds_since_last_poll": None if self._last_poll is None else round(time.monotonic() - self._last_poll, 3)
+        }
@@ -0,0 +1,113 @@
+"""
+Class: PartitionKeyIndex
+Description:
+    The PartitionKeyIndex class is an in-memory secondary index of a
+    Cosmos DB container that maps the id of every item (and, optionally,
+    other unique fields such as the product sku) to the item's partition
+    key. It lets lookups by id or sku be served with a single-partition
+    point read instead of a cross-partition query.
+
+    The index only holds keys, the partition key values are shared
+    between the entries. It is kept in sync from a ChangeFeedListener
+    on the container, a lookup that misses (or finds a stale entry)
+    falls back to a query.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional
+
+class PartitionKeyIndex:
+    """
+    A thread-safe map of item ids and lookup fields to partition keys.
+    """
+    def __init__(self, partition_key_field: str, lookup_fields: Optional[List[str]] = None):
+        """
+        Args:
+            partition_key_field: The item field holding the partition key, e.g. "categoryId".
+            lookup_fields: Other unique item fields the items are looked up by, e.g. ["sku"].
+        """
+        self.partition_key_field = partition_key_field
+        self.lookup_fields = list(lookup_fields or [])
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._partition_keys: Dict[str, str] = {}
+        self._by_id: Dict[str, str] = {}
+        self._by_field: Dict[str, Dict[str, str]] = {field: {} for field in self.lookup_fields}
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    @property
+    def ready(self) -> bool:
+        """
+        True once the index holds the whole container.
+        """
+        return self._ready.is_set()
+
+    def mark_ready(self) -> None:
+        """
+        Marks the index as holding the whole container.
+        """
+        self._ready.set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._by_id)
+
+    def upsert(self, items: Iterable[dict]) -> None:
+        """
+        Adds or updates the keys of items, typically a batch of the change feed.
+        """
+        with self._lock:
+            for item in items:
+                partition_key = item.get(self.partition_key_field)
+                if item.get("id") is None or partition_key is None:
+                    continue
+                # Few distinct partition keys are shared by many items, a single string is kept for each
+                partition_key = self._partition_keys.setdefault(partition_key, partition_key)
+                self._by_id[item["id"]] = partition_key
+                for field in self.lookup_fields:
+                    value = item.get(field)
+                    if value is not None:
+                        self._by_field[field][value] = item["id"]
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """
+        Removes items from the index, e.g. when a point read found them stale.
+        """
+        with self._lock:
+            for id in ids:
+                if self._by_id.pop(id, None) is not None:
+                    self._stale += 1
+                for values in self._by_field.values():
+                    for value in [value for value, value_id in values.items() if value_id == id]:
+                        del values[value]
+
+    def locate(self, field_name: str, value: str) -> Optional[tuple[str, str]]:
+        """
+        Returns the id and partition key of the item whose field_name ("id" or
+        a lookup field) has the value, or None when the index doesn't know it.
+        """
+        with self._lock:
+            id = value if field_name == "id" else self._by_field.get(field_name, {}).get(value)
+            partition_key = self._by_id.get(id) if id is not None else None
+            if partition_key is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return id, partition_key
+
+    def stats(self) -> dict:
+        """
+        Returns the size and lookup counters of the index.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "ready": self.ready,
+                "size": len(self._by_id),
+                "partition_keys": len(self._partition_keys),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "stale": self._stale
+            }
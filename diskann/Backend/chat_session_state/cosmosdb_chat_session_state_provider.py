@@ -1,4 +1,7 @@
 import os
+import json
+import base64
+import logging
 from datetime import datetime
 from typing import List, Optional
 from azure.cosmos import CosmosClient, PartitionKey, exceptions as cosmos_exceptions
@@ -6,69 +9,349 @@ from dotenv import load_dotenv
 
 from api_models.chat_session_request import ChatSessionResponse
 from api_models.chat_session import ChatSession
+from chat_session_state.session_cache import SessionCache
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize Cosmos DB client and container globally within the module
 CONNECTION_STRING = os.environ.get("COSMOS_DB_CONNECTION_STRING")
 client = CosmosClient.from_connection_string(CONNECTION_STRING)
 db = client.get_database_client("cosmic_works_pv")
 
+# Composite indexes backing the session list, ordered by last activity and optionally scoped to a user.
+# A chat_session container created before they existed is updated on startup, see prepare_chat_session_container.
+chat_session_indexing_policy = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": "/history/*"}, {"path": "/\"_etag\"/?"}],
+    "compositeIndexes": [
+        [
+            {"path": "/last_activity", "order": "descending"},
+            {"path": "/id", "order": "descending"}
+        ],
+        [
+            {"path": "/user_id", "order": "ascending"},
+            {"path": "/last_activity", "order": "descending"},
+            {"path": "/id", "order": "descending"}
+        ]
+    ]
+}
+
 # Initialize the chat session container, create if not exists
-db.create_container_if_not_exists(id="chat_session", partition_key=PartitionKey(path="/id"))
+db.create_container_if_not_exists(
+    id="chat_session",
+    partition_key=PartitionKey(path="/id"),
+    indexing_policy=chat_session_indexing_policy
+)
 
 chat_session_container = db.get_container_client("chat_session")
 
+def apply_chat_session_indexing_policy() -> bool:
+    """
+    Replaces the indexing policy of a chat_session container that lacks the composite
+    indexes of the session list. Cosmos DB rebuilds the index online.
+
+    Returns:
+        bool: True when the policy was replaced.
+    """
+    def get_composite_indexes(policy: dict) -> List[tuple]:
+        return [
+            tuple((path["path"], path.get("order", "ascending").lower()) for path in composite_index)
+            for composite_index in policy.get("compositeIndexes", [])
+        ]
+
+    current = get_composite_indexes(chat_session_container.read().get("indexingPolicy", {}))
+    if all(index in current for index in get_composite_indexes(chat_session_indexing_policy)):
+        return False
+    db.replace_container(
+        chat_session_container,
+        partition_key=PartitionKey(path="/id"),
+        indexing_policy=chat_session_indexing_policy
+    )
+    return True
+
+def backfill_last_activity() -> int:
+    """
+    Sets last_activity on the sessions written before it existed, from their last
+    modification time (_ts), so they keep appearing in the session list.
+
+    Returns:
+        int: The number of sessions updated.
+    """
+    sessions = chat_session_container.query_items(
+        query="SELECT c.id, c._ts FROM c WHERE NOT IS_STRING(c.last_activity)",
+        enable_cross_partition_query=True
+    )
+    count = 0
+    for session in sessions:
+        # A patch leaves the rest of the session untouched should it be saved concurrently
+        chat_session_container.patch_item(
+            item=session["id"],
+            partition_key=session["id"],
+            patch_operations=[{
+                "op": "set",
+                "path": "/last_activity",
+                "value": datetime.utcfromtimestamp(session["_ts"]).isoformat()
+            }]
+        )
+        count += 1
+    return count
+
+def prepare_chat_session_container() -> None:
+    """
+    Upgrades a chat_session container written by earlier versions: applies the indexing
+    policy of the session list and backfills last_activity. A failure is logged, the
+    session list then falls back to a single-field ORDER BY (see list_sessions).
+    """
+    try:
+        if apply_chat_session_indexing_policy():
+            logger.info("Applied the session list composite indexes to the chat_session container.")
+        backfilled = backfill_last_activity()
+        if backfilled:
+            logger.info("Backfilled last_activity of %d chat sessions.", backfilled)
+    except cosmos_exceptions.CosmosHttpResponseError:
+        logger.warning("Failed to upgrade the chat_session container.", exc_info=True)
+
+prepare_chat_session_container()
+
+# Chat session storage mode:
+#   "document" - the whole session, including its history, is one item that is rewritten after every turn
+#   "turns"    - the session item only holds metadata and each turn is stored as its own item in the
+#                chat_session_turn container, partitioned on the session id, so a turn is a constant-size
+#                write and the history loads with a single-partition query
+CHAT_SESSION_STORAGE_MODE = os.environ.get("CHAT_SESSION_STORAGE_MODE", "document")
+if CHAT_SESSION_STORAGE_MODE not in ("document", "turns"):
+    raise ValueError(f"Unsupported CHAT_SESSION_STORAGE_MODE: {CHAT_SESSION_STORAGE_MODE}")
+
+# Sessions are cached in process and revalidated by ETag once the time to live has passed
+SESSION_CACHE_MAX_SIZE = int(os.environ.get("SESSION_CACHE_MAX_SIZE", "1000"))
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "5"))
+
+chat_session_turn_container = None
+if CHAT_SESSION_STORAGE_MODE == "turns":
+    db.create_container_if_not_exists(id="chat_session_turn", partition_key=PartitionKey(path="/sessionId"))
+    chat_session_turn_container = db.get_container_client("chat_session_turn")
+
 
 class CosmosDBChatSessionStateProvider:
     """
     A class to encapsulate CRUD operations for interacting with the chat session state in Cosmos DB.
     """
 
-    def __init__(self, container=chat_session_container):
+    def __init__(
+            self,
+            container=chat_session_container,
+            turn_container=chat_session_turn_container,
+            storage_mode: str = CHAT_SESSION_STORAGE_MODE,
+            session_cache: Optional[SessionCache] = None):
         self.container = container
+        self.turn_container = turn_container
+        self.storage_mode = storage_mode
+        self.session_cache = session_cache or SessionCache(
+            max_size=SESSION_CACHE_MAX_SIZE,
+            ttl_seconds=SESSION_CACHE_TTL_SECONDS
+        )
 
-    def list_sessions(self) -> List[ChatSessionResponse]:
+    def __read_session(self, session_id: str) -> Optional[dict]:
         """
-        Lists all chat sessions from the chat session container.
+        Reads a session with a point read, served from the session cache while the
+        cached entry is fresh and revalidated with an If-None-Match read once it isn't.
+        In "turns" mode the history is loaded only when the session item changed.
 
         Returns:
-            List[ChatSessionResponse]: A list of chat session responses.
+            Optional[dict]: The session data, including its history, or None if not found.
         """
+        cached = self.session_cache.get(session_id)
+        if cached is not None and self.session_cache.is_fresh(cached):
+            return self.session_cache.hit(cached)
+
+        initial_headers = {"If-None-Match": cached.etag} if cached is not None else None
         try:
-            query = "SELECT c.id, c.title FROM c"
-            sessions = list(self.container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
+            session_item = self.container.read_item(
+                item=session_id,
+                partition_key=session_id,
+                initial_headers=initial_headers
+            )
+        except cosmos_exceptions.CosmosResourceNotFoundError:
+            self.session_cache.invalidate(session_id)
+            return None
+        except cosmos_exceptions.CosmosHttpResponseError as e:
+            if e.status_code == 304 and cached is not None:
+                return self.session_cache.hit(cached, revalidated=True)
+            raise
+        # A 304 Not Modified response has no body
+        if not session_item and cached is not None:
+            return self.session_cache.hit(cached, revalidated=True)
+
+        self.session_cache.miss()
+        if self.storage_mode == "turns":
+            session_item["history"] = self.__load_history(session_item)
+        self.session_cache.put(session_id, session_item.get("_etag"), session_item)
+        return session_item
+
+    def __get_turn_item(self, session_id: str, turn_index: int, messages: List[dict]) -> dict:
+        """
+        Builds the item that stores a single turn of a chat session.
+        """
+        return {
+            "id": f"turn-{turn_index:06d}",
+            "sessionId": session_id,
+            "turn": turn_index,
+            "messages": messages,
+            "createdAt": datetime.utcnow().isoformat()
+        }
+
+    def __load_history(self, session_item: dict) -> List[dict]:
+        """
+        Loads the history of a session stored in "turns" mode with a single-partition query.
+        A history still embedded in the session item (written in "document" mode) is moved
+        to turn items first.
+        """
+        session_id = session_item["id"]
+        if session_item.get("history"):
+            self.__migrate_history(session_item)
+        turns = self.turn_container.query_items(
+            query="SELECT c.messages FROM c WHERE c.sessionId = @session_id ORDER BY c.turn",
+            parameters=[{"name": "@session_id", "value": session_id}],
+            partition_key=session_id
+        )
+        return [message for turn in turns for message in turn["messages"]]
+
+    def __migrate_history(self, session_item: dict) -> None:
+        """
+        Moves a history embedded in the session item to turn items, pairing each
+        user prompt with the assistant response that follows it.
+        """
+        history = session_item["history"]
+        turn_count = 0
+        for turn_index, start in enumerate(range(0, len(history), 2)):
+            self.turn_container.upsert_item(
+                self.__get_turn_item(session_item["id"], turn_index, history[start:start + 2])
+            )
+            turn_count = turn_index + 1
+        session_item["history"] = []
+        session_item["turn_count"] = turn_count
+        self.container.upsert_item(session_item)
+
+    def __get_session_item(self, session: ChatSession) -> dict:
+        """
+        Returns the item stored in the chat session container for a session.
+        In "turns" mode the history is stored in the turn items instead.
+        """
+        if self.storage_mode == "turns":
+            return session.model_dump(exclude={"history"})
+        return session.model_dump()
+
+    def list_sessions(
+            self,
+            page_size: int = 50,
+            continuation_token: Optional[str] = None,
+            user_id: Optional[str] = None) -> tuple[List[ChatSessionResponse], Optional[str]]:
+        """
+        Lists a page of chat sessions from the chat session container, most recently active first.
+
+        Pages are read with keyset pagination: the continuation token encodes the position of
+        the last session of the previous page, so reading a page costs the same regardless of
+        how many sessions exist.
+
+        Args:
+            page_size (int): The maximum number of sessions to return.
+            continuation_token (Optional[str]): The opaque token returned with the previous page.
+            user_id (Optional[str]): When provided, only the sessions of this user are listed.
+
+        Returns:
+            tuple[List[ChatSessionResponse], Optional[str]]: The page of chat session responses
+                and the continuation token of the next page, None when this is the last page.
+        """
+        conditions = []
+        parameters = [{"name": "@page_size", "value": page_size}]
+        if user_id is not None:
+            conditions.append("c.user_id = @user_id")
+            parameters.append({"name": "@user_id", "value": user_id})
+        if continuation_token is not None:
+            last_activity, last_id = self.__decode_continuation_token(continuation_token)
+            conditions.append("(c.last_activity < @last_activity OR (c.last_activity = @last_activity AND c.id < @last_id))")
+            parameters.append({"name": "@last_activity", "value": last_activity})
+            parameters.append({"name": "@last_id", "value": last_id})
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            query = f"""SELECT TOP @page_size c.id, c.title, c.last_activity FROM c
+                    {where_clause}
+                    ORDER BY c.last_activity DESC, c.id DESC"""
+            try:
+                sessions = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
+            except cosmos_exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 400:
+                    raise
+                # The composite index is missing (or still being built): order by last activity only,
+                # sessions active at the very same instant may then straddle two pages
+                logger.warning("The session list composite index is unavailable, ordering by last_activity only.")
+                sessions = list(self.container.query_items(
+                    query=query.replace("ORDER BY c.last_activity DESC, c.id DESC", "ORDER BY c.last_activity DESC"),
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
 
             # Convert the sessions into a list of ChatSessionResponse objects
             session_responses = [
-                ChatSessionResponse(session_id=session['id'], title=session['title'])
+                ChatSessionResponse(session_id=session['id'], title=session['title'], last_activity=session.get('last_activity'))
                 for session in sessions
             ]
-            return session_responses
+            next_continuation_token = None
+            if len(sessions) == page_size:
+                next_continuation_token = self.__encode_continuation_token(sessions[-1])
+            return session_responses, next_continuation_token
         except cosmos_exceptions.CosmosHttpResponseError as e:
             raise RuntimeError(f"Failed to retrieve sessions: {str(e)}")
 
-    def load_or_create_chat_session(self, session_id: str) -> ChatSession:
+    @staticmethod
+    def __encode_continuation_token(session: dict) -> str:
         """
-        Load an existing session from the Cosmos DB container, or create a new one if not found.
+        Encodes the position of a session in the session list as an opaque token.
+        """
+        position = json.dumps([session.get("last_activity"), session["id"]])
+        return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def __decode_continuation_token(continuation_token: str) -> tuple[str, str]:
+        """
+        Decodes a token created by __encode_continuation_token.
         """
         try:
-            # Try to read the session from Cosmos DB
-            session_item = chat_session_container.read_item(item=session_id, partition_key=session_id)
+            padding = "=" * (-len(continuation_token) % 4)
+            last_activity, last_id = json.loads(base64.urlsafe_b64decode((continuation_token + padding).encode("ascii")))
+            return last_activity, last_id
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid continuation token") from e
+
+    def load_or_create_chat_session(self, session_id: str) -> ChatSession:
+        """
+        Load an existing session from the Cosmos DB container with a (cached) point read,
+        or create a new one if not found.
+        """
+        # Try to read the session from Cosmos DB
+        session_item = self.__read_session(session_id)
+        if session_item is not None:
             return ChatSession(**session_item)
-        except Exception:
+        else:
             # If the session is not found, create a new one
+            now = datetime.utcnow()
             new_session = ChatSession(
                 id=session_id,
                 session_id=session_id,
-                title=f"{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                title=f"{now.strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                last_activity=now.isoformat(),
                 chat_history=[]
             )
-            chat_session_container.upsert_item(new_session.model_dump())
+            self.upsert_session(new_session)
             return new_session
         
     def load_session(self, session_id: str) -> Optional[dict]:
@@ -82,14 +365,10 @@ class CosmosDBChatSessionStateProvider:
             Optional[dict]: The chat session data if found, else None.
         """
         try:
-            query = f"SELECT * FROM c WHERE c.id = '{session_id}'"
-            session = list(self.container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
-
-            if session:
-                return session[0]
+            session = self.__read_session(session_id)
+
+            if session is not None:
+                return session
             else:
                 raise ValueError("Session not found")
         except cosmos_exceptions.CosmosHttpResponseError as e:
@@ -106,11 +385,64 @@ class CosmosDBChatSessionStateProvider:
             dict: The upserted session data.
         """
         try:
-            response = self.container.upsert_item(session.model_dump())
+            session.last_activity = datetime.utcnow().isoformat()
+            response = self.container.upsert_item(self.__get_session_item(session))
+            # Write through to the session cache so the next load doesn't need to go to Cosmos DB
+            self.session_cache.put(session.id, response.get("_etag"), session.model_dump())
             return response
         except cosmos_exceptions.CosmosHttpResponseError as e:
             raise RuntimeError(f"Failed to create or update session: {str(e)}")
 
+    def save_turn(self, session: ChatSession, messages: List[dict]) -> dict:
+        """
+        Persists the latest turn of a chat session. The messages must already be
+        appended to the session history and counted in session.turn_count.
+
+        In "document" mode the whole session is upserted. In "turns" mode the turn
+        is written as its own item and only the (constant-size) session item is
+        updated, so the cost of a turn doesn't grow with the length of the session.
+
+        Args:
+            session: The chat session the turn belongs to.
+            messages: The messages of the turn.
+
+        Returns:
+            dict: The upserted session data.
+        """
+        return self.save_turns(session, [messages])
+
+    def save_turns(self, session: ChatSession, turns: List[List[dict]]) -> dict:
+        """
+        Persists the latest turns of a chat session in one go. The turns must already
+        be appended to the session history and counted in session.turn_count.
+        In "turns" mode the turn items are written with transactional batches since
+        they share the session's partition key.
+
+        Args:
+            session: The chat session the turns belong to.
+            turns: The messages of each turn, oldest first.
+
+        Returns:
+            dict: The upserted session data.
+        """
+        if self.storage_mode != "turns":
+            return self.upsert_session(session)
+        first_turn_index = session.turn_count - len(turns)
+        operations = [
+            ("upsert", (self.__get_turn_item(session.id, first_turn_index + offset, messages),))
+            for offset, messages in enumerate(turns)
+        ]
+        try:
+            # A transactional batch holds at most 100 operations
+            for start in range(0, len(operations), 100):
+                self.turn_container.execute_item_batch(
+                    batch_operations=operations[start:start + 100],
+                    partition_key=session.id
+                )
+        except (cosmos_exceptions.CosmosHttpResponseError, cosmos_exceptions.CosmosBatchOperationError) as e:
+            raise RuntimeError(f"Failed to save session turns: {str(e)}")
+        return self.upsert_session(session)
+
     # def delete_session(self, session_id: str) -> None:
     #     """
     #     Deletes a chat session by session ID.
@@ -0,0 +1,120 @@
+"""
+Class: SessionCache
+Description:
+    The SessionCache class is a bounded, in-process read-through cache
+    of chat session items. Each entry remembers the ETag of the session
+    item it was built from so it can be revalidated with a conditional
+    (If-None-Match) point read once its time to live has passed.
+
+    The history messages are never modified once they are part of a
+    session, only appended to, so the cache copies the session item and
+    its history list but shares the messages: a hit costs a list copy
+    instead of a deep copy of the whole conversation.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+def copy_session_item(item: dict) -> dict:
+    """
+    Returns a copy of a session item the caller can modify: the item and its history
+    list are copied, the (immutable) history messages are shared.
+    """
+    copied = dict(item)
+    if "history" in copied:
+        copied["history"] = list(copied["history"])
+    return copied
+
+class CachedSession:
+    """
+    A cached chat session item and the ETag it was read or written with.
+    """
+    def __init__(self, etag: str, item: dict):
+        self.etag = etag
+        self.item = item
+        self.validated_at = time.monotonic()
+
+class SessionCache:
+    """
+    A thread-safe LRU cache of chat session items keyed by session id.
+    """
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 5):
+        """
+        Args:
+            max_size: Maximum number of sessions held in the cache.
+            ttl_seconds: Seconds an entry is served without revalidating its ETag.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, CachedSession] = OrderedDict()
+        self._lock = threading.Lock()
+        self._fresh_hits = 0
+        self._revalidated_hits = 0
+        self._misses = 0
+
+    def get(self, session_id: str) -> Optional[CachedSession]:
+        """
+        Returns the cache entry of the session, or None when it isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def is_fresh(self, entry: CachedSession) -> bool:
+        """
+        Returns True when the entry can be served without revalidation.
+        """
+        return time.monotonic() - entry.validated_at <= self.ttl_seconds
+
+    def hit(self, entry: CachedSession, revalidated: bool = False) -> dict:
+        """
+        Records a cache hit and returns a copy of the cached item, callers are free to modify it.
+        """
+        with self._lock:
+            if revalidated:
+                entry.validated_at = time.monotonic()
+                self._revalidated_hits += 1
+            else:
+                self._fresh_hits += 1
+            return copy_session_item(entry.item)
+
+    def put(self, session_id: str, etag: str, item: dict) -> None:
+        """
+        Caches a copy of the session item read or written with the given ETag.
+        """
+        with self._lock:
+            self._entries[session_id] = CachedSession(etag, copy_session_item(item))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def miss(self) -> None:
+        """
+        Records a cache miss.
+        """
+        with self._lock:
+            self._misses += 1
+
+    def invalidate(self, session_id: str) -> None:
+        """
+        Removes the session from the cache.
+        """
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache size and the hit and miss counters.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "fresh_hits": self._fresh_hits,
+                "revalidated_hits": self._revalidated_hits,
+                "misses": self._misses
+            }
@@ -0,0 +1,224 @@
+"""
+Class: WriteBehindSessionWriter
+Description:
+    The WriteBehindSessionWriter class persists chat session turns off
+    the request path. A turn is acknowledged as soon as it is queued and
+    a background thread flushes the queue to Cosmos DB. The turns a
+    session accumulates between two flushes are coalesced into a single
+    write. Flushes are bounded in size, retried with exponential backoff
+    and drained when the writer is closed. A session that still can't be
+    written is put back in the queue and retried after a growing delay,
+    no failure stops the background thread.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from api_models.chat_session import ChatSession
+from chat_session_state.cosmosdb_chat_session_state_provider import CosmosDBChatSessionStateProvider
+
+logger = logging.getLogger(__name__)
+
+# Longest delay before a session that failed to be written is retried
+MAX_REQUEUE_DELAY_SECONDS = 60
+
+class PendingSession:
+    """
+    The latest snapshot of a chat session and the turns not yet written to Cosmos DB.
+    """
+    def __init__(self, session: ChatSession, turns: List[List[dict]], enqueued_at: float):
+        self.session = session
+        self.turns = turns
+        self.enqueued_at = enqueued_at
+        # Number of flushes that failed to write the session and when it is retried
+        self.failures = 0
+        self.retry_at = 0.0
+
+class WriteBehindSessionWriter:
+    """
+    A background writer that coalesces and flushes chat session turns.
+    """
+    def __init__(
+            self,
+            provider: CosmosDBChatSessionStateProvider,
+            flush_interval_seconds: float = 1,
+            max_batch_sessions: int = 100,
+            max_retries: int = 5,
+            max_pending_sessions: int = 1000):
+        """
+        Args:
+            provider: The chat session state provider the turns are written with.
+            flush_interval_seconds: Seconds between two flushes of the queue.
+            max_batch_sessions: Maximum number of sessions written by a single flush.
+            max_retries: Attempts made to write a session before it is put back in the queue.
+            max_pending_sessions: Maximum number of sessions waiting to be written, enqueue
+                blocks (applying backpressure to the request) when the queue is full.
+        """
+        self.provider = provider
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_batch_sessions = max_batch_sessions
+        self.max_retries = max_retries
+        self.max_pending_sessions = max_pending_sessions
+        self._pending: OrderedDict[str, PendingSession] = OrderedDict()
+        self._in_flight: dict[str, PendingSession] = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._writes = 0
+        self._coalesced_turns = 0
+        self._failed_writes = 0
+        self._last_flush_lag_seconds = 0.0
+        self._thread = threading.Thread(target=self.__run, name="session-write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, session: ChatSession, messages: List[dict]) -> None:
+        """
+        Queues the latest turn of a chat session. The messages must already be
+        appended to the session history and counted in session.turn_count.
+        """
+        # The agent keeps appending to its session, queue a snapshot of it
+        snapshot = session.model_copy(update={"history": list(session.history)})
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The session writer is closed.")
+            while session.id not in self._pending and len(self._pending) >= self.max_pending_sessions:
+                self._condition.wait()
+            pending = self._pending.get(session.id)
+            if pending is None:
+                self._pending[session.id] = PendingSession(snapshot, [messages], time.monotonic())
+            else:
+                pending.session = snapshot
+                pending.turns.append(messages)
+                self._coalesced_turns += 1
+
+    def get_pending_session(self, session_id: str) -> Optional[ChatSession]:
+        """
+        Returns a copy of the latest queued (or being written) snapshot of a session,
+        or None when all of its turns are written. Agents rebuilt for a session use
+        it so they don't load a session that is older than the acknowledged turns.
+        """
+        with self._condition:
+            pending = self._pending.get(session_id) or self._in_flight.get(session_id)
+            if pending is None:
+                return None
+            return pending.session.model_copy(update={"history": list(pending.session.history)})
+
+    def __run(self) -> None:
+        """
+        Flushes the queue every flush interval until the writer is closed and drained.
+        """
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(self.flush_interval_seconds)
+                if self._closed and not self._pending:
+                    return
+            try:
+                written = self.flush()
+            except Exception:
+                logger.exception("Failed to flush the chat session queue.")
+                written = 0
+            # Give up on the remaining sessions when the drain makes no progress
+            if written == 0 and self._closed:
+                return
+
+    def flush(self) -> int:
+        """
+        Writes up to max_batch_sessions queued sessions, oldest first.
+        Sessions that can't be written are put back at the front of the queue
+        and skipped until their retry delay has passed (unless the writer is closing).
+
+        Returns:
+            int: The number of sessions written.
+        """
+        with self._flush_lock:
+            with self._condition:
+                now = time.monotonic()
+                for session_id in list(self._pending):
+                    if len(self._in_flight) >= self.max_batch_sessions:
+                        break
+                    if not self._closed and self._pending[session_id].retry_at > now:
+                        continue
+                    self._in_flight[session_id] = self._pending.pop(session_id)
+                batch = list(self._in_flight.items())
+
+            written = 0
+            for session_id, pending in batch:
+                succeeded = self.__write(pending)
+                with self._condition:
+                    del self._in_flight[session_id]
+                    if succeeded:
+                        written += 1
+                        self._writes += 1
+                        self._last_flush_lag_seconds = time.monotonic() - pending.enqueued_at
+                    else:
+                        self._failed_writes += 1
+                        self.__requeue(session_id, pending)
+                    self._condition.notify_all()
+            return written
+
+    def __write(self, pending: PendingSession) -> bool:
+        """
+        Writes the turns of a pending session, retrying with exponential backoff.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                self.provider.save_turns(pending.session, pending.turns)
+                return True
+            except Exception as e:
+                # Any error (HTTP, transport, timeout) is retried, it must not stop the writer thread
+                logger.warning("Failed to write chat session %s (attempt %d): %r", pending.session.id, attempt + 1, e)
+                if attempt + 1 < self.max_retries:
+                    time.sleep(min(0.1 * 2 ** attempt, 5))
+        return False
+
+    def __requeue(self, session_id: str, pending: PendingSession) -> None:
+        """
+        Puts a session that failed to be written back at the front of the queue,
+        ahead of the turns queued for the session while it was being written,
+        to be retried after an exponentially growing delay.
+        """
+        newer = self._pending.pop(session_id, None)
+        if newer is not None:
+            pending.session = newer.session
+            pending.turns.extend(newer.turns)
+        pending.failures += 1
+        delay = min(self.flush_interval_seconds * 2 ** pending.failures, MAX_REQUEUE_DELAY_SECONDS)
+        pending.retry_at = time.monotonic() + delay
+        logger.error("Chat session %s could not be written, %d turns are retried in %.0f s.",
+            session_id, len(pending.turns), delay)
+        self._pending[session_id] = pending
+        self._pending.move_to_end(session_id, last=False)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops accepting turns and waits for the queued turns to be written.
+        Turns still queued when the timeout elapses are lost and logged.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        with self._condition:
+            if self._pending:
+                logger.error("%d chat sessions were not written before shutdown: %s",
+                    len(self._pending), ", ".join(self._pending))
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth, the flush lag and the write counters.
+        """
+        now = time.monotonic()
+        with self._condition:
+            queued = list(self._pending.values()) + list(self._in_flight.values())
+            return {
+                "pending_sessions": len(queued),
+                "pending_turns": sum(len(pending.turns) for pending in queued),
+                "flush_lag_seconds": round(max((now - pending.enqueued_at for pending in queued), default=0.0), 3),
+                "last_flush_lag_seconds": round(self._last_flush_lag_seconds, 3),
+                "writes": self._writes,
+                "coalesced_turns": self._coalesced_turns,
+                "failed_writes": self._failed_writes
+            }
@@ -0,0 +1 @@
+from .context_formatter import ContextFormatter, ContextCard
\ No newline at end of file
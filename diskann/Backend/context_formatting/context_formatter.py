@@ -0,0 +1,269 @@
+"""
+Class: ContextFormatter
+Description:
+    The ContextFormatter class renders the documents returned by the
+    agent tools and the products retriever as LLM context. Each
+    document is rendered once as a compact JSON "context card" holding
+    only the allowlisted fields of its model, the card is cached with
+    its token count and every tool result is kept within a token budget.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Type, Union
+import tiktoken
+from pydantic import BaseModel
+
+class ContextCard:
+    """
+    A rendered document and the number of tokens it uses.
+    """
+    __slots__ = ("text", "tokens", "created_at")
+
+    def __init__(self, text: str, tokens: int, created_at: float):
+        self.text = text
+        self.tokens = tokens
+        self.created_at = created_at
+
+class ContextFormatter:
+    """
+    Renders model instances as compact, token-budgeted LLM context.
+    """
+    def __init__(
+            self,
+            field_allowlists: Optional[Dict[Type[BaseModel], List[str]]] = None,
+            max_tokens: int = 1500,
+            max_cards: int = 4096,
+            card_ttl_seconds: Optional[float] = 300,
+            encoding_name: str = "cl100k_base"):
+        """
+        Args:
+            field_allowlists: The document fields (by alias) rendered for each model,
+                nested models are rendered with their own allowlist. Models without
+                an allowlist are rendered with all of their fields.
+            max_tokens: Token budget of a single tool result.
+            max_cards: Maximum number of context cards held in the cache.
+            card_ttl_seconds: Seconds a cached card is reused, None to keep cards until evicted.
+            encoding_name: The tiktoken encoding used to count tokens.
+        """
+        self.field_allowlists: Dict[Type[BaseModel], List[str]] = dict(field_allowlists or {})
+        self.max_tokens = max_tokens
+        self.max_cards = max_cards
+        self.card_ttl_seconds = card_ttl_seconds
+        try:
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            # The encoding files are downloaded on first use, fall back to
+            # an approximate count when they can't be loaded (e.g. offline)
+            self.encoding = None
+        self._cards: OrderedDict[tuple, ContextCard] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._renders = 0
+        self._render_seconds = 0.0
+        self._truncated = 0
+        self._dropped = 0
+        self._results = 0
+        self._result_tokens = 0
+
+    def register(self, model: Type[BaseModel], fields: List[str]) -> None:
+        """
+        Sets the document fields (by alias) rendered for a model.
+        """
+        self.field_allowlists[model] = fields
+        self.clear()
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Returns the number of tokens of a text.
+        """
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
+
+    @staticmethod
+    def dumps(data: Any) -> str:
+        """
+        Serializes plain data as compact JSON, without indentation or spaces after separators.
+        """
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    def __get_fields(self, model: Type[BaseModel]) -> List[tuple[str, str]]:
+        """
+        Returns the (attribute, alias) pairs of the rendered fields of a model.
+        """
+        aliases = {field.alias or name: name for name, field in model.model_fields.items()}
+        allowlist = self.field_allowlists.get(model)
+        if allowlist is None:
+            return [(name, alias) for alias, name in aliases.items()]
+        return [(aliases[alias], alias) for alias in allowlist if alias in aliases]
+
+    def to_data(self, value: Any) -> Any:
+        """
+        Converts a value to JSON compatible data, models keep only their allowlisted fields.
+        """
+        if isinstance(value, BaseModel):
+            data = {}
+            for name, alias in self.__get_fields(type(value)):
+                field_value = getattr(value, name, None)
+                if field_value is not None:
+                    data[alias] = self.to_data(field_value)
+            return data
+        if isinstance(value, (list, tuple)):
+            return [self.to_data(element) for element in value]
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        return value
+
+    def __fit(self, data: dict, text: str, tokens: int, max_tokens: int) -> tuple[str, int]:
+        """
+        Shortens a document until it fits in max_tokens: the longest string values
+        are halved first, then the longest lists, and when nothing is left to shorten
+        the fields are dropped in reverse allowlist order (the first field is kept).
+        """
+        while tokens > max_tokens:
+            longest_string = max(
+                ((key, value) for key, value in data.items() if isinstance(value, str) and len(value) > 32),
+                key=lambda entry: len(entry[1]),
+                default=None
+            )
+            longest_list = max(
+                ((key, value) for key, value in data.items() if isinstance(value, list) and len(value) > 1),
+                key=lambda entry: len(entry[1]),
+                default=None
+            )
+            if longest_string is not None:
+                key, value = longest_string
+                data[key] = value[:len(value) // 2].rstrip() + "..."
+            elif longest_list is not None:
+                key, value = longest_list
+                data[key] = value[:len(value) // 2]
+            elif len(data) > 1:
+                data.pop(next(reversed(data)))
+            else:
+                break
+            text = self.dumps(data)
+            tokens = self.count_tokens(text)
+        return text, tokens
+
+    def get_card(self, model: Type[BaseModel], item: Union[BaseModel, dict]) -> ContextCard:
+        """
+        Returns the context card of a document, rendering it on first use. The document
+        is a model instance or a raw item, a raw item is only validated when its card
+        isn't cached. Cards are keyed by model, id and content hash (when the model has one).
+        """
+        if isinstance(item, dict):
+            key = (model.__name__, item.get("id"), item.get("contentHash"))
+        else:
+            key = (model.__name__, getattr(item, "id", None), getattr(item, "content_hash", None))
+        now = time.time()
+        if key[1] is not None:
+            with self._lock:
+                card = self._cards.get(key)
+                if card is not None and (self.card_ttl_seconds is None or now - card.created_at <= self.card_ttl_seconds):
+                    self._cards.move_to_end(key)
+                    self._hits += 1
+                    return card
+
+        start = time.perf_counter()
+        if isinstance(item, dict):
+            item = model(**item)
+        data = self.to_data(item)
+        text = self.dumps(data)
+        tokens = self.count_tokens(text)
+        truncated = tokens > self.max_tokens
+        if truncated:
+            text, tokens = self.__fit(data, text, tokens, self.max_tokens)
+        card = ContextCard(text, tokens, now)
+        with self._lock:
+            self._truncated += truncated
+            self._renders += 1
+            self._render_seconds += time.perf_counter() - start
+            if key[1] is not None:
+                self._cards[key] = card
+                self._cards.move_to_end(key)
+                while len(self._cards) > self.max_cards:
+                    self._cards.popitem(last=False)
+        return card
+
+    def format(self, model: Type[BaseModel], item: Union[BaseModel, dict]) -> str:
+        """
+        Renders a single document as a tool result.
+        """
+        card = self.get_card(model, item)
+        self.__record_result(card.tokens, 0)
+        return card.text
+
+    def format_many(
+            self,
+            model: Type[BaseModel],
+            items: Sequence[Union[BaseModel, dict]],
+            max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Renders documents, in order, until the token budget of the tool result
+        is used. The documents that don't fit are left out.
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        texts = []
+        used_tokens = 0
+        for item in items:
+            card = self.get_card(model, item)
+            # The first document is always returned, it was already fit in the budget
+            if texts and used_tokens + card.tokens > budget:
+                break
+            texts.append(card.text)
+            used_tokens += card.tokens
+        self.__record_result(used_tokens, len(items) - len(texts))
+        return texts
+
+    def format_error(self, message: str) -> str:
+        """
+        Renders an error as a tool result.
+        """
+        return self.dumps({"error": message})
+
+    def __record_result(self, tokens: int, dropped: int) -> None:
+        with self._lock:
+            self._results += 1
+            self._result_tokens += tokens
+            self._dropped += dropped
+
+    def invalidate(self, ids: Sequence[str]) -> None:
+        """
+        Removes the cached cards of documents, e.g. when they change.
+        """
+        ids = set(ids)
+        with self._lock:
+            for key in [key for key in self._cards if key[1] in ids]:
+                del self._cards[key]
+
+    def clear(self) -> None:
+        """
+        Removes every cached card.
+        """
+        with self._lock:
+            self._cards.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the card cache counters and the average size of the tool results.
+        """
+        with self._lock:
+            lookups = self._hits + self._renders
+            return {
+                "cards": len(self._cards),
+                "max_cards": self.max_cards,
+                "max_tokens": self.max_tokens,
+                "card_hits": self._hits,
+                "card_renders": self._renders,
+                "card_hit_rate": self._hits / lookups if lookups else 0.0,
+                "avg_render_ms": 1000 * self._render_seconds / self._renders if self._renders else 0.0,
+                "truncated_cards": self._truncated,
+                "dropped_documents": self._dropped,
+                "results": self._results,
+                "avg_result_tokens": self._result_tokens / self._results if self._results else 0.0
+            }
@@ -0,0 +1,138 @@
+"""
+Class: ChatHistoryManager
+Description:
+    The ChatHistoryManager class bounds the chat history that is sent
+    to the LLM. The most recent messages are kept in a token-counted
+    sliding window and, optionally, the messages that fall out of the
+    window are folded into a rolling summary stored on the ChatSession.
+    The full history is left untouched so it is still persisted in Cosmos DB.
+"""
+from typing import List, Optional
+import tiktoken
+from langchain_core.language_models import BaseChatModel
+
+from api_models.chat_session import ChatSession
+
+SUMMARY_INSTRUCTIONS = """
+    You maintain a running summary of a conversation between a customer and Willie,
+    the AI assistant of the Cosmic Works bike store. Extend the existing summary with
+    the new messages. Keep the product names, skus, sales order ids and customer
+    details that were mentioned, as well as the customer's goals and preferences.
+    Respond with the updated summary only, in at most 200 words.
+"""
+
+class ChatHistoryManager:
+    """
+    Builds a token-budgeted chat history for the agent prompt and keeps
+    the rolling summary of older messages up to date.
+    """
+    def __init__(
+            self,
+            max_tokens: int = 3000,
+            summarize: bool = False,
+            llm: Optional[BaseChatModel] = None,
+            encoding_name: str = "cl100k_base"):
+        """
+        Args:
+            max_tokens: Token budget of the history messages placed in the prompt.
+            summarize: When True, messages that fall out of the window are summarized.
+            llm: The chat model used to write the summary, required when summarize is True.
+            encoding_name: The tiktoken encoding used to count tokens.
+        """
+        if summarize and llm is None:
+            raise ValueError("An llm is required to summarize the chat history.")
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.llm = llm
+        try:
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            # The encoding files are downloaded on first use, fall back to
+            # an approximate count when they can't be loaded (e.g. offline)
+            self.encoding = None
+
+    def count_tokens(self, message: dict) -> int:
+        """
+        Returns the number of prompt tokens used by a chat message,
+        including the per-message overhead of the chat format.
+        """
+        if self.encoding is None:
+            return len(message["content"]) // 4 + 4
+        return len(self.encoding.encode(message["content"])) + 4
+
+    def get_window_start(self, session: ChatSession) -> int:
+        """
+        Returns the index of the oldest history message that fits in the token budget.
+        """
+        used_tokens = 0
+        window_start = len(session.history)
+        for index in range(len(session.history) - 1, -1, -1):
+            used_tokens += self.count_tokens(session.history[index])
+            if used_tokens > self.max_tokens:
+                break
+            window_start = index
+        return window_start
+
+    def get_chat_history(self, session: ChatSession) -> List[dict]:
+        """
+        Returns the chat history to place in the prompt: the rolling summary
+        (when there is one) followed by the most recent messages that fit in the budget.
+        """
+        window_start = self.get_window_start(session)
+        chat_history = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in session.history[window_start:]
+        ]
+        if self.summarize and session.summary:
+            chat_history.insert(0, {
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {session.summary}"
+            })
+        return chat_history
+
+    def __get_summary_messages(self, session: ChatSession) -> Optional[tuple[list, int]]:
+        """
+        Returns the summarization messages for the history messages that left the
+        window since the last summary and the new summarized message count,
+        or None when the summary is up to date.
+        """
+        if not self.summarize:
+            return None
+        window_start = self.get_window_start(session)
+        if window_start <= session.summarized_message_count:
+            return None
+        new_messages = "\n".join(
+            f"{msg['role']}: {msg['content']}"
+            for msg in session.history[session.summarized_message_count:window_start]
+        )
+        messages = [
+            ("system", SUMMARY_INSTRUCTIONS),
+            ("human", f"Existing summary:\n{session.summary or '(none)'}\n\nNew messages:\n{new_messages}")
+        ]
+        return messages, window_start
+
+    def update_summary(self, session: ChatSession) -> bool:
+        """
+        Folds the messages that left the window into the session summary.
+        Returns True when the summary was updated.
+        """
+        summary_messages = self.__get_summary_messages(session)
+        if summary_messages is None:
+            return False
+        messages, window_start = summary_messages
+        session.summary = self.llm.invoke(messages).content
+        session.summarized_message_count = window_start
+        return True
+
+    async def aupdate_summary(self, session: ChatSession) -> bool:
+        """
+        Asynchronously folds the messages that left the window into the session summary.
+        Returns True when the summary was updated.
+        """
+        summary_messages = self.__get_summary_messages(session)
+        if summary_messages is None:
+            return False
+        messages, window_start = summary_messages
+        session.summary = (await self.llm.ainvoke(messages)).content
+        session.summarized_message_count = window_start
+        return True
@@ -4,22 +4,39 @@ Description:
     The CosmicWorksAIAgent class creates Cosmo, an AI agent
     that can be used to answer questions about Cosmic Works
     products, customers, and sales.
+
+    The models, retriever, tools, prompt and agent executor are
+    held by the CosmicWorksAIRuntime which is built once per process
+    and shared by every session. A CosmicWorksAIAgent only holds the
+    chat session (history) of its session.
 """
 import os
-import json
+import asyncio
+import threading
 from pydantic import BaseModel
-from typing import Type, TypeVar
+from typing import AsyncIterator, List, Optional, Type, TypeVar
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from azure.cosmos import CosmosClient, ContainerProxy
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import StructuredTool
 from langchain.agents.agent_toolkits import create_retriever_tool
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from models import Product, SalesOrder
-from retrievers import AzureCosmosDBNoSQLRetriever
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from models import Product, SalesOrder, SalesOrderDetail, Tag
+from retrievers import AzureCosmosDBNoSQLRetriever, EmbeddingCache, LocalVectorIndex
+from rate_limiting import AzureOpenAIRateLimiter
+from change_feed import ChangeFeedListener, PartitionKeyIndex
+from context_formatting import ContextFormatter
+from api_models.chat_session import ChatSession
 
 from chat_session_state.cosmosdb_chat_session_state_provider import CosmosDBChatSessionStateProvider
+from chat_session_state.write_behind_session_writer import WriteBehindSessionWriter
+from cosmic_works.chat_history_manager import ChatHistoryManager
+from cosmic_works.tool_result_cache import ToolResultCache
+from cosmic_works.semantic_answer_cache import SemanticAnswerCache
 
 T = TypeVar('T', bound=BaseModel)
 
@@ -31,6 +48,59 @@ COMPLETIONS_DEPLOYMENT_NAME = "completions"
 AOAI_ENDPOINT = os.environ.get("AOAI_ENDPOINT")
 AOAI_KEY = os.environ.get("AOAI_KEY")
 AOAI_API_VERSION = "2024-06-01"
+EMBEDDING_CACHE_MAX_SIZE = int(os.environ.get("EMBEDDING_CACHE_MAX_SIZE", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.environ.get("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_QUANTIZATION = os.environ.get("EMBEDDING_CACHE_QUANTIZATION", "float32")
+# Deployment quotas used by the shared Azure OpenAI rate limiter
+COMPLETIONS_REQUESTS_PER_MINUTE = int(os.environ.get("AOAI_COMPLETIONS_RPM", "180"))
+COMPLETIONS_TOKENS_PER_MINUTE = int(os.environ.get("AOAI_COMPLETIONS_TPM", "30000"))
+EMBEDDINGS_REQUESTS_PER_MINUTE = int(os.environ.get("AOAI_EMBEDDINGS_RPM", "720"))
+EMBEDDINGS_TOKENS_PER_MINUTE = int(os.environ.get("AOAI_EMBEDDINGS_TPM", "120000"))
+# Token budget of the chat history placed in the prompt, older messages are optionally summarized
+CHAT_HISTORY_MAX_TOKENS = int(os.environ.get("CHAT_HISTORY_MAX_TOKENS", "3000"))
+CHAT_HISTORY_SUMMARIZE = os.environ.get("CHAT_HISTORY_SUMMARIZE", "false").lower() == "true"
+# Chat session persistence:
+#   "sync"         - a turn is acknowledged once it is written to Cosmos DB
+#   "write_behind" - a turn is acknowledged once it is queued and written by a background thread,
+#                    turns still queued when the process crashes are lost
+CHAT_SESSION_PERSISTENCE = os.environ.get("CHAT_SESSION_PERSISTENCE", "sync")
+if CHAT_SESSION_PERSISTENCE not in ("sync", "write_behind"):
+    raise ValueError(f"Unsupported CHAT_SESSION_PERSISTENCE: {CHAT_SESSION_PERSISTENCE}")
+CHAT_SESSION_FLUSH_INTERVAL_SECONDS = float(os.environ.get("CHAT_SESSION_FLUSH_INTERVAL_SECONDS", "1"))
+CHAT_SESSION_FLUSH_MAX_SESSIONS = int(os.environ.get("CHAT_SESSION_FLUSH_MAX_SESSIONS", "100"))
+CHAT_SESSION_FLUSH_MAX_RETRIES = int(os.environ.get("CHAT_SESSION_FLUSH_MAX_RETRIES", "5"))
+CHAT_SESSION_MAX_PENDING = int(os.environ.get("CHAT_SESSION_MAX_PENDING", "1000"))
+# In-process replica of product_v searched instead of the container: "none", "exact" or "ivf"
+LOCAL_VECTOR_INDEX = os.environ.get("LOCAL_VECTOR_INDEX", "none")
+if LOCAL_VECTOR_INDEX not in ("none", "exact", "ivf"):
+    raise ValueError(f"Unsupported LOCAL_VECTOR_INDEX: {LOCAL_VECTOR_INDEX}")
+LOCAL_VECTOR_INDEX_PROBES = int(os.environ.get("LOCAL_VECTOR_INDEX_PROBES", "8"))
+PRODUCT_CHANGE_FEED_POLL_SECONDS = float(os.environ.get("PRODUCT_CHANGE_FEED_POLL_SECONDS", "5"))
+# Opt-in in-memory index of the partition key of every product and sales order, the lookup tools use
+# single-partition point reads when the index knows the item and a cross-partition query otherwise.
+# The index is built by reading the product_v and salesOrder change feeds from the beginning on startup
+PARTITION_KEY_INDEX = os.environ.get("PARTITION_KEY_INDEX", "false").lower() == "true"
+SALES_ORDER_CHANGE_FEED_POLL_SECONDS = float(os.environ.get("SALES_ORDER_CHANGE_FEED_POLL_SECONDS", "5"))
+# Opt-in process-wide cache of the lookup tool results, invalidated from the product_v and
+# salesOrder change feeds (both are followed from the beginning on startup)
+TOOL_RESULT_CACHE = os.environ.get("TOOL_RESULT_CACHE", "false").lower() == "true"
+TOOL_RESULT_CACHE_MAX_SIZE = int(os.environ.get("TOOL_RESULT_CACHE_MAX_SIZE", "10000"))
+TOOL_RESULT_CACHE_TTL_SECONDS = float(os.environ.get("TOOL_RESULT_CACHE_TTL_SECONDS", "300"))
+# Opt-in cache of the answers to first-turn prompts, a paraphrase of a cached prompt
+# (cosine similarity of the prompt embeddings above the threshold) is answered without running the agent
+SEMANTIC_ANSWER_CACHE = os.environ.get("SEMANTIC_ANSWER_CACHE", "false").lower() == "true"
+SEMANTIC_ANSWER_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_ANSWER_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_ANSWER_CACHE_MAX_SIZE = int(os.environ.get("SEMANTIC_ANSWER_CACHE_MAX_SIZE", "1000"))
+SEMANTIC_ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("SEMANTIC_ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Product retrieval: candidates retrieved per result (re-ranked locally above 1),
+# minimum similarity score of a result and optional MMR diversity
+RETRIEVER_OVERSAMPLE_FACTOR = int(os.environ.get("RETRIEVER_OVERSAMPLE_FACTOR", "1"))
+RETRIEVER_SCORE_THRESHOLD = float(os.environ["RETRIEVER_SCORE_THRESHOLD"]) if os.environ.get("RETRIEVER_SCORE_THRESHOLD") else None
+RETRIEVER_MMR_LAMBDA = float(os.environ["RETRIEVER_MMR_LAMBDA"]) if os.environ.get("RETRIEVER_MMR_LAMBDA") else None
+# Token budget of a single tool result and number of cached document context cards
+TOOL_RESULT_MAX_TOKENS = int(os.environ.get("TOOL_RESULT_MAX_TOKENS", "1500"))
+CONTEXT_CARD_CACHE_SIZE = int(os.environ.get("CONTEXT_CARD_CACHE_SIZE", "4096"))
 
 # Initialize the Azure Cosmos DB client, database and product (with vector) container
 client = CosmosClient.from_connection_string(CONNECTION_STRING)
@@ -38,35 +108,177 @@ db = client.get_database_client("cosmic_works_pv")
 product_v_container = db.get_container_client("product_v")
 sales_order_container = db.get_container_client("salesOrder")
 
+# The aio client backs the asynchronous retriever path so vector searches don't block a worker thread
+async_client = AsyncCosmosClient.from_connection_string(CONNECTION_STRING)
+async_product_v_container = async_client.get_database_client("cosmic_works_pv").get_container_client("product_v")
+
+# Process-wide rate limiter that every Azure OpenAI request goes through,
+# the httpx clients are shared by the chat and embeddings models of all agents
+rate_limiter = AzureOpenAIRateLimiter(
+    deployment_limits = {
+        COMPLETIONS_DEPLOYMENT_NAME: (COMPLETIONS_REQUESTS_PER_MINUTE, COMPLETIONS_TOKENS_PER_MINUTE),
+        EMBEDDINGS_DEPLOYMENT_NAME: (EMBEDDINGS_REQUESTS_PER_MINUTE, EMBEDDINGS_TOKENS_PER_MINUTE)
+    }
+)
+aoai_http_client = rate_limiter.http_client()
+aoai_http_async_client = rate_limiter.http_async_client()
+
+# Process-wide cache of query embeddings shared by every agent,
+# set EMBEDDING_CACHE_PATH to persist the cache across restarts
+embedding_cache = EmbeddingCache(
+    max_size = EMBEDDING_CACHE_MAX_SIZE,
+    ttl_seconds = EMBEDDING_CACHE_TTL_SECONDS,
+    persist_path = EMBEDDING_CACHE_PATH,
+    namespace = EMBEDDINGS_DEPLOYMENT_NAME,
+    quantization = EMBEDDING_CACHE_QUANTIZATION
+)
+
+# Renders the tool and retriever results as compact JSON context cards holding only the
+# fields useful to answer questions, cards are cached per document and content hash
+context_formatter = ContextFormatter(
+    field_allowlists = {
+        Product: ["id", "categoryName", "sku", "name", "description", "price", "tags"],
+        Tag: ["name"],
+        SalesOrder: ["id", "customerId", "orderDate", "shipDate", "details"],
+        SalesOrderDetail: ["sku", "name", "price", "quantity"]
+    },
+    max_tokens = TOOL_RESULT_MAX_TOKENS,
+    max_cards = CONTEXT_CARD_CACHE_SIZE
+)
+
+# The change feeds of product_v and salesOrder keep the in-process replicas and caches
+# (local vector index, partition key indexes, tool results) in sync with the containers,
+# the listeners are started with the application
+product_v_change_feed: Optional[ChangeFeedListener] = None
+sales_order_change_feed: Optional[ChangeFeedListener] = None
+if LOCAL_VECTOR_INDEX != "none" or PARTITION_KEY_INDEX or TOOL_RESULT_CACHE or SEMANTIC_ANSWER_CACHE:
+    product_v_change_feed = ChangeFeedListener(
+        product_v_container,
+        poll_interval_seconds = PRODUCT_CHANGE_FEED_POLL_SECONDS
+    )
+    # Cached context cards of changed products are rendered again
+    product_v_change_feed.subscribe(lambda items: context_formatter.invalidate([item["id"] for item in items]))
+if PARTITION_KEY_INDEX or TOOL_RESULT_CACHE or SEMANTIC_ANSWER_CACHE:
+    sales_order_change_feed = ChangeFeedListener(
+        sales_order_container,
+        poll_interval_seconds = SALES_ORDER_CHANGE_FEED_POLL_SECONDS
+    )
+    sales_order_change_feed.subscribe(lambda items: context_formatter.invalidate([item["id"] for item in items]))
+
+# The local vector index is populated from the product_v change feed, the retriever
+# uses the Cosmos DB vector search until the index holds the whole container
+product_vector_index: Optional[LocalVectorIndex] = None
+if LOCAL_VECTOR_INDEX != "none":
+    product_vector_index = LocalVectorIndex(
+        vector_field_name = "contentVector",
+        index_type = LOCAL_VECTOR_INDEX,
+        num_probes = LOCAL_VECTOR_INDEX_PROBES
+    )
+    product_v_change_feed.subscribe(product_vector_index.upsert)
+    product_v_change_feed.subscribe_caught_up(product_vector_index.mark_ready)
+
+# The partition key indexes are built from the change feeds of product_v (partitioned
+# on /categoryId) and salesOrder (partitioned on /customerId)
+product_partition_key_index: Optional[PartitionKeyIndex] = None
+sales_order_partition_key_index: Optional[PartitionKeyIndex] = None
+if PARTITION_KEY_INDEX:
+    product_partition_key_index = PartitionKeyIndex(partition_key_field = "categoryId", lookup_fields = ["sku"])
+    product_v_change_feed.subscribe(product_partition_key_index.upsert)
+    product_v_change_feed.subscribe_caught_up(product_partition_key_index.mark_ready)
+    sales_order_partition_key_index = PartitionKeyIndex(partition_key_field = "customerId")
+    sales_order_change_feed.subscribe(sales_order_partition_key_index.upsert)
+    sales_order_change_feed.subscribe_caught_up(sales_order_partition_key_index.mark_ready)
+
+# Process-wide cache of the lookup tool results shared by every session, the results
+# that depend on a changed product or sales order are invalidated from the change feeds
+tool_result_cache: Optional[ToolResultCache] = None
+if TOOL_RESULT_CACHE:
+    tool_result_cache = ToolResultCache(
+        max_size = TOOL_RESULT_CACHE_MAX_SIZE,
+        ttl_seconds = TOOL_RESULT_CACHE_TTL_SECONDS
+    )
+    product_v_change_feed.subscribe(tool_result_cache.change_feed_subscriber(product_v_container.id, ["id", "sku"]))
+    sales_order_change_feed.subscribe(tool_result_cache.change_feed_subscriber(sales_order_container.id, ["id"]))
+
+# The cached answers may describe any product or sales order, they are all invalidated
+# when one changes (not when the embedding pipeline only writes a new content vector)
+semantic_answer_cache: Optional[SemanticAnswerCache] = None
+if SEMANTIC_ANSWER_CACHE:
+    semantic_answer_cache = SemanticAnswerCache(
+        similarity_threshold = SEMANTIC_ANSWER_CACHE_THRESHOLD,
+        max_size = SEMANTIC_ANSWER_CACHE_MAX_SIZE,
+        ttl_seconds = SEMANTIC_ANSWER_CACHE_TTL_SECONDS
+    )
+    product_v_change_feed.subscribe(
+        semantic_answer_cache.change_feed_subscriber(product_v_container.id, ["contentVector", "contentHash"])
+    )
+    sales_order_change_feed.subscribe(semantic_answer_cache.change_feed_subscriber(sales_order_container.id))
+
 # Create an instance of the CosmosDBChatSessionStateProvider class
 # This will be used to load or create Chat Sessions
 chat_session_state_provider = CosmosDBChatSessionStateProvider()
 
+# In "write_behind" mode the turns are queued and flushed to Cosmos DB in the background
+session_writer: Optional[WriteBehindSessionWriter] = None
+if CHAT_SESSION_PERSISTENCE == "write_behind":
+    session_writer = WriteBehindSessionWriter(
+        provider = chat_session_state_provider,
+        flush_interval_seconds = CHAT_SESSION_FLUSH_INTERVAL_SECONDS,
+        max_batch_sessions = CHAT_SESSION_FLUSH_MAX_SESSIONS,
+        max_retries = CHAT_SESSION_FLUSH_MAX_RETRIES,
+        max_pending_sessions = CHAT_SESSION_MAX_PENDING
+    )
 
-class CosmicWorksAIAgent:
+def save_turn(session: ChatSession, messages: List[dict]) -> None:
     """
-    The CosmicWorksAIAgent class creates Cosmo, an AI agent
-    that can be used to answer questions about Cosmic Works
-    products, customers, and sales.
+    Persists the latest turn of a chat session, or queues it in "write_behind" mode.
     """
-    def __init__(self, session_id: str):
-        self.session_id = session_id
+    if session_writer is not None:
+        session_writer.enqueue(session, messages)
+    else:
+        chat_session_state_provider.save_turn(session, messages)
+
+def load_or_create_chat_session(session_id: str) -> ChatSession:
+    """
+    Loads a chat session, preferring the snapshot queued for writing over the stored session.
+    """
+    if session_writer is not None:
+        session = session_writer.get_pending_session(session_id)
+        if session is not None:
+            return session
+    return chat_session_state_provider.load_or_create_chat_session(session_id)
 
-        self.chat_session = chat_session_state_provider.load_or_create_chat_session(session_id)
 
-        llm = AzureChatOpenAI(
+class CosmicWorksAIRuntime:
+    """
+    The CosmicWorksAIRuntime class builds the objects that are shared by
+    every chat session: the chat and embedding models, the products
+    retriever, the agent tools, the prompt, the agent executor and the
+    chat history manager.
+    These objects hold no per-session state and are safe to use from
+    concurrent requests.
+    """
+    def __init__(
+            self,
+            llm: Optional[BaseChatModel] = None,
+            embedding_model: Optional[AzureOpenAIEmbeddings] = None):
+        self.llm = llm or AzureChatOpenAI(
             temperature = 0,
             openai_api_version = AOAI_API_VERSION,
             azure_endpoint = AOAI_ENDPOINT,
             openai_api_key = AOAI_KEY,
-            azure_deployment = COMPLETIONS_DEPLOYMENT_NAME
+            azure_deployment = COMPLETIONS_DEPLOYMENT_NAME,
+            http_client = aoai_http_client,
+            http_async_client = aoai_http_async_client
         )
-        embedding_model = AzureOpenAIEmbeddings(
+        self.embedding_model = embedding_model or AzureOpenAIEmbeddings(
             openai_api_version = AOAI_API_VERSION,
             azure_endpoint = AOAI_ENDPOINT,
             openai_api_key = AOAI_KEY,
             azure_deployment = EMBEDDINGS_DEPLOYMENT_NAME,
-            chunk_size=800
+            chunk_size=800,
+            http_client = aoai_http_client,
+            http_async_client = aoai_http_async_client
         )
         agent_instructions = """           
                 Your name is "Willie". You are an AI assistant for the Cosmic Works bike store. You help people find production information for bikes and accessories. Your demeanor is friendly, playful with lots of energy.
@@ -74,10 +286,11 @@ class CosmicWorksAIAgent:
                 You are designed to answer questions about the products that Cosmic Works sells, the customers that buy them, and the sales orders that are placed by customers.
                 If you don't know the answer to a question, respond with "I don't know."      
                 Only answer questions related to Cosmic Works products, customers, and sales orders.
+                When a question needs several independent lookups, for example to compare products, call all of the tools at once.
                 If a question is not related to Cosmic Works products, customers, or sales orders,
                 respond with "I only answer questions about Cosmic Works"
             """
-        prompt = ChatPromptTemplate.from_messages(
+        self.prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", agent_instructions),
                 MessagesPlaceholder("chat_history", optional=True),
@@ -85,49 +298,233 @@ class CosmicWorksAIAgent:
                 MessagesPlaceholder("agent_scratchpad"),
             ]
         )
-        products_retriever = AzureCosmosDBNoSQLRetriever(
-            embedding_model = embedding_model,
+        self.products_retriever = AzureCosmosDBNoSQLRetriever(
+            embedding_model = self.embedding_model,
             container = product_v_container,
+            async_container = async_product_v_container,
+            embedding_cache = embedding_cache,
+            local_index = product_vector_index,
             model = Product,
             vector_field_name = "contentVector",
-            num_results = 5   
+            num_results = 5,
+            oversample_factor = RETRIEVER_OVERSAMPLE_FACTOR,
+            score_threshold = RETRIEVER_SCORE_THRESHOLD,
+            mmr_lambda = RETRIEVER_MMR_LAMBDA,
+            context_formatter = context_formatter
         )
-        tools = [create_retriever_tool(
-                    retriever = products_retriever,
+        self.tools = [create_retriever_tool(
+                    retriever = self.products_retriever,
                     name = "vector_search_products",
                     description = "Searches Cosmic Works product information for similar products based on the question. Returns the product information in JSON format."
                 ),
                 StructuredTool.from_function(get_product_by_id),
                 StructuredTool.from_function(get_product_by_sku),
                 StructuredTool.from_function(get_sales_by_id)]
-        agent = create_openai_functions_agent(llm, tools, prompt)
-        self.agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, return_intermediate_steps=True)
-    
-    def run(self, prompt: str) -> str:
+        # The tools agent lets the model request several tool calls in a single step, the
+        # asynchronous executor (used by arun and astream) runs them concurrently and
+        # returns their results to the model in the order they were requested
+        agent = create_openai_tools_agent(self.llm, self.tools, self.prompt)
+        self.agent_executor = AgentExecutor(agent=agent, tools=self.tools, verbose=True, return_intermediate_steps=True)
+        self.history_manager = ChatHistoryManager(
+            max_tokens = CHAT_HISTORY_MAX_TOKENS,
+            summarize = CHAT_HISTORY_SUMMARIZE,
+            llm = self.llm
+        )
+
+    def embed_prompt(self, prompt: str) -> List[float]:
+        """
+        Returns the embedding of a prompt, the shared embedding cache is used
+        so the products retriever reuses it for the same text.
+        """
+        embedding = embedding_cache.get(prompt)
+        if embedding is None:
+            embedding = self.embedding_model.embed_query(prompt)
+            embedding_cache.set(prompt, embedding)
+        return embedding
+
+    async def aembed_prompt(self, prompt: str) -> List[float]:
+        """
+        Returns the embedding of a prompt without blocking the event loop.
+        """
+        embedding = await embedding_cache.aget(prompt)
+        if embedding is None:
+            embedding = await self.embedding_model.aembed_query(prompt)
+            await embedding_cache.aset(prompt, embedding)
+        return embedding
+
+# The shared runtime is created on first use, guarded so concurrent first requests build it only once
+_runtime: Optional[CosmicWorksAIRuntime] = None
+_runtime_lock = threading.Lock()
+
+def get_runtime() -> CosmicWorksAIRuntime:
+    """
+    Returns the process-wide CosmicWorksAIRuntime, building it on first use.
+    """
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = CosmicWorksAIRuntime()
+    return _runtime
+
+def set_runtime(runtime: CosmicWorksAIRuntime) -> None:
+    """
+    Replaces the process-wide CosmicWorksAIRuntime, e.g. with one built on
+    other models. Agents created afterwards use the new runtime.
+    """
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
+
+
+class CosmicWorksAIAgent:
+    """
+    The CosmicWorksAIAgent class creates Cosmo, an AI agent
+    that can be used to answer questions about Cosmic Works
+    products, customers, and sales.
+
+    The agent is a lightweight per-session object that holds the
+    chat session, the heavy objects are shared through the runtime.
+    """
+    def __init__(self, session_id: str, runtime: Optional[CosmicWorksAIRuntime] = None):
+        self.session_id = session_id
+        self.chat_session = load_or_create_chat_session(session_id)
+        self.runtime = runtime or get_runtime()
+
+    @property
+    def agent_executor(self) -> AgentExecutor:
         """
-        Run the AI agent.
+        The agent executor shared through the runtime.
         """
+        return self.runtime.agent_executor
 
-        # Add the existing chat history to the prompt
-        chat_history = [{"role": msg["role"], "content": msg["content"]} for msg in self.chat_session.history]
-        full_prompt = {
+    def __get_agent_input(self, prompt: str) -> dict:
+        """
+        Builds the agent input from the prompt and the token-budgeted chat history.
+        """
+        return {
             "input": prompt,
-            "chat_history": chat_history
+            "chat_history": self.runtime.history_manager.get_chat_history(self.chat_session)
         }
 
-        # Run the AI agent with the chat history context
-        result = self.agent_executor.invoke(full_prompt)
-        response = result["output"]
+    def __add_turn(self, prompt: str, response: str) -> List[dict]:
+        """
+        Adds the interaction to the session chat history and returns its messages.
+        """
+        messages = [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": response}
+        ]
+        self.chat_session.history.extend(messages)
+        self.chat_session.turn_count += 1
+        return messages
+
+    def __use_answer_cache(self) -> bool:
+        """
+        Returns True when the prompt may be answered from the semantic answer cache,
+        only first-turn prompts are since later answers depend on the conversation.
+        """
+        return semantic_answer_cache is not None and not self.chat_session.history
+
+    def run(self, prompt: str) -> str:
+        """
+        Run the AI agent. The tool calls of a step run one after the other,
+        use arun to run them concurrently.
+        """
+        response = None
+        if self.__use_answer_cache():
+            embedding = self.runtime.embed_prompt(prompt)
+            sequence = semantic_answer_cache.sequence
+            cached_answer = semantic_answer_cache.lookup(prompt, embedding)
+            if cached_answer is not None:
+                response = cached_answer[0]
+
+        if response is None:
+            # Run the AI agent with the chat history context
+            result = self.agent_executor.invoke(self.__get_agent_input(prompt))
+            response = result["output"]
+            if self.__use_answer_cache():
+                semantic_answer_cache.add(prompt, embedding, response, sequence)
 
         # Update session chat history with new interaction
-        self.chat_session.history.append({"role": "user", "content": prompt})
-        self.chat_session.history.append({"role": "assistant", "content": response})
+        messages = self.__add_turn(prompt, response)
+        self.runtime.history_manager.update_summary(self.chat_session)
 
-        # Save updated session chat history to Cosmos DB
-        chat_session_state_provider.upsert_session(self.chat_session)
+        # Save the new turn of the session chat history to Cosmos DB
+        save_turn(self.chat_session, messages)
 
         return response
-        
+
+    async def arun(self, prompt: str) -> str:
+        """
+        Run the AI agent asynchronously.
+        """
+        response = None
+        if self.__use_answer_cache():
+            embedding = await self.runtime.aembed_prompt(prompt)
+            sequence = semantic_answer_cache.sequence
+            cached_answer = semantic_answer_cache.lookup(prompt, embedding)
+            if cached_answer is not None:
+                response = cached_answer[0]
+
+        if response is None:
+            # Run the AI agent with the chat history context
+            result = await self.agent_executor.ainvoke(self.__get_agent_input(prompt))
+            response = result["output"]
+            if self.__use_answer_cache():
+                semantic_answer_cache.add(prompt, embedding, response, sequence)
+
+        # Update session chat history with new interaction
+        messages = self.__add_turn(prompt, response)
+        await self.runtime.history_manager.aupdate_summary(self.chat_session)
+
+        # Save the new turn of the session chat history to Cosmos DB without blocking the event loop
+        await asyncio.to_thread(save_turn, self.chat_session, messages)
+
+        return response
+
+    async def astream(self, prompt: str) -> AsyncIterator[dict]:
+        """
+        Run the AI agent, yielding events as the run progresses:
+        "tool_start" and "tool_end" for each tool call, "token" for each
+        generated token of the answer and "end" with the complete answer.
+        The completed turn is saved before the "end" event is yielded.
+        A cached answer is yielded as a single "token" event.
+        """
+        response = None
+        if self.__use_answer_cache():
+            embedding = await self.runtime.aembed_prompt(prompt)
+            sequence = semantic_answer_cache.sequence
+            cached_answer = semantic_answer_cache.lookup(prompt, embedding)
+            if cached_answer is not None:
+                response = cached_answer[0]
+                yield {"event": "token", "data": {"content": response}}
+
+        if response is None:
+            response = ""
+            async for event in self.agent_executor.astream_events(self.__get_agent_input(prompt), version="v2"):
+                kind = event["event"]
+                if kind == "on_tool_start":
+                    yield {"event": "tool_start", "data": {"tool": event["name"], "input": event["data"].get("input")}}
+                elif kind == "on_tool_end":
+                    yield {"event": "tool_end", "data": {"tool": event["name"]}}
+                elif kind == "on_chat_model_stream":
+                    # Tool call chunks carry no content, only answer tokens are streamed
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield {"event": "token", "data": {"content": content}}
+                elif kind == "on_chain_end" and not event["parent_ids"]:
+                    response = event["data"]["output"]["output"]
+            if self.__use_answer_cache():
+                semantic_answer_cache.add(prompt, embedding, response, sequence)
+
+        # Update session chat history with new interaction and save it without blocking the event loop
+        messages = self.__add_turn(prompt, response)
+        await self.runtime.history_manager.aupdate_summary(self.chat_session)
+        await asyncio.to_thread(save_turn, self.chat_session, messages)
+
+        yield {"event": "end", "data": {"message": response, "session_id": self.session_id}}
+
 # Tools helper methods
 def delete_attribute_by_alias(instance: BaseModel, alias:str):
     """
@@ -139,14 +536,46 @@ def delete_attribute_by_alias(instance: BaseModel, alias:str):
             delattr(instance, model_field)
             return
 
+def read_item_by_partition_key_index(
+        container:ContainerProxy,
+        partition_key_index:PartitionKeyIndex,
+        field_name:str,
+        field_value:str) -> Optional[dict]:
+    """
+    Reads an item located by the partition key index with a single-partition point read.
+    Returns None when the index doesn't know the item or its entry is stale.
+    """
+    location = partition_key_index.locate(field_name, field_value)
+    if location is None:
+        return None
+    id, partition_key = location
+    try:
+        item = container.read_item(item=id, partition_key=partition_key)
+    except CosmosResourceNotFoundError:
+        # The change feed doesn't report deletes, the entry is dropped when the point read misses
+        partition_key_index.remove([id])
+        return None
+    # The lookup field may have changed since the item was indexed
+    if item.get(field_name) != field_value:
+        return None
+    return item
+
 def get_single_item_by_field_name(
         container:ContainerProxy,
         field_name:str,
         field_value:str,
-        model:Type[T]) -> T:
+        model:Type[T],
+        partition_key_index:Optional[PartitionKeyIndex] = None) -> T:
     """
     Retrieves a single item from the Azure Cosmos DB NoSQL database by a specific field and value.
+    When a partition key index is provided the item is point read from its partition,
+    the cross-partition query is the fallback for items the index doesn't know.
     """
+    if partition_key_index is not None:
+        item = read_item_by_partition_key_index(container, partition_key_index, field_name, field_value)
+        if item is not None:
+            return model(**item)
+
     query = f"SELECT TOP 1 * FROM itm WHERE itm.{field_name} = @value"
     parameters = [
         {
@@ -175,31 +604,51 @@ def get_single_item_by_field_name(
     # item_casted = model(**item)    
     # return item_casted
 
+def get_tool_result(
+        tool_name:str,
+        container:ContainerProxy,
+        field_name:str,
+        field_value:str,
+        model:Type[T],
+        partition_key_index:Optional[PartitionKeyIndex] = None) -> str:
+    """
+    Returns the context rendered for the item with a specific field value, served from the
+    tool result cache when it holds it. The result depends on the looked up value and on
+    the id of the item found, either changing invalidates it.
+    """
+    if tool_result_cache is not None:
+        result = tool_result_cache.get(tool_name, field_value)
+        if result is not None:
+            return result
+        sequence = tool_result_cache.sequence
+
+    item = get_single_item_by_field_name(container, field_name, field_value, model, partition_key_index)
+    if item is None:
+        result = context_formatter.format_error(f"{model.__name__} with '{field_name}' ({field_value}) not found.")
+    else:
+        result = context_formatter.format(model, item)
+
+    if tool_result_cache is not None:
+        dependencies = [(container.id, field_name, field_value)]
+        if item is not None and field_name != "id":
+            dependencies.append((container.id, "id", item.id))
+        tool_result_cache.set(tool_name, field_value, result, dependencies, sequence)
+    return result
+
 def get_product_by_id(product_id: str) -> str:
     """
     Retrieves a product by its ID.    
     """
-    item = get_single_item_by_field_name(product_v_container, "id", product_id, Product)
-    if item is None:
-        return json.dumps({"error": "Product with 'id' ({id}) not found."}, indent=4)
-    delete_attribute_by_alias(item, "contentVector")
-    return json.dumps(item, indent=4, default=str)    
+    return get_tool_result("get_product_by_id", product_v_container, "id", product_id, Product, product_partition_key_index)
 
 def get_product_by_sku(sku: str) -> str:
     """
     Retrieves a product by its sku.
     """
-    item = get_single_item_by_field_name(product_v_container, "sku", sku, Product)
-    if item is None:
-        return json.dumps({"error": "Product with 'sku' ({sku}) not found."}, indent=4)
-    delete_attribute_by_alias(item, "contentVector")
-    return json.dumps(item, indent=4, default=str)
+    return get_tool_result("get_product_by_sku", product_v_container, "sku", sku, Product, product_partition_key_index)
     
 def get_sales_by_id(sales_id: str) -> str:
     """
     Retrieves a sales order by its ID.
     """
-    item = get_single_item_by_field_name(sales_order_container, "id", sales_id, SalesOrder)
-    if item is None:
-        return json.dumps({"error": "SalesOrder with 'id' ({id}) not found."}, indent=4)
-    return json.dumps(item, indent=4, default=str)
+    return get_tool_result("get_sales_by_id", sales_order_container, "id", sales_id, SalesOrder, sales_order_partition_key_index)
@@ -0,0 +1,186 @@
+"""
+Class: SemanticAnswerCache
+Description:
+    The SemanticAnswerCache class holds the answers of the agent to
+    context-free (first turn) prompts, keyed by the prompt embedding.
+    A prompt whose embedding is similar enough to a cached prompt (a
+    paraphrase of the same question) is answered from the cache without
+    running the agent.
+
+    The prompt embeddings are held in a normalized NumPy float32 matrix
+    used as a ring buffer, a lookup is a single matrix-vector product.
+    Answers expire after a time to live and the whole cache is
+    invalidated when a product or a sales order changes. Changes that
+    only touch fields the answers don't depend on (the embedding written
+    by the embedding pipeline) are ignored.
+
+    Paraphrases that differ only by an identifier ("order 123" and
+    "order 124") have nearly identical embeddings, a cached answer is
+    only returned when both prompts mention the same identifiers
+    (tokens containing digits, e.g. skus and order ids).
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+import numpy as np
+from retrievers.vector_math import normalize, to_matrix
+
+# Cosmos DB system properties, they change on every write of an item
+SYSTEM_FIELDS = ("_rid", "_self", "_etag", "_attachments", "_ts", "_lsn")
+
+class SemanticAnswerCache:
+    """
+    A thread-safe cache of agent answers looked up by prompt similarity.
+    """
+    def __init__(
+            self,
+            similarity_threshold: float = 0.95,
+            max_size: int = 1000,
+            ttl_seconds: Optional[float] = 3600):
+        """
+        Args:
+            similarity_threshold: Minimum cosine similarity between a prompt and a
+                cached prompt for the cached answer to be returned.
+            max_size: Maximum number of answers held, the oldest answers are replaced first.
+            ttl_seconds: Seconds an answer is served, None to keep answers until replaced or invalidated.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._created_at = np.full(max_size, -np.inf)
+        self._answers: List[Optional[str]] = [None] * max_size
+        self._identifiers: List[Optional[FrozenSet[str]]] = [None] * max_size
+        self._fingerprints: Dict[tuple[str, str], bytes] = {}
+        self._next = 0
+        self._sequence = 0
+        self._hits = 0
+        self._misses = 0
+        self._hit_similarity = 0.0
+        self._invalidations = 0
+        self._skipped = 0
+        self._ignored_changes = 0
+
+    @property
+    def sequence(self) -> int:
+        """
+        The number of invalidations so far. An answer computed while the cache was
+        invalidated may be stale, add() doesn't cache it.
+        """
+        return self._sequence
+
+    @staticmethod
+    def get_identifiers(prompt: str) -> FrozenSet[str]:
+        """
+        Returns the identifiers mentioned in a prompt: the tokens containing a digit.
+        """
+        return frozenset(re.findall(r"[\w-]*\d[\w-]*", prompt.casefold()))
+
+    def __is_live(self, now: float) -> np.ndarray:
+        if self.ttl_seconds is None:
+            return np.isfinite(self._created_at)
+        return now - self._created_at <= self.ttl_seconds
+
+    def lookup(self, prompt: str, embedding: Sequence[float]) -> Optional[tuple[str, float]]:
+        """
+        Returns the cached answer of the most similar live prompt mentioning the same
+        identifiers and its similarity, or None when no such prompt reaches the
+        similarity threshold.
+        """
+        query = normalize(to_matrix(embedding))[0]
+        identifiers = self.get_identifiers(prompt)
+        with self._lock:
+            if self._matrix is not None:
+                scores = self._matrix @ query
+                scores[~self.__is_live(time.monotonic())] = -np.inf
+                candidates = np.flatnonzero(scores >= self.similarity_threshold)
+                for row in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                    if self._identifiers[row] == identifiers:
+                        self._hits += 1
+                        self._hit_similarity += float(scores[row])
+                        return self._answers[row], float(scores[row])
+            self._misses += 1
+            return None
+
+    def add(self, prompt: str, embedding: Sequence[float], answer: str, sequence: Optional[int] = None) -> None:
+        """
+        Caches the answer of a prompt, replacing the oldest answer when the cache is full.
+
+        Args:
+            sequence: The sequence read before the answer was computed, the answer
+                isn't cached when the cache was invalidated since.
+        """
+        vector = normalize(to_matrix(embedding))[0]
+        with self._lock:
+            if sequence is not None and sequence != self._sequence:
+                self._skipped += 1
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            row = self._next
+            self._matrix[row] = vector
+            self._created_at[row] = time.monotonic()
+            self._answers[row] = answer
+            self._identifiers[row] = self.get_identifiers(prompt)
+            self._next = (row + 1) % self.max_size
+
+    def invalidate(self) -> None:
+        """
+        Removes every cached answer, e.g. when the product catalog changes.
+        """
+        with self._lock:
+            self._sequence += 1
+            if np.isfinite(self._created_at).any():
+                self._invalidations += 1
+            self._created_at[:] = -np.inf
+            self._answers = [None] * self.max_size
+            self._identifiers = [None] * self.max_size
+
+    def change_feed_subscriber(self, container_name: str, ignored_fields: Sequence[str] = ()) -> Callable[[List[dict]], None]:
+        """
+        Returns a ChangeFeedListener callback that invalidates the cache when items of a
+        container change. A fingerprint of each item (without the ignored fields and the
+        system properties) is kept, changes that leave it unchanged, e.g. a new embedding
+        (["contentVector", "contentHash"]) or a redelivered item, don't invalidate the cache.
+        """
+        excluded = set(ignored_fields) | set(SYSTEM_FIELDS)
+
+        def invalidate_changed_items(items: List[dict]) -> None:
+            changed = False
+            for item in items:
+                content = {field: value for field, value in item.items() if field not in excluded}
+                fingerprint = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).digest()
+                key = (container_name, item.get("id"))
+                with self._lock:
+                    if self._fingerprints.get(key) != fingerprint:
+                        self._fingerprints[key] = fingerprint
+                        changed = True
+                    else:
+                        self._ignored_changes += 1
+            if changed:
+                self.invalidate()
+        return invalidate_changed_items
+
+    def stats(self) -> dict:
+        """
+        Returns the size and hit/miss counters of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": int(self.__is_live(time.monotonic()).sum()),
+                "max_size": self.max_size,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "avg_hit_similarity": self._hit_similarity / self._hits if self._hits else 0.0,
+                "invalidations": self._invalidations,
+                "skipped_stale_answers": self._skipped,
+                "ignored_changes": self._ignored_changes
+            }
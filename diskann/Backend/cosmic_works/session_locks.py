@@ -0,0 +1,33 @@
+"""
+Class: SessionLocks
+Description:
+    The SessionLocks class hands out one asyncio lock per chat session
+    so that the turns of a session run one after another while
+    different sessions run concurrently.
+"""
+import asyncio
+import weakref
+
+class SessionLocks:
+    """
+    A registry of asyncio locks keyed by session id.
+
+    Locks are held weakly: a lock lives only as long as a request is
+    holding or waiting on it, so idle sessions don't accumulate locks.
+    The registry must only be used from the event loop thread.
+    """
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def get(self, session_id: str) -> asyncio.Lock:
+        """
+        Returns the lock of the session, creating it when no request holds it.
+        """
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
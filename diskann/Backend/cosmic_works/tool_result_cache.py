@@ -0,0 +1,165 @@
+"""
+Class: ToolResultCache
+Description:
+    The ToolResultCache class holds the serialized results of the agent
+    lookup tools (e.g. get_product_by_sku) for every session of the
+    process. The cache is bounded by a maximum size (least recently used
+    results are evicted first) and a time to live.
+
+    Each result records the items it depends on as (container, field,
+    value) keys, e.g. ("product_v", "sku", "BK-R50B-44"). The change feed
+    subscribers of the containers invalidate exactly the results that
+    depend on a changed item, including "not found" results of an item
+    that is created later.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+Dependency = tuple[str, str, str]
+
+class ToolResultCache:
+    """
+    A thread-safe LRU/TTL bounded cache of tool results with dependency based invalidation.
+    """
+    def __init__(self, max_size: int = 10000, ttl_seconds: Optional[float] = 300):
+        """
+        Args:
+            max_size: Maximum number of tool results held in the cache.
+            ttl_seconds: Seconds a result is served, None to keep results until
+                they are evicted or invalidated.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._results: OrderedDict[tuple[str, str], tuple[float, str, List[Dependency]]] = OrderedDict()
+        self._dependents: Dict[Dependency, Set[tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._skipped = 0
+
+    @property
+    def sequence(self) -> int:
+        """
+        The number of invalidation batches so far. A result computed while an
+        invalidation happened may be stale, set() doesn't cache it.
+        """
+        return self._sequence
+
+    def get(self, tool_name: str, key: str) -> Optional[str]:
+        """
+        Returns the cached result of a tool call, or None on a miss.
+        """
+        cache_key = (tool_name, key)
+        with self._lock:
+            entry = self._results.get(cache_key)
+            if entry is not None and (self.ttl_seconds is None or time.monotonic() - entry[0] <= self.ttl_seconds):
+                self._results.move_to_end(cache_key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                self.__remove(cache_key)
+            self._misses += 1
+            return None
+
+    def set(
+            self,
+            tool_name: str,
+            key: str,
+            result: str,
+            dependencies: Iterable[Dependency],
+            sequence: Optional[int] = None) -> None:
+        """
+        Caches the result of a tool call.
+
+        Args:
+            dependencies: The (container, field, value) keys of the items the result was built from.
+            sequence: The sequence read before the result was computed, the result
+                isn't cached when an invalidation happened since.
+        """
+        cache_key = (tool_name, key)
+        dependencies = list(dependencies)
+        with self._lock:
+            if sequence is not None and sequence != self._sequence:
+                self._skipped += 1
+                return
+            if cache_key in self._results:
+                self.__remove(cache_key)
+            self._results[cache_key] = (time.monotonic(), result, dependencies)
+            for dependency in dependencies:
+                self._dependents.setdefault(dependency, set()).add(cache_key)
+            while len(self._results) > self.max_size:
+                self.__remove(next(iter(self._results)))
+                self._evictions += 1
+
+    def __remove(self, cache_key: tuple[str, str]) -> None:
+        """
+        Removes a result and its dependency entries.
+        """
+        _, _, dependencies = self._results.pop(cache_key)
+        for dependency in dependencies:
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(cache_key)
+                if not dependents:
+                    del self._dependents[dependency]
+
+    def invalidate(self, dependencies: Iterable[Dependency]) -> int:
+        """
+        Removes the results that depend on any of the keys.
+
+        Returns:
+            int: The number of results removed.
+        """
+        removed = 0
+        with self._lock:
+            self._sequence += 1
+            for dependency in dependencies:
+                for cache_key in list(self._dependents.get(dependency, ())):
+                    self.__remove(cache_key)
+                    removed += 1
+            self._invalidations += removed
+        return removed
+
+    def change_feed_subscriber(self, container_name: str, fields: List[str]) -> Callable[[List[dict]], None]:
+        """
+        Returns a ChangeFeedListener callback that invalidates the results depending
+        on the changed items of a container, by each of the fields (e.g. ["id", "sku"]).
+        """
+        def invalidate_changed_items(items: List[dict]) -> None:
+            self.invalidate(
+                (container_name, field, item[field])
+                for item in items for field in fields if item.get(field) is not None
+            )
+        return invalidate_changed_items
+
+    def clear(self) -> None:
+        """
+        Removes every cached result.
+        """
+        with self._lock:
+            self._sequence += 1
+            self._results.clear()
+            self._dependents.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the size and hit/miss counters of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._results),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "skipped_stale_results": self._skipped
+            }
@@ -2,6 +2,7 @@
 This module contains the model definitions of objects
 that are present in the Cosmic Works dataset.
 """
+from .vector import Vector
 from .tag import Tag
 from .product import Product, ProductList
 from .address import Address
@@ -2,8 +2,10 @@
 Product model
 """
 from typing import List, Optional
+import numpy as np
 from pydantic import BaseModel, Field
 from .tag import Tag
+from .vector import Vector
 
 class Product(BaseModel):
     """
@@ -18,7 +20,10 @@ class Product(BaseModel):
     description: str
     price: float
     tags: Optional[List[Tag]] = []
-    content_vector: Optional[List[float]] = Field(default=[], alias="contentVector")
+    # Held as a float32 array, serialized as a JSON list of numbers
+    content_vector: Optional[Vector] = Field(default_factory=lambda: np.empty(0, dtype=np.float32), alias="contentVector")
+    # Hash of the embedded content, used to re-embed the product only when its content changes
+    content_hash: Optional[str] = Field(default=None, alias="contentHash")
 
     class Config:
         """
@@ -29,6 +34,22 @@ class Product(BaseModel):
         """
         populate_by_name = True
 
+    def __eq__(self, other: object) -> bool:
+        """
+        Compares the products field by field, the content vector element-wise
+        (the default equality would compare the numpy arrays to an ambiguous array).
+        """
+        if not isinstance(other, Product):
+            return NotImplemented
+        fields = {name: value for name, value in self.__dict__.items() if name != "content_vector"}
+        other_fields = {name: value for name, value in other.__dict__.items() if name != "content_vector"}
+        return (
+            type(self) is type(other)
+            and fields == other_fields
+            and self.__pydantic_extra__ == other.__pydantic_extra__
+            and np.array_equal(self.content_vector, other.content_vector)
+        )
+
 class ProductList(BaseModel):
     """
     The ProductList class represents a list of products.
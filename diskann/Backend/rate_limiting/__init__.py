@@ -0,0 +1 @@
+from .azure_openai_rate_limiter import AzureOpenAIRateLimiter
\ No newline at end of file
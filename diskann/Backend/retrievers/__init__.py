@@ -1 +1,3 @@
-from .azure_cosmos_db_nosql_retriever import AzureCosmosDBNoSQLRetriever
\ No newline at end of file
+from .azure_cosmos_db_nosql_retriever import AzureCosmosDBNoSQLRetriever
+from .embedding_cache import EmbeddingCache
+from .local_vector_index import LocalVectorIndex
\ No newline at end of file
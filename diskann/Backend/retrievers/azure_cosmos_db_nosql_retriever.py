@@ -1,16 +1,22 @@
 
-import time
 import json
+import asyncio
+import numpy as np
 from langchain_core.retrievers import BaseRetriever
 from langchain_openai import AzureOpenAIEmbeddings
 from azure.cosmos import ContainerProxy
+from azure.cosmos.aio import ContainerProxy as AsyncContainerProxy
 from pydantic import BaseModel
-from typing import Type, TypeVar, List
+from typing import Type, TypeVar, List, Optional, Sequence, Union
 from langchain_core.callbacks import (
     AsyncCallbackManagerForRetrieverRun,
     CallbackManagerForRetrieverRun,
 )
 from langchain_core.documents import Document
+from .embedding_cache import EmbeddingCache
+from .local_vector_index import LocalVectorIndex
+from . import vector_math
+from context_formatting import ContextFormatter
 
 
 T = TypeVar('T', bound=BaseModel)
@@ -24,15 +30,60 @@ class AzureCosmosDBNoSQLRetriever(BaseRetriever):
     model: Type[T]
     vector_field_name: str
     num_results: int=5
+    # When True, the vector query projects the document fields directly so that
+    # no follow-up per-item lookups are needed (single round trip).
+    hydrate_in_query: bool=True
+    # Document fields to project in the vector query, defaults to every field
+    # of the model except the vector field.
+    projected_fields: Optional[List[str]]=None
+    # Optional azure.cosmos.aio container used by the asynchronous search path.
+    async_container: Optional[AsyncContainerProxy]=None
+    # Optional cache of query embeddings, a hit skips the embeddings call entirely.
+    embedding_cache: Optional[EmbeddingCache]=None
+    # Optional in-process replica of the container, searched instead of the
+    # container once it is ready (the container remains the fallback).
+    local_index: Optional[LocalVectorIndex]=None
+    # Number of candidates retrieved per returned result. Above 1, the
+    # num_results * oversample_factor candidates are re-ranked locally with
+    # the exact cosine similarity of their vectors.
+    oversample_factor: int=1
+    # Minimum similarity score of a returned result, weaker hits are dropped.
+    # Scores are cosine similarities, the container must use the cosine distance function.
+    score_threshold: Optional[float]=None
+    # When set, the results are selected among the candidates with maximal marginal
+    # relevance (1 = relevance only, 0 = diversity only).
+    mmr_lambda: Optional[float]=None
+    # Optional formatter rendering the documents as compact, cached context cards
+    # within a token budget, documents are rendered as indented JSON otherwise.
+    context_formatter: Optional[ContextFormatter]=None
 
     def __get_embeddings(self, text: str) -> List[float]:       
         """
         Returns embeddings vector for a given text.
         """
-        embedding = self.embedding_model.embed_query(text)        
-        time.sleep(0.5) # rest period to avoid rate limiting on AOAI
+        if self.embedding_cache is not None:
+            embedding = self.embedding_cache.get(text)
+            if embedding is not None:
+                return embedding
+        # Rate limiting is handled by the shared limiter attached to the embeddings client
+        embedding = self.embedding_model.embed_query(text)
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(text, embedding)
         return embedding
     
+    async def __aget_embeddings(self, text: str) -> List[float]:
+        """
+        Returns embeddings vector for a given text without blocking the event loop.
+        """
+        if self.embedding_cache is not None:
+            embedding = await self.embedding_cache.aget(text)
+            if embedding is not None:
+                return embedding
+        embedding = await self.embedding_model.aembed_query(text)
+        if self.embedding_cache is not None:
+            await self.embedding_cache.aset(text, embedding)
+        return embedding
+
     def __get_item_by_id(self, id) -> T:
         """
         Retrieves a single item from the Azure Cosmos DB NoSQL database by its ID.
@@ -47,44 +98,199 @@ class AzureCosmosDBNoSQLRetriever(BaseRetriever):
             enable_cross_partition_query=True
         ))[0]
         return self.model(**item)
-    
+
+    async def __aget_item_by_id(self, id) -> T:
+        """
+        Asynchronously retrieves a single item from the Azure Cosmos DB NoSQL database by its ID.
+        """
+        query = "SELECT * FROM itm WHERE itm.id = @id"
+        parameters = [
+            {"name": "@id", "value": id}
+        ]
+        items = [item async for item in self.async_container.query_items(
+            query=query,
+            parameters=parameters
+        )]
+        return self.model(**items[0])
+
     def __delete_attribute_by_alias(self, instance: BaseModel, alias):
         for model_field in instance.model_fields:
             field = instance.model_fields[model_field]            
             if field.alias == alias:
                 delattr(instance, model_field)
                 return
-    
+
+    def __get_projected_fields(self) -> List[str]:
+        """
+        Returns the document fields to project in the vector query.
+        """
+        if self.projected_fields is not None:
+            return self.projected_fields
+        return [
+            field.alias or name
+            for name, field in self.model.model_fields.items()
+            if (field.alias or name) != self.vector_field_name
+        ]
+
+    def __get_num_candidates(self) -> int:
+        """
+        Returns the number of candidates retrieved before the final selection.
+        """
+        return self.num_results * max(1, self.oversample_factor)
+
+    def __needs_vectors(self) -> bool:
+        """
+        Returns True when the candidate vectors are needed to re-rank or diversify the candidates.
+        """
+        return self.oversample_factor > 1 or self.mmr_lambda is not None
+
+    def __get_vector_query(self, embedding: List[float]) -> tuple[str, list]:
+        """
+        Builds the vector search query and its parameters. When hydrate_in_query is
+        enabled the projected document fields are returned with the similarity score,
+        otherwise only the item id is returned. The vector is projected as well when
+        the candidates are re-ranked locally.
+        """
+        if self.hydrate_in_query:
+            fields = self.__get_projected_fields()
+        else:
+            fields = ["id"]
+        if self.__needs_vectors():
+            fields = fields + [self.vector_field_name]
+        projection = ", ".join(f"itm.{field}" for field in fields)
+        query = f"""SELECT TOP @num_results {projection}, VectorDistance(itm.{self.vector_field_name}, @embedding) AS SimilarityScore 
+                FROM itm
+                ORDER BY VectorDistance(itm.{self.vector_field_name}, @embedding)
+                """
+        parameters = [
+            { "name": "@num_results", "value": self.__get_num_candidates() },
+            { "name": "@embedding", "value": embedding }            
+        ]
+        return query, parameters
+
+    def __select(self, embedding: List[float], items: List[dict]) -> List[dict]:
+        """
+        Selects the returned items among the candidates: the candidates are re-ranked
+        with the exact cosine similarity of their vectors (when retrieved), the ones
+        below the score threshold are dropped and num_results are kept, the most
+        similar ones or, when mmr_lambda is set, the most relevant diverse ones.
+        The SimilarityScore of the selected items is updated and their vector removed.
+        """
+        vectors = [item.pop(self.vector_field_name, None) for item in items]
+        scores = np.asarray([item["SimilarityScore"] for item in items], dtype=np.float32)
+        candidates = None
+        if items and self.__needs_vectors() and all(vector is not None and len(vector) for vector in vectors):
+            # Score every candidate at full precision with a single matrix-vector product
+            candidates = vector_math.normalize(vector_math.to_matrix(vectors))
+            scores = candidates @ vector_math.normalize(vector_math.to_matrix(embedding))[0]
+        if self.score_threshold is not None:
+            keep = np.flatnonzero(scores >= self.score_threshold)
+        else:
+            keep = np.arange(len(items))
+        if candidates is not None and self.mmr_lambda is not None:
+            selection = keep[vector_math.mmr(embedding, candidates[keep], self.num_results, self.mmr_lambda, scores[keep])]
+        elif candidates is not None:
+            selection = keep[vector_math.top_k(scores[keep], self.num_results)]
+        else:
+            # The candidates are already ordered by the vector search
+            selection = keep[:self.num_results]
+        selected = []
+        for index in selection:
+            items[index]["SimilarityScore"] = float(scores[index])
+            selected.append(items[index])
+        return selected
+
+    def __to_document(self, itm: T, similarity_score: float) -> Document:
+        """
+        Converts a model instance into a LangChain Document.
+        """
+        # Remove the vector field from the returned item so it doesn't fill the context window
+        self.__delete_attribute_by_alias(itm, self.vector_field_name)
+        return Document(page_content=json.dumps(itm, indent=4, default=str), metadata={"similarity_score": similarity_score})
+
+    def __to_documents(self, itms: Sequence[Union[T, dict]], similarity_scores: List[float]) -> List[Document]:
+        """
+        Converts the selected items (model instances or raw items) into LangChain Documents.
+        With a context formatter the documents are cached context cards and the ones
+        beyond the token budget are left out.
+        """
+        if self.context_formatter is not None:
+            return [
+                Document(page_content=text, metadata={"similarity_score": similarity_score})
+                for text, similarity_score in zip(self.context_formatter.format_many(self.model, itms), similarity_scores)
+            ]
+        return [
+            self.__to_document(itm if isinstance(itm, BaseModel) else self.model(**itm), similarity_score)
+            for itm, similarity_score in zip(itms, similarity_scores)
+        ]
+
+    def __search_local_index(self, embedding: List[float]) -> List[Document]:
+        """
+        Searches the local vector index, the documents are hydrated from the index.
+        """
+        items = []
+        for document, similarity_score in self.local_index.search(
+                embedding, self.__get_num_candidates(), with_vectors=self.__needs_vectors()):
+            document["SimilarityScore"] = similarity_score
+            items.append(document)
+        items = self.__select(embedding, items)
+        similarity_scores = [item.pop("SimilarityScore") for item in items]
+        return self.__to_documents(items, similarity_scores)
+
+    def __use_local_index(self) -> bool:
+        return self.local_index is not None and self.local_index.ready
+
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
         """
         Performs a synchronous vector search on the Azure Cosmos DB NoSQL database.
+        The local index, when configured and ready, is searched instead.
         """
         embedding = self.__get_embeddings(query)
+        if self.__use_local_index():
+            return self.__search_local_index(embedding)
+        vector_query, parameters = self.__get_vector_query(embedding)
         items = self.container.query_items(
-            query=f"""SELECT TOP @num_results itm.id, VectorDistance(itm.{self.vector_field_name}, @embedding) AS SimilarityScore 
-                    FROM itm
-                    ORDER BY VectorDistance(itm.{self.vector_field_name}, @embedding)
-                    """,
-            parameters = [
-                { "name": "@num_results", "value": self.num_results },
-                { "name": "@embedding", "value": embedding }            
-            ],
+            query=vector_query,
+            parameters=parameters,
             enable_cross_partition_query=True
         ) 
-        returned_docs = []
-        for item in items:
-            itm = self.__get_item_by_id(item["id"])  
-            # Remove the vector field from the returned item so it doesn't fill the context window
-            self.__delete_attribute_by_alias(itm, self.vector_field_name)            
-            returned_docs.append(Document(page_content=json.dumps(itm, indent=4, default=str), metadata={"similarity_score": item["SimilarityScore"]}))
-        return returned_docs
+        items = self.__select(embedding, list(items))
+        similarity_scores = [item.pop("SimilarityScore") for item in items]
+        if self.hydrate_in_query:
+            itms = items
+        else:
+            itms = [self.__get_item_by_id(item["id"]) for item in items]
+        return self.__to_documents(itms, similarity_scores)
     
     async def _aget_relevant_documents(
         self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
     ) -> List[Document]:
         """
-        Performs an asynchronous vector search on the Azure Cosmos DB NoSQL database.        
+        Performs an asynchronous vector search on the Azure Cosmos DB NoSQL database.
+        The local index, when configured and ready, is searched instead.
+        Falls back to running the synchronous search in an executor when no
+        async_container is configured.
         """
-        raise Exception(f"Asynchronous search not implemented.")
\ No newline at end of file
+        if self.async_container is None:
+            return await super()._aget_relevant_documents(query, run_manager=run_manager)
+
+        embedding = await self.__aget_embeddings(query)
+        if self.__use_local_index():
+            # The local search takes well under a millisecond, it runs on the event loop
+            return self.__search_local_index(embedding)
+        vector_query, parameters = self.__get_vector_query(embedding)
+        # The aio client runs the query cross-partition when no partition key is provided
+        items = [item async for item in self.async_container.query_items(
+            query=vector_query,
+            parameters=parameters
+        )]
+        items = self.__select(embedding, items)
+        similarity_scores = [item.pop("SimilarityScore") for item in items]
+        if self.hydrate_in_query:
+            itms = items
+        else:
+            # Hydrate the items concurrently rather than one round trip after another
+            itms = await asyncio.gather(*[self.__aget_item_by_id(item["id"]) for item in items])
+        return self.__to_documents(itms, similarity_scores)
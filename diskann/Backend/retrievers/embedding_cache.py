@@ -0,0 +1,216 @@
+"""
+Class: EmbeddingCache
+Description:
+    The EmbeddingCache class caches query embeddings in process with
+    LRU and TTL eviction, keyed by normalized text. An optional SQLite
+    backed tier keeps embeddings across service restarts, the async
+    callers (aget / aset) read and write it in a worker thread so the
+    event loop never waits for the disk.
+
+    Embeddings are stored compactly: as float32 arrays (4 bytes per
+    dimension) or, optionally, quantized to float16 or int8.
+"""
+import asyncio
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from models.vector import to_list, to_vector, to_float16, quantize_int8, dequantize_int8
+
+class EmbeddingCache:
+    """
+    A thread-safe LRU/TTL cache of embedding vectors keyed by normalized text.
+    """
+    def __init__(
+            self,
+            max_size: int = 1024,
+            ttl_seconds: Optional[float] = 86400,
+            persist_path: Optional[str] = None,
+            namespace: str = "",
+            quantization: str = "float32"):
+        """
+        Args:
+            max_size: Maximum number of embeddings held in memory.
+            ttl_seconds: Time to live of an entry, None disables expiry.
+            persist_path: Optional SQLite file path for the persistent tier.
+            namespace: Prefix added to every key, typically the embeddings deployment
+                name so vectors from different models never mix.
+            quantization: Storage format of the embeddings, "float32" (exact),
+                "float16" or "int8" (approximate, half and a quarter of the memory).
+        """
+        if quantization not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.quantization = quantization
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db = None
+        # The SQLite connection is shared by threads, its own lock keeps the in-memory tier from waiting on disk
+        self._db_lock = threading.Lock()
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalizes text so trivially different phrasings share a cache entry:
+        case folded, whitespace collapsed and trailing punctuation removed.
+        """
+        return " ".join(text.casefold().split()).rstrip("?!. ")
+
+    def _key(self, text: str) -> str:
+        # Quantized embeddings are keyed apart so a persisted entry is always read back in its own format
+        if self.quantization != "float32":
+            return f"{self.namespace}:{self.quantization}:{self.normalize(text)}"
+        return f"{self.namespace}:{self.normalize(text)}"
+
+    def _encode(self, embedding: List[float]) -> bytes:
+        """
+        Encodes an embedding in the storage format of the cache.
+        """
+        if self.quantization == "int8":
+            values, scale = quantize_int8(embedding)
+            return struct.pack("<f", scale) + values.tobytes()
+        if self.quantization == "float16":
+            return to_float16(embedding).astype("<f2").tobytes()
+        return to_vector(embedding).astype("<f4").tobytes()
+
+    def _decode(self, data: bytes) -> List[float]:
+        """
+        Decodes a stored embedding to the list of floats expected by the callers.
+        """
+        if self.quantization == "int8":
+            scale = struct.unpack("<f", data[:4])[0]
+            return to_list(dequantize_int8(np.frombuffer(data[4:], dtype=np.int8), scale))
+        if self.quantization == "float16":
+            return to_list(np.frombuffer(data, dtype="<f2"))
+        return to_list(np.frombuffer(data, dtype="<f4"))
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _get_in_memory(self, key: str) -> Optional[bytes]:
+        """
+        Returns the in-memory entry of a key, a miss is counted only without a persistent tier.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_expired(entry[0]):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            if self._db is None:
+                self._misses += 1
+            return None
+
+    def _get_persistent(self, key: str) -> Optional[bytes]:
+        """
+        Returns the persistent entry of a key and promotes it to memory (blocking).
+        """
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT embedding, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        with self._lock:
+            if row is not None and not self._is_expired(row[1]):
+                data = row[0]
+                self._put(key, data, row[1])
+                self._hits += 1
+                return data
+            self._misses += 1
+            return None
+
+    def _set_persistent(self, key: str, data: bytes, created_at: float) -> None:
+        """
+        Writes an entry to the persistent tier (blocking).
+        """
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                (key, data, created_at)
+            )
+            self._db.commit()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """
+        Returns the cached embedding for the text, or None on a miss.
+        """
+        key = self._key(text)
+        data = self._get_in_memory(key)
+        if data is None and self._db is not None:
+            data = self._get_persistent(key)
+        return self._decode(data) if data is not None else None
+
+    async def aget(self, text: str) -> Optional[List[float]]:
+        """
+        Returns the cached embedding for the text, or None on a miss, reading
+        the persistent tier in a worker thread.
+        """
+        key = self._key(text)
+        data = self._get_in_memory(key)
+        if data is None and self._db is not None:
+            data = await asyncio.to_thread(self._get_persistent, key)
+        return self._decode(data) if data is not None else None
+
+    def set(self, text: str, embedding: List[float]) -> None:
+        """
+        Adds an embedding to the cache, evicting the least recently used entry when full.
+        """
+        key = self._key(text)
+        created_at = time.time()
+        data = self._encode(embedding)
+        with self._lock:
+            self._put(key, data, created_at)
+        if self._db is not None:
+            self._set_persistent(key, data, created_at)
+
+    async def aset(self, text: str, embedding: List[float]) -> None:
+        """
+        Adds an embedding to the cache, writing the persistent tier in a worker thread.
+        """
+        key = self._key(text)
+        created_at = time.time()
+        data = self._encode(embedding)
+        with self._lock:
+            self._put(key, data, created_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_persistent, key, data, created_at)
+
+    def _put(self, key: str, data: bytes, created_at: float) -> None:
+        self._entries[key] = (created_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache hit, miss and eviction counters.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "persistent": self._db is not None,
+                "quantization": self.quantization,
+                "bytes": sum(len(data) for _, data in self._entries.values())
+            }
@@ -0,0 +1,232 @@
+"""
+Class: LocalVectorIndex
+Description:
+    The LocalVectorIndex class is an in-process replica of a vector
+    container (e.g. product_v). The vectors are held in a normalized
+    NumPy float32 matrix and the documents (without their vector) in a
+    list, so a vector search is a single matrix-vector product and needs
+    no network round trip.
+
+    Two index types are supported:
+      "exact" - every vector is scored (exact cosine top-k)
+      "ivf"   - the vectors are clustered with k-means and a search only
+                scores the vectors of the clusters closest to the query
+                (approximate, for larger catalogs)
+
+    The index is kept in sync incrementally through upsert/remove, e.g.
+    from a ChangeFeedListener on the vector container.
+"""
+import logging
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+from . import vector_math
+
+logger = logging.getLogger(__name__)
+
+class LocalVectorIndex:
+    """
+    A thread-safe in-memory vector index of documents keyed by id.
+    """
+    def __init__(
+            self,
+            vector_field_name: str = "contentVector",
+            index_type: str = "exact",
+            num_clusters: Optional[int] = None,
+            num_probes: int = 8,
+            min_train_size: int = 1000):
+        """
+        Args:
+            vector_field_name: The document field holding the vector.
+            index_type: "exact" or "ivf".
+            num_clusters: Number of IVF clusters, defaults to the square root of the number of vectors.
+            num_probes: Number of IVF clusters scored by a search.
+            min_train_size: Number of vectors from which the IVF clusters are trained,
+                smaller indexes are searched exactly.
+        """
+        if index_type not in ("exact", "ivf"):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        self.vector_field_name = vector_field_name
+        self.index_type = index_type
+        self.num_clusters = num_clusters
+        self.num_probes = num_probes
+        self.min_train_size = min_train_size
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._documents: List[dict] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._searches = 0
+
+    @property
+    def ready(self) -> bool:
+        """
+        True once the index holds the whole container, searches should fall back to the service until then.
+        """
+        return self._ready.is_set()
+
+    def mark_ready(self) -> None:
+        """
+        Marks the index as holding the whole container.
+        """
+        self._ready.set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size
+
+    def __ensure_capacity(self, dimensions: int, capacity: int) -> None:
+        """
+        Grows the matrix (doubling its capacity) so it holds at least capacity rows.
+        """
+        if self._matrix is None:
+            self._matrix = np.zeros((max(capacity, 64), dimensions), dtype=np.float32)
+            self._assignments = np.zeros(self._matrix.shape[0], dtype=np.int32)
+            return
+        if self._matrix.shape[1] != dimensions:
+            raise ValueError(f"Expected vectors of {self._matrix.shape[1]} dimensions, got {dimensions}.")
+        if capacity > self._matrix.shape[0]:
+            new_capacity = max(capacity, self._matrix.shape[0] * 2)
+            matrix = np.zeros((new_capacity, dimensions), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            assignments = np.zeros(new_capacity, dtype=np.int32)
+            assignments[:self._size] = self._assignments[:self._size]
+            self._matrix, self._assignments = matrix, assignments
+
+    def upsert(self, items: Iterable[dict]) -> int:
+        """
+        Adds or replaces documents in the index. Documents without a vector are removed.
+
+        Returns:
+            int: The number of documents indexed.
+        """
+        indexed = 0
+        with self._lock:
+            for item in items:
+                vector = item.get(self.vector_field_name)
+                if vector is None or len(vector) == 0:
+                    self.__remove(item["id"])
+                    continue
+                vector = vector_math.normalize(vector_math.to_matrix(vector))[0]
+                document = {key: value for key, value in item.items() if key != self.vector_field_name}
+                row = self._rows.get(item["id"])
+                if row is None:
+                    self.__ensure_capacity(vector.shape[0], self._size + 1)
+                    row = self._size
+                    self._size += 1
+                    self._ids.append(item["id"])
+                    self._documents.append(document)
+                    self._rows[item["id"]] = row
+                else:
+                    self._documents[row] = document
+                self._matrix[row] = vector
+                if self._centroids is not None:
+                    self._assignments[row] = int(np.argmax(self._centroids @ vector))
+                indexed += 1
+            if self.index_type == "ivf" and self._size >= self.min_train_size and self._size >= 2 * self._trained_size:
+                self.__train()
+        return indexed
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """
+        Removes documents from the index.
+        """
+        with self._lock:
+            for id in ids:
+                self.__remove(id)
+
+    def __remove(self, id: str) -> None:
+        """
+        Removes a document by moving the last row into its place.
+        """
+        row = self._rows.pop(id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._assignments[row] = self._assignments[last]
+            self._ids[row] = self._ids[last]
+            self._documents[row] = self._documents[last]
+            self._rows[self._ids[row]] = row
+        self._ids.pop()
+        self._documents.pop()
+        self._size = last
+
+    def __train(self) -> None:
+        """
+        Clusters the vectors for IVF search. The centroids are trained on a
+        sample of the vectors and every vector is then assigned to a cluster.
+        """
+        num_clusters = self.num_clusters or max(1, int(math.sqrt(self._size)))
+        matrix = self._matrix[:self._size]
+        sample_size = min(self._size, num_clusters * 256)
+        sample = matrix[np.random.default_rng(0).choice(self._size, sample_size, replace=False)]
+        self._centroids, _ = vector_math.kmeans(sample, num_clusters)
+        self._assignments[:self._size] = np.argmax(matrix @ self._centroids.T, axis=1)
+        self._trained_size = self._size
+        logger.info("Trained %d IVF clusters over %d vectors.", self._centroids.shape[0], self._size)
+
+    def search(
+            self,
+            embedding: Union[np.ndarray, Sequence[float]],
+            k: int,
+            with_vectors: bool = False) -> List[tuple[dict, float]]:
+        """
+        Returns the k documents most similar to the embedding with their cosine similarity,
+        most similar first. The documents are copies and don't include the vector unless
+        with_vectors is True.
+        """
+        query = vector_math.normalize(vector_math.to_matrix(embedding))[0]
+        with self._lock:
+            self._searches += 1
+            if self._size == 0:
+                return []
+            matrix = self._matrix[:self._size]
+            if self._centroids is not None:
+                # Score only the vectors of the clusters closest to the query
+                probes = vector_math.top_k(self._centroids @ query, self.num_probes)
+                candidates = np.flatnonzero(np.isin(self._assignments[:self._size], probes))
+                scores = matrix[candidates] @ query
+                best = vector_math.top_k(scores, k)
+                rows, similarities = candidates[best], scores[best]
+            else:
+                rows, similarities = vector_math.cosine_top_k(query, matrix, k)
+            results = []
+            for row, similarity in zip(rows, similarities):
+                document = dict(self._documents[row])
+                if with_vectors:
+                    document[self.vector_field_name] = matrix[row].copy()
+                results.append((document, float(similarity)))
+            return results
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the normalized vectors of the indexed documents among the ids.
+        """
+        with self._lock:
+            return {
+                id: self._matrix[self._rows[id]].copy()
+                for id in ids if id in self._rows
+            }
+
+    def stats(self) -> dict:
+        """
+        Returns the size, type and memory use of the index.
+        """
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "size": self._size,
+                "index_type": self.index_type,
+                "clusters": 0 if self._centroids is None else int(self._centroids.shape[0]),
+                "dimensions": 0 if self._matrix is None else int(self._matrix.shape[1]),
+                "matrix_bytes": 0 if self._matrix is None else int(self._matrix.nbytes),
+                "searches": self._searches
+            }
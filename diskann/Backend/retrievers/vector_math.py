@@ -0,0 +1,96 @@
+"""
+Vectorized helpers used by the local vector search: normalization,
+cosine top-k, k-means clustering and maximal marginal
+relevance over float32 matrices.
+"""
+from typing import Optional, Sequence, Union
+import numpy as np
+
+def to_matrix(vectors: Union[np.ndarray, Sequence[Sequence[float]]]) -> np.ndarray:
+    """
+    Returns the vectors as a contiguous two-dimensional float32 matrix.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return np.ascontiguousarray(matrix)
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    Returns the rows of the matrix scaled to unit length, zero rows are left as is.
+    """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores, highest first.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # argpartition finds the top k in linear time, only those k are sorted
+    indices = np.argpartition(-scores, k - 1)[:k]
+    return indices[np.argsort(-scores[indices], kind="stable")]
+
+def cosine_top_k(query: np.ndarray, matrix: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the row indices and cosine similarities of the k rows of a
+    normalized matrix most similar to the query, most similar first.
+    """
+    scores = matrix @ normalize(to_matrix(query))[0]
+    indices = top_k(scores, k)
+    return indices, scores[indices]
+
+def kmeans(matrix: np.ndarray, num_clusters: int, iterations: int = 10, seed: Optional[int] = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Clusters the rows of a normalized matrix with spherical k-means.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The normalized centroids and the cluster of each row.
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, matrix.shape[0])
+    centroids = matrix[rng.choice(matrix.shape[0], num_clusters, replace=False)].copy()
+    assignments = np.zeros(matrix.shape[0], dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+        for cluster in range(num_clusters):
+            members = matrix[assignments == cluster]
+            # An empty cluster keeps its previous centroid
+            if members.shape[0]:
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids, assignments
+
+def mmr(
+        query: np.ndarray,
+        candidates: np.ndarray,
+        k: int,
+        lambda_mult: float = 0.5,
+        scores: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Selects k of the normalized candidate vectors with maximal marginal relevance:
+    each step picks the candidate that best trades similarity to the query
+    (weighted by lambda_mult) against similarity to the candidates already picked.
+
+    Returns:
+        np.ndarray: The indices of the selected candidates, in selection order.
+    """
+    if scores is None:
+        scores = candidates @ normalize(to_matrix(query))[0]
+    k = min(k, candidates.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # Pairwise similarity of the candidates, computed once
+    similarities = candidates @ candidates.T
+    selected = [int(np.argmax(scores))]
+    max_similarity = similarities[selected[0]].copy()
+    for _ in range(k - 1):
+        marginal = lambda_mult * scores - (1 - lambda_mult) * max_similarity
+        marginal[selected] = -np.inf
+        best = int(np.argmax(marginal))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarities[best])
+    return np.asarray(selected, dtype=np.int64)
@@ -0,0 +1,5 @@
+"""
+This module contains the bulk loader used to load
+the Cosmic Works dataset into Azure Cosmos DB.
+"""
+from .bulk_loader import BulkLoader, BulkLoadStats
@@ -0,0 +1,112 @@
+"""
+Loads the Cosmic Works dataset (products, customers and sales orders)
+into the cosmic_works_pv database.
+
+Usage (from the Labs folder):
+    python -m bulk_loading --dataset cosmic-works-small --max-concurrency 32
+"""
+import argparse
+import json
+import logging
+import os
+import re
+from typing import Any, Iterable, Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient, PartitionKey
+from dotenv import load_dotenv
+from models import Product, Customer, SalesOrder
+from .bulk_loader import BulkLoader
+
+DATASET_BASE_URL = "https://cosmosdbcosmicworks.blob.core.windows.net"
+# Whitespace, the opening bracket and the commas between the elements of a JSON array
+ARRAY_SEPARATOR_PATTERN = re.compile(r"[\s,\[]*")
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Yields the elements of a JSON array read as a stream of text chunks,
+    so a dataset file is never held in memory as a whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+        while True:
+            position = ARRAY_SEPARATOR_PATTERN.match(buffer, position).end()
+            if position == len(buffer) or buffer[position] == "]":
+                break
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The element continues in the next chunk
+                break
+            yield element
+        buffer = buffer[position:]
+    if buffer.strip() not in ("", "]"):
+        raise ValueError(f"Invalid JSON array, unexpected trailing data: {buffer[:100]}")
+
+def iter_dataset(dataset: str, file_name: str) -> Iterator[dict]:
+    """
+    Streams the documents of a dataset file.
+    """
+    with requests.get(f"{DATASET_BASE_URL}/{dataset}/{file_name}", stream=True) as response:
+        response.raise_for_status()
+        # The files may start with a byte order mark
+        response.encoding = "utf-8-sig"
+        yield from iter_json_array(response.iter_content(chunk_size=1 << 16, decode_unicode=True))
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk load the Cosmic Works dataset into Azure Cosmos DB for NoSQL.")
+    parser.add_argument("--dataset", default="cosmic-works-small", help="Name of the Cosmic Works dataset to load.")
+    parser.add_argument("--database", default="cosmic_works_pv", help="Name of the database to load the dataset into.")
+    parser.add_argument("--containers", nargs="+", default=["product", "customer", "salesOrder"],
+        choices=["product", "customer", "salesOrder"], help="Containers to load.")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="Number of concurrent writers.")
+    parser.add_argument("--max-retries", type=int, default=10, help="Attempts made to write a throttled batch.")
+    parser.add_argument("--progress-interval", type=float, default=5, help="Seconds between two progress reports.")
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    load_dotenv()
+
+    # Size the HTTP connection pool to the number of concurrent writers
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=args.max_concurrency, pool_maxsize=args.max_concurrency)
+    session.mount("https://", adapter)
+    client = CosmosClient.from_connection_string(
+        os.environ.get("COSMOS_DB_CONNECTION_STRING"),
+        transport=RequestsTransport(session=session, session_owner=False)
+    )
+    db = client.create_database_if_not_exists(id=args.database)
+
+    def load(container_name: str, partition_key_path: str, items) -> None:
+        container = db.create_container_if_not_exists(id=container_name, partition_key=PartitionKey(path=partition_key_path))
+        loader = BulkLoader(
+            container,
+            partition_key_path,
+            max_concurrency=args.max_concurrency,
+            max_retries=args.max_retries,
+            progress_interval_seconds=args.progress_interval
+        )
+        stats = loader.load(items)
+        logging.info("%s loaded: %s", container_name, stats.to_dict())
+
+    # The dataset files are streamed, the customer and sales order documents are stored
+    # in the same file which is streamed once per container
+    if "product" in args.containers:
+        load("product", "/categoryId", (Product(**data) for data in iter_dataset(args.dataset, "product.json")))
+    if "customer" in args.containers:
+        load("customer", "/customerId", (
+            Customer(**data) for data in iter_dataset(args.dataset, "customer.json") if data["type"] == "customer"
+        ))
+    if "salesOrder" in args.containers:
+        load("salesOrder", "/customerId", (
+            SalesOrder(**data) for data in iter_dataset(args.dataset, "customer.json") if data["type"] == "salesOrder"
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Class: BulkLoader
+Description:
+    The BulkLoader class writes a stream of items to an Azure Cosmos DB
+    for NoSQL container. Items are grouped by partition key value into
+    transactional batches that are written concurrently by a pool of
+    threads, with a bounded number of batches in flight. Requests that
+    are throttled (HTTP 429) are retried after the delay requested by
+    the service. Progress and throughput are reported while loading.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from azure.cosmos import ContainerProxy, exceptions as cosmos_exceptions
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# A transactional batch holds at most 100 operations and 2 MB of payload
+MAX_BATCH_OPERATIONS = 100
+MAX_BATCH_BYTES = 1_800_000
+
+class BulkLoadStats:
+    """
+    The counters of a bulk load.
+    """
+    def __init__(self):
+        self.items = 0
+        self.failed_items = 0
+        self.batches = 0
+        self.throttled_requests = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "failed_items": self.failed_items,
+            "batches": self.batches,
+            "throttled_requests": self.throttled_requests,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "items_per_second": round(self.items_per_second, 1)
+        }
+
+class BulkLoader:
+    """
+    Loads items into a Cosmos DB container with concurrent, partition key grouped writes.
+    """
+    def __init__(
+            self,
+            container: ContainerProxy,
+            partition_key_path: str,
+            max_concurrency: int = 16,
+            max_in_flight: Optional[int] = None,
+            max_buffered_items: int = 10000,
+            max_retries: int = 10,
+            progress_interval_seconds: float = 5,
+            progress_callback: Optional[Callable[[BulkLoadStats], None]] = None,
+            written_callback: Optional[Callable[[List[dict]], None]] = None):
+        """
+        Args:
+            container: The container the items are upserted into.
+            partition_key_path: The partition key path of the container, e.g. "/customerId".
+            max_concurrency: Number of threads writing batches.
+            max_in_flight: Maximum number of batches submitted and not yet written,
+                defaults to twice max_concurrency.
+            max_buffered_items: Items buffered while grouping by partition key before
+                the buffered groups are written.
+            max_retries: Attempts made to write a throttled batch before it is counted as failed.
+            progress_interval_seconds: Seconds between two progress reports.
+            progress_callback: Called with the stats at every progress report,
+                defaults to logging the progress.
+            written_callback: Called, from a writer thread, with the items of every batch
+                once they are written, e.g. to checkpoint a resumable load.
+        """
+        self.container = container
+        self.partition_key_field = partition_key_path.lstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_in_flight = max_in_flight or max_concurrency * 2
+        self.max_buffered_items = max_buffered_items
+        self.max_retries = max_retries
+        self.progress_interval_seconds = progress_interval_seconds
+        self.progress_callback = progress_callback or self.__log_progress
+        self.written_callback = written_callback
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def to_item(item: Union[BaseModel, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Serializes a model to a JSON compatible dictionary in a single pass
+        (datetimes become ISO 8601 strings), dictionaries are passed through.
+        """
+        if isinstance(item, BaseModel):
+            return item.model_dump(by_alias=True, mode="json")
+        return item
+
+    @staticmethod
+    def to_sized_item(item: Union[BaseModel, Dict[str, Any]]) -> tuple[Dict[str, Any], int]:
+        """
+        Returns the JSON compatible dictionary of an item and the size of its JSON document.
+        A model is serialized once, by pydantic, and its JSON parsed back: cheaper than
+        dumping it to a dictionary and serializing that again to measure it.
+        """
+        if isinstance(item, BaseModel):
+            data = item.model_dump_json(by_alias=True)
+            # The SDK escapes non-ASCII characters, measure those documents as it sends them
+            if data.isascii():
+                return json.loads(data), len(data)
+            item = json.loads(data)
+        return item, len(json.dumps(item))
+
+    def load(self, items: Iterable[Union[BaseModel, Dict[str, Any]]]) -> BulkLoadStats:
+        """
+        Upserts the items into the container and returns the load statistics.
+        The items are consumed as a stream, so they can be read lazily from a larger-than-memory source.
+        """
+        stats = BulkLoadStats()
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        groups: Dict[Any, List[dict]] = {}
+        group_bytes: Dict[Any, int] = {}
+        buffered_items = 0
+        next_progress = time.monotonic() + self.progress_interval_seconds
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="bulk-loader") as executor:
+            def submit(partition_key: Any, batch: List[dict]) -> None:
+                # Wait for a free slot so the number of batches in memory stays bounded
+                in_flight.acquire()
+                future = executor.submit(self.__write_batch, partition_key, batch, stats)
+                future.add_done_callback(lambda future: self.__batch_done(future, partition_key, batch, stats, in_flight))
+
+            for item in items:
+                item, size = self.to_sized_item(item)
+                partition_key = item[self.partition_key_field]
+                group = groups.setdefault(partition_key, [])
+                if group and group_bytes[partition_key] + size > MAX_BATCH_BYTES:
+                    buffered_items -= len(group)
+                    submit(partition_key, groups.pop(partition_key))
+                    group = groups.setdefault(partition_key, [])
+                    group_bytes[partition_key] = 0
+                group.append(item)
+                group_bytes[partition_key] = group_bytes.get(partition_key, 0) + size
+                buffered_items += 1
+
+                if len(group) == MAX_BATCH_OPERATIONS:
+                    buffered_items -= len(group)
+                    del group_bytes[partition_key]
+                    submit(partition_key, groups.pop(partition_key))
+                elif buffered_items >= self.max_buffered_items:
+                    # Write the groups that are still filling up, largest first
+                    for key in sorted(groups, key=lambda key: len(groups[key]), reverse=True):
+                        submit(key, groups.pop(key))
+                        del group_bytes[key]
+                    buffered_items = 0
+
+                if time.monotonic() >= next_progress:
+                    self.progress_callback(stats)
+                    next_progress = time.monotonic() + self.progress_interval_seconds
+
+            for key in list(groups):
+                submit(key, groups.pop(key))
+
+        stats.finished = time.monotonic()
+        self.progress_callback(stats)
+        return stats
+
+    def __batch_done(
+            self,
+            future: Future,
+            partition_key: Any,
+            batch: List[dict],
+            stats: BulkLoadStats,
+            in_flight: threading.BoundedSemaphore) -> None:
+        """
+        Frees the in-flight slot of a written batch and counts its items as failed when
+        the write raised an error __write_batch doesn't handle (e.g. a transport error,
+        a timeout or an error of the written callback).
+        """
+        in_flight.release()
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed to write %d items with partition key %s: %r", len(batch), partition_key, error)
+            with self._stats_lock:
+                stats.failed_items += len(batch)
+
+    def __write_batch(self, partition_key: Any, batch: List[dict], stats: BulkLoadStats) -> None:
+        """
+        Writes the items sharing a partition key value, retrying when the request is throttled.
+        """
+        for attempt in range(self.max_retries):
+            try:
+                if len(batch) == 1:
+                    self.container.upsert_item(batch[0])
+                else:
+                    self.container.execute_item_batch(
+                        batch_operations=[("upsert", (item,)) for item in batch],
+                        partition_key=partition_key
+                    )
+            except cosmos_exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 429 or attempt + 1 == self.max_retries:
+                    logger.error("Failed to write %d items with partition key %s: %s", len(batch), partition_key, e)
+                    break
+                with self._stats_lock:
+                    stats.throttled_requests += 1
+                time.sleep(self.__get_retry_after(e, attempt))
+            except cosmos_exceptions.CosmosBatchOperationError as e:
+                logger.error("Failed to write %d items with partition key %s: %s", len(batch), partition_key, e)
+                break
+            else:
+                # The items count as written once the callback (e.g. a checkpoint) has recorded them
+                if self.written_callback is not None:
+                    self.written_callback(batch)
+                with self._stats_lock:
+                    stats.items += len(batch)
+                    stats.batches += 1
+                return
+        with self._stats_lock:
+            stats.failed_items += len(batch)
+
+    @staticmethod
+    def __get_retry_after(error: cosmos_exceptions.CosmosHttpResponseError, attempt: int) -> float:
+        """
+        Returns the delay requested by the service, or an exponential backoff when there is none.
+        """
+        headers = error.headers or {}
+        try:
+            return float(headers["x-ms-retry-after-ms"]) / 1000
+        except (KeyError, TypeError, ValueError):
+            return min(0.1 * 2 ** attempt, 10)
+
+    def __log_progress(self, stats: BulkLoadStats) -> None:
+        logger.info(
+            "%s: %d items written (%d failed) in %.1f s, %.0f items/s, %d throttled requests",
+            self.container.id, stats.items, stats.failed_items, stats.elapsed_seconds,
+            stats.items_per_second, stats.throttled_requests
+        )
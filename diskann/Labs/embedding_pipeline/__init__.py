@@ -0,0 +1,6 @@
+"""
+This module contains the pipeline that vectorizes the
+Cosmic Works products into the product_v container.
+"""
+from .embedding_pipeline import EmbeddingPipeline, get_embedding_text, get_content_hash, get_checkpoint_path
+from .change_feed_embedder import ChangeFeedEmbedder
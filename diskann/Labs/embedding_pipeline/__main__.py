@@ -0,0 +1,129 @@
+"""
+Vectorizes the products of the product container into the product_v
+container, which is created with the vector embedding and indexing
+policies of lab 3 when it doesn't exist.
+
+Usage (from the Labs folder):
+    python -m embedding_pipeline --batch-size 64 --max-concurrency 4
+
+With --watch the products are instead kept in sync continuously: the change
+feed of the product container is followed and only the products whose
+content hash changed are embedded again.
+    python -m embedding_pipeline --watch --continuation change_feed_continuation.txt
+"""
+import argparse
+import logging
+import os
+from azure.cosmos import CosmosClient, PartitionKey
+from dotenv import load_dotenv
+from openai import AzureOpenAI
+from models import Product
+from rate_limiting import AzureOpenAIRateLimiter
+from .embedding_pipeline import EmbeddingPipeline, get_checkpoint_path
+from .change_feed_embedder import ChangeFeedEmbedder
+
+AOAI_API_VERSION = "2024-06-01"
+
+vector_embedding_policy = {
+    "vectorEmbeddings": [
+        {
+            "path": "/contentVector",
+            "dataType": "float32",
+            "distanceFunction": "cosine",
+            "dimensions": 1536
+        }
+    ]
+}
+
+indexing_policy = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": "/\"_etag\"/?"}, {"path": "/contentVector/*"}],
+    "vectorIndexes": [{"path": "/contentVector", "type": "diskANN"}]
+}
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Embed the Cosmic Works products into the product_v container.")
+    parser.add_argument("--database", default="cosmic_works_pv", help="Name of the database.")
+    parser.add_argument("--source", default="product", help="Container the products are read from.")
+    parser.add_argument("--target", default="product_v", help="Container the embedded products are written to.")
+    parser.add_argument("--deployment", default="embeddings", help="Embeddings model deployment.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Inputs sent in a single embeddings request.")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Concurrent embeddings requests.")
+    parser.add_argument("--rpm", type=int, default=720, help="Requests per minute quota of the deployment.")
+    parser.add_argument("--tpm", type=int, default=120000, help="Tokens per minute quota of the deployment.")
+    parser.add_argument(
+        "--checkpoint",
+        help="Checkpoint file used to resume a run, by default embedding_checkpoint_<target container resource id>.txt."
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and embed every product.")
+    parser.add_argument("--watch", action="store_true", help="Follow the change feed and re-embed the changed products.")
+    parser.add_argument("--continuation", default="change_feed_continuation.txt", help="File the change feed continuation is saved to.")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Seconds between two reads of the change feed.")
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    load_dotenv()
+
+    client = CosmosClient.from_connection_string(os.environ.get("COSMOS_DB_CONNECTION_STRING"))
+    db = client.create_database_if_not_exists(id=args.database)
+    source_container = db.get_container_client(args.source)
+    target_container = db.create_container_if_not_exists(
+        id=args.target,
+        partition_key=PartitionKey(path="/categoryId"),
+        indexing_policy=indexing_policy,
+        vector_embedding_policy=vector_embedding_policy
+    )
+
+    # Every embeddings request goes through the rate limiter so concurrent requests stay within the quota
+    rate_limiter = AzureOpenAIRateLimiter(deployment_limits={args.deployment: (args.rpm, args.tpm)})
+    ai_client = AzureOpenAI(
+        azure_endpoint=os.environ.get("AOAI_ENDPOINT"),
+        api_version=AOAI_API_VERSION,
+        api_key=os.environ.get("AOAI_KEY"),
+        http_client=rate_limiter.http_client(),
+        max_retries=5
+    )
+
+    if args.watch:
+        pipeline = EmbeddingPipeline(
+            ai_client,
+            args.deployment,
+            target_container,
+            batch_size=args.batch_size,
+            max_concurrency=args.max_concurrency
+        )
+        embedder = ChangeFeedEmbedder(
+            pipeline,
+            source_container,
+            target_container,
+            continuation_path=args.continuation,
+            poll_interval_seconds=args.poll_interval
+        )
+        embedder.run()
+        return
+
+    # The default checkpoint is keyed by the target container, a recreated container is embedded again
+    checkpoint_path = args.checkpoint or get_checkpoint_path(target_container)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    pipeline = EmbeddingPipeline(
+        ai_client,
+        args.deployment,
+        target_container,
+        batch_size=args.batch_size,
+        max_concurrency=args.max_concurrency,
+        checkpoint_path=checkpoint_path
+    )
+    products = (
+        Product(**item)
+        for item in source_container.query_items(query="SELECT * FROM c", enable_cross_partition_query=True)
+    )
+    pipeline.run(products)
+
+if __name__ == "__main__":
+    main()
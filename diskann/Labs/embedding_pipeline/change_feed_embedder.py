@@ -0,0 +1,156 @@
+"""
+Class: ChangeFeedEmbedder
+Description:
+    The ChangeFeedEmbedder class keeps the product_v container in sync
+    with the product container. It reads the change feed of the product
+    container and compares the content hash of every changed product with
+    the hash stored alongside its vector in product_v. Only the products
+    whose embedded content changed are embedded and written again, so the
+    embedding cost of a catalog update is proportional to what changed.
+    The change feed continuation is saved to a file after every pass so
+    a restarted embedder picks up where it stopped.
+"""
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from azure.cosmos import ContainerProxy
+from models import Product
+from .embedding_pipeline import EmbeddingPipeline, get_content_hash
+
+logger = logging.getLogger(__name__)
+
+class ChangeFeedEmbedder:
+    """
+    Re-embeds the products changed in the product container into the product_v container.
+    """
+    def __init__(
+            self,
+            pipeline: EmbeddingPipeline,
+            source_container: ContainerProxy,
+            target_container: ContainerProxy,
+            continuation_path: Optional[str] = None,
+            poll_interval_seconds: float = 5,
+            chunk_size: int = 1000):
+        """
+        Args:
+            pipeline: The pipeline the changed products are embedded and written with,
+                it must not use a checkpoint since products are embedded again on change.
+            source_container: The product container whose change feed is read.
+            target_container: The product_v container holding the vectors and content hashes.
+            continuation_path: File the change feed continuation is saved to, None reads the
+                change feed from the beginning on every start.
+            poll_interval_seconds: Seconds between two reads of the change feed.
+            chunk_size: Number of changed products compared and embedded together.
+        """
+        if pipeline.checkpoint_path is not None:
+            raise ValueError("The change feed embedder requires a pipeline without checkpoint.")
+        self.pipeline = pipeline
+        self.source_container = source_container
+        self.target_container = target_container
+        self.continuation_path = continuation_path
+        self.poll_interval_seconds = poll_interval_seconds
+        self.chunk_size = chunk_size
+        self.changes_read = 0
+        self.reembedded = 0
+        self.unchanged = 0
+
+    def __load_continuation(self) -> Optional[str]:
+        if self.continuation_path is None or not os.path.exists(self.continuation_path):
+            return None
+        with open(self.continuation_path, "r", encoding="utf-8") as continuation:
+            return continuation.read().strip() or None
+
+    def __save_continuation(self, continuation: Optional[str]) -> None:
+        if self.continuation_path is None or continuation is None:
+            return
+        with open(self.continuation_path, "w", encoding="utf-8") as file:
+            file.write(continuation)
+
+    def __get_stored_hashes(self, products: List[Product]) -> Dict[str, Optional[str]]:
+        """
+        Returns the content hashes stored in the target container for the products,
+        with one single-partition query per category.
+        """
+        ids_by_category: Dict[str, List[str]] = {}
+        for product in products:
+            ids_by_category.setdefault(product.category_id, []).append(product.id)
+        stored_hashes = {}
+        for category_id, ids in ids_by_category.items():
+            items = self.target_container.query_items(
+                query="SELECT c.id, c.contentHash FROM c WHERE ARRAY_CONTAINS(@ids, c.id)",
+                parameters=[{"name": "@ids", "value": ids}],
+                partition_key=category_id
+            )
+            for item in items:
+                stored_hashes[item["id"]] = item.get("contentHash")
+        return stored_hashes
+
+    def __process_chunk(self, items: List[dict]) -> None:
+        """
+        Embeds the products of a chunk of changes whose content hash changed.
+        """
+        products = [Product(**item) for item in items]
+        stored_hashes = self.__get_stored_hashes(products)
+        changed = [
+            product for product in products
+            if stored_hashes.get(product.id) != get_content_hash(self.pipeline.get_text(product))
+        ]
+        self.unchanged += len(products) - len(changed)
+        if changed:
+            stats = self.pipeline.run(changed)
+            self.reembedded += stats.items
+
+    def process_changes(self) -> int:
+        """
+        Reads the changes since the last saved continuation and re-embeds the changed products.
+        The continuation is saved once the changes are processed, so changes are processed
+        at least once.
+
+        Returns:
+            int: The number of changes read.
+        """
+        continuation = self.__load_continuation()
+        # The ETag of every change feed page, the other requests of the client must not be mistaken for it
+        etags: List[str] = []
+        changes = self.source_container.query_items_change_feed(
+            is_start_from_beginning=continuation is None,
+            continuation=continuation,
+            max_item_count=self.chunk_size,
+            response_hook=lambda headers, _: etags.append(headers.get("etag"))
+        )
+        # The hook is also called once with the headers of the previous request of the client
+        etags.clear()
+        count = 0
+        chunk: List[dict] = []
+        for item in changes:
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                self.__process_chunk(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            self.__process_chunk(chunk)
+            count += len(chunk)
+        # The ETag of the last change feed page is the continuation of the next read
+        if etags:
+            self.__save_continuation(etags[-1])
+        self.changes_read += count
+        if count:
+            logger.info(
+                "Processed %d product changes: %d re-embedded, %d unchanged in total.",
+                count, self.reembedded, self.unchanged
+            )
+        return count
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        """
+        Processes the change feed every poll interval until the stop event is set.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.process_changes()
+            except Exception:
+                logger.exception("Failed to process the product change feed, retrying at the next poll.")
+            stop_event.wait(self.poll_interval_seconds)
@@ -0,0 +1,179 @@
+"""
+Class: EmbeddingPipeline
+Description:
+    The EmbeddingPipeline class vectorizes Cosmic Works products and
+    writes them, with their embedding, to the product_v container.
+    Products are sent to the Azure OpenAI embeddings API in batches
+    (the API accepts an array of inputs), a bounded number of batches
+    are embedded concurrently and the embedded products are written
+    with the BulkLoader. The ids of the written products are appended
+    to a checkpoint file so an interrupted run resumes where it stopped.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Set
+from azure.cosmos import ContainerProxy
+from openai import AzureOpenAI
+from models import Product
+from models.vector import to_vector
+from bulk_loading import BulkLoader, BulkLoadStats
+
+logger = logging.getLogger(__name__)
+
+def get_embedding_text(product: Product) -> str:
+    """
+    Returns the text that is embedded for a product: its JSON representation
+    without the vector and the content hash.
+    """
+    return product.model_dump_json(by_alias=True, exclude={"content_vector", "content_hash"})
+
+def get_content_hash(text: str) -> str:
+    """
+    Returns the hash of an embedded text, stored with the vector so unchanged
+    products can be recognized without embedding them again.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_checkpoint_path(container: ContainerProxy, prefix: str = "embedding_checkpoint") -> str:
+    """
+    Returns the checkpoint file of a container, keyed by the resource id the container
+    was created with: a recreated container gets a new checkpoint instead of skipping
+    the products written to the previous one.
+    """
+    resource_id = container.read()["_rid"]
+    return f"{prefix}_{resource_id.translate(str.maketrans('+/', '-_')).rstrip('=')}.txt"
+
+class EmbeddingPipeline:
+    """
+    A batched, concurrent and resumable product embedding pipeline.
+    """
+    def __init__(
+            self,
+            ai_client: AzureOpenAI,
+            deployment_name: str,
+            container: ContainerProxy,
+            partition_key_path: str = "/categoryId",
+            batch_size: int = 64,
+            max_batch_tokens: int = 60000,
+            max_concurrency: int = 4,
+            checkpoint_path: Optional[str] = None,
+            get_text: Callable[[Product], str] = get_embedding_text):
+        """
+        Args:
+            ai_client: The Azure OpenAI client, route it through the AzureOpenAIRateLimiter
+                (http_client=rate_limiter.http_client()) to stay within the deployment quota.
+            deployment_name: The embeddings model deployment.
+            container: The container the embedded products are written to.
+            partition_key_path: The partition key path of the container.
+            batch_size: Maximum number of inputs sent in a single embeddings request.
+            max_batch_tokens: Approximate maximum number of tokens sent in a single embeddings request.
+            max_concurrency: Number of embeddings requests running concurrently.
+            checkpoint_path: File recording the ids of the written products, products
+                already recorded are skipped. None disables checkpointing.
+            get_text: Returns the text embedded for a product.
+        """
+        self.ai_client = ai_client
+        self.deployment_name = deployment_name
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.checkpoint_path = checkpoint_path
+        self.get_text = get_text
+        self.loader = BulkLoader(
+            container,
+            partition_key_path,
+            # Embedded products are large, keep the grouping buffer small
+            max_buffered_items=1000,
+            written_callback=self.__checkpoint
+        )
+        self._checkpoint_lock = threading.Lock()
+        self.embedding_requests = 0
+        self.skipped = 0
+
+    def load_checkpoint(self) -> Set[str]:
+        """
+        Returns the ids of the products written by previous runs.
+        """
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, "r", encoding="utf-8") as checkpoint:
+            return {line.strip() for line in checkpoint if line.strip()}
+
+    def __checkpoint(self, items: List[dict]) -> None:
+        """
+        Records the ids of written products in the checkpoint file.
+        """
+        if self.checkpoint_path is None:
+            return
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+                checkpoint.write("".join(f"{item['id']}\n" for item in items))
+
+    def __get_batches(self, products: Iterable[Product], completed: Set[str]) -> Iterator[List[Product]]:
+        """
+        Groups the products that still need an embedding into batches bounded
+        by the number of inputs and the approximate number of tokens.
+        """
+        batch: List[Product] = []
+        batch_tokens = 0
+        for product in products:
+            if product.id in completed:
+                self.skipped += 1
+                continue
+            # Approximation of four characters per token
+            tokens = len(self.get_text(product)) // 4 + 1
+            if batch and (len(batch) == self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(product)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def __embed_batch(self, batch: List[Product]) -> List[Product]:
+        """
+        Embeds a batch of products with a single embeddings request.
+        """
+        texts = [self.get_text(product) for product in batch]
+        response = self.ai_client.embeddings.create(input=texts, model=self.deployment_name)
+        # The embeddings are returned with the index of their input
+        for data in response.data:
+            batch[data.index].content_vector = to_vector(data.embedding)
+            batch[data.index].content_hash = get_content_hash(texts[data.index])
+        return batch
+
+    def __embed(self, products: Iterable[Product], completed: Set[str]) -> Iterator[Product]:
+        """
+        Embeds the products with up to max_concurrency concurrent requests,
+        yielding the embedded products as their batches complete.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embedding") as executor:
+            in_flight: List[Future] = []
+            for batch in self.__get_batches(products, completed):
+                # Bound the number of submitted batches so products are read as they are embedded
+                if len(in_flight) >= self.max_concurrency * 2:
+                    yield from in_flight.pop(0).result()
+                in_flight.append(executor.submit(self.__embed_batch, batch))
+                self.embedding_requests += 1
+            for future in in_flight:
+                yield from future.result()
+
+    def run(self, products: Iterable[Product]) -> BulkLoadStats:
+        """
+        Embeds the products and writes them to the container, skipping the
+        products recorded in the checkpoint. Returns the write statistics.
+        """
+        started = time.monotonic()
+        completed = self.load_checkpoint()
+        if completed:
+            logger.info("Resuming from checkpoint, %d products are already embedded.", len(completed))
+        stats = self.loader.load(self.__embed(products, completed))
+        logger.info(
+            "Embedded %d products with %d requests in %.1f s (%d skipped).",
+            stats.items, self.embedding_requests, time.monotonic() - started, self.skipped
+        )
+        return stats
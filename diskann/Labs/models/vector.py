@@ -0,0 +1,100 @@
+"""
+Vector model
+"""
+import base64
+from typing import Annotated, Any, List, Sequence, Union
+import numpy as np
+from pydantic import PlainSerializer, PlainValidator, WithJsonSchema
+
+def to_vector(value: Union[np.ndarray, Sequence[float], str, bytes]) -> np.ndarray:
+    """
+    Converts a JSON list of numbers (or an array, or float32 bytes / base64 string)
+    to a one-dimensional numpy float32 array.
+    """
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False).reshape(-1)
+    if isinstance(value, (bytes, str)):
+        return vector_from_bytes(value)
+    return np.asarray(value, dtype=np.float32).reshape(-1)
+
+# Powers of ten from 1e-60 to 1e60, exact up to 1e22
+POWERS_OF_TEN = 10.0 ** np.arange(-60, 61)
+
+def to_list(value: Any) -> List[float]:
+    """
+    Serializes a vector to a JSON list of numbers. Every float32 value
+    is written with its shortest round-trip digits, so the list parses
+    back to the same array and is as compact as the embeddings returned
+    by Azure OpenAI (tolist() would write the 17 digits of the float64).
+    """
+    if isinstance(value, np.ndarray):
+        return shortest_float64(value).tolist()
+    return list(value)
+
+def shortest_float64(vector: np.ndarray) -> np.ndarray:
+    """
+    Returns the float64 values whose repr is the shortest decimal that parses back
+    to each float32 value of the vector: the values are rounded to 9 down to 6
+    significant digits, vectorized, keeping the shortest rounding that round-trips.
+    A float32 needs at most 9 digits, with 6 digits or fewer the 6-digit rounding
+    is already the shortest decimal.
+    """
+    vector = to_vector(vector)
+    exact = vector.astype(np.float64)
+    finite = np.isfinite(exact) & (exact != 0)
+    magnitude = np.floor(np.log10(np.abs(np.where(finite, exact, 1.0)))).astype(np.int64)
+    # Scales the values to 9 significant digits, dividing by a power of ten keeps it exact
+    scale = POWERS_OF_TEN[np.clip(68 - magnitude, 0, 120)]
+    result = exact
+    for divisor in (1.0, 10.0, 100.0, 1000.0):
+        digits_scale = scale / divisor
+        candidate = np.round(exact * digits_scale) / digits_scale
+        result = np.where((candidate.astype(np.float32) == vector) & finite, candidate, result)
+    return result
+
+def vector_to_bytes(vector: np.ndarray) -> bytes:
+    """
+    Returns the little-endian float32 bytes of a vector (4 bytes per dimension).
+    """
+    return to_vector(vector).astype("<f4", copy=False).tobytes()
+
+def vector_from_bytes(data: Union[bytes, str]) -> np.ndarray:
+    """
+    Reads a vector from float32 bytes or their base64 encoding.
+    """
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return np.frombuffer(data, dtype="<f4").astype(np.float32)
+
+def to_float16(vector: np.ndarray) -> np.ndarray:
+    """
+    Returns the vector as float16 (2 bytes per dimension, about three significant digits).
+    """
+    return to_vector(vector).astype(np.float16)
+
+def quantize_int8(vector: np.ndarray) -> tuple[np.ndarray, float]:
+    """
+    Quantizes a vector to int8 (1 byte per dimension) with a symmetric scale.
+
+    Returns:
+        tuple[np.ndarray, float]: The int8 values and the scale to dequantize them.
+    """
+    vector = to_vector(vector)
+    max_abs = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = max_abs / 127 if max_abs else 1.0
+    return np.clip(np.rint(vector / scale), -127, 127).astype(np.int8), scale
+
+def dequantize_int8(values: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Restores an approximate float32 vector from its int8 quantization.
+    """
+    return values.astype(np.float32) * np.float32(scale)
+
+# A compact embedding field: held as a numpy float32 array (4 bytes per dimension
+# instead of a list of boxed Python floats), parsed from and serialized to a JSON list
+Vector = Annotated[
+    np.ndarray,
+    PlainValidator(to_vector),
+    PlainSerializer(to_list, return_type=List[float]),
+    WithJsonSchema({"type": "array", "items": {"type": "number"}})
+]
@@ -0,0 +1,254 @@
+"""
+Class: AzureOpenAIRateLimiter
+Description:
+    The AzureOpenAIRateLimiter class is a process-wide token bucket
+    limiter for Azure OpenAI traffic. It tracks requests-per-minute and
+    tokens-per-minute for each model deployment and adapts to the rate
+    limit headers returned by the service. The limiter is attached to the
+    OpenAI clients through httpx event hooks so every call made by the
+    LangChain chat and embeddings models goes through it.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from typing import Dict, Optional
+import httpx
+from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+DEPLOYMENT_PATH_PATTERN = re.compile(r"/openai/deployments/([^/]+)/")
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to its per-minute capacity.
+    """
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """
+        Adds the tokens accrued since the last refill.
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Returns the seconds until the bucket holds the requested amount.
+        """
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+class DeploymentState:
+    """
+    The request and token buckets of a single model deployment.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.throttled_responses = 0
+
+class AzureOpenAIRateLimiter:
+    """
+    A thread-safe, asyncio-friendly rate limiter shared by every Azure OpenAI client in the process.
+    """
+    def __init__(
+            self,
+            deployment_limits: Optional[Dict[str, tuple[int, int]]] = None,
+            default_requests_per_minute: int = 60,
+            default_tokens_per_minute: int = 10000,
+            default_completion_tokens: int = 500):
+        """
+        Args:
+            deployment_limits: Maps a deployment name to its (requests per minute, tokens per minute) quota.
+            default_requests_per_minute: Requests quota for deployments not listed in deployment_limits.
+            default_tokens_per_minute: Tokens quota for deployments not listed in deployment_limits.
+            default_completion_tokens: Completion tokens reserved for chat requests that don't set max_tokens.
+        """
+        self.deployment_limits = deployment_limits or {}
+        self.default_requests_per_minute = default_requests_per_minute
+        self.default_tokens_per_minute = default_tokens_per_minute
+        self.default_completion_tokens = default_completion_tokens
+        self._deployments: Dict[str, DeploymentState] = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self, deployment: str) -> DeploymentState:
+        state = self._deployments.get(deployment)
+        if state is None:
+            requests_per_minute, tokens_per_minute = self.deployment_limits.get(
+                deployment, (self.default_requests_per_minute, self.default_tokens_per_minute)
+            )
+            state = DeploymentState(requests_per_minute, tokens_per_minute)
+            self._deployments[deployment] = state
+        return state
+
+    def _reserve(self, deployment: str, tokens: int) -> float:
+        """
+        Takes one request and the estimated tokens from the deployment buckets when
+        available and returns 0, otherwise returns the seconds to wait before retrying.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._get_state(deployment)
+            if now < state.blocked_until:
+                return state.blocked_until - now
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            wait = max(state.requests.wait_time(1), state.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            state.requests.level -= 1
+            state.tokens.level -= min(tokens, state.tokens.capacity)
+            return 0.0
+
+    def _set_waiting(self, deployment: str, delta: int) -> None:
+        with self._lock:
+            self._get_state(deployment).waiting += delta
+
+    def acquire(self, deployment: str, tokens: int) -> None:
+        """
+        Blocks the calling thread until the deployment has capacity for the request.
+        """
+        self._set_waiting(deployment, 1)
+        try:
+            while (wait := self._reserve(deployment, tokens)) > 0:
+                time.sleep(wait)
+        finally:
+            self._set_waiting(deployment, -1)
+
+    async def aacquire(self, deployment: str, tokens: int) -> None:
+        """
+        Waits without blocking the event loop until the deployment has capacity for the request.
+        """
+        self._set_waiting(deployment, 1)
+        try:
+            while (wait := self._reserve(deployment, tokens)) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._set_waiting(deployment, -1)
+
+    def update_from_headers(self, deployment: str, status_code: int, headers: httpx.Headers) -> None:
+        """
+        Aligns the deployment buckets with the remaining quota reported by the service
+        and pauses the deployment when the service asks the client to retry later.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._get_state(deployment)
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests is not None:
+                state.requests.refill(now)
+                state.requests.level = min(state.requests.capacity, float(remaining_requests))
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None:
+                state.tokens.refill(now)
+                state.tokens.level = min(state.tokens.capacity, float(remaining_tokens))
+            if status_code == 429:
+                state.throttled_responses += 1
+                retry_after = self._get_retry_after(headers)
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+
+    @staticmethod
+    def _get_retry_after(headers: httpx.Headers) -> float:
+        """
+        Returns the retry delay in seconds requested by the service, defaulting to one second.
+        """
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return 1.0
+
+    def estimate_tokens(self, request: httpx.Request) -> int:
+        """
+        Estimates the tokens counted against the quota for a request using
+        the approximation of four characters per token.
+        """
+        try:
+            body = json.loads(request.content or b"{}")
+        except ValueError:
+            return 1
+        if "input" in body:
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            if inputs and isinstance(inputs[0], int):
+                inputs = [inputs]
+            # LangChain sends pre-tokenized inputs as lists of token ids
+            return max(1, sum(
+                len(text) if isinstance(text, list) else len(str(text)) // 4
+                for text in inputs
+            ))
+        prompt_characters = sum(len(json.dumps(message)) for message in body.get("messages", []))
+        completion_tokens = body.get("max_tokens") or self.default_completion_tokens
+        return max(1, prompt_characters // 4 + completion_tokens)
+
+    @staticmethod
+    def get_deployment(request: httpx.Request) -> str:
+        """
+        Returns the deployment name targeted by an Azure OpenAI request.
+        """
+        match = DEPLOYMENT_PATH_PATTERN.search(request.url.path)
+        return match.group(1) if match else "default"
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of requests currently waiting for capacity across all deployments.
+        """
+        with self._lock:
+            return sum(state.waiting for state in self._deployments.values())
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth and remaining capacity of each deployment.
+        """
+        now = time.monotonic()
+        with self._lock:
+            deployments = {}
+            for name, state in self._deployments.items():
+                state.requests.refill(now)
+                state.tokens.refill(now)
+                deployments[name] = {
+                    "queue_depth": state.waiting,
+                    "available_requests": int(state.requests.level),
+                    "available_tokens": int(state.tokens.level),
+                    "blocked_for_seconds": round(max(0.0, state.blocked_until - now), 3),
+                    "throttled_responses": state.throttled_responses
+                }
+            return {
+                "queue_depth": sum(state.waiting for state in self._deployments.values()),
+                "deployments": deployments
+            }
+
+    def http_client(self) -> httpx.Client:
+        """
+        Returns an httpx client, with the OpenAI default settings, that routes
+        every request through the limiter.
+        """
+        def on_request(request: httpx.Request) -> None:
+            self.acquire(self.get_deployment(request), self.estimate_tokens(request))
+
+        def on_response(response: httpx.Response) -> None:
+            self.update_from_headers(self.get_deployment(response.request), response.status_code, response.headers)
+
+        return DefaultHttpxClient(event_hooks={"request": [on_request], "response": [on_response]})
+
+    def http_async_client(self) -> httpx.AsyncClient:
+        """
+        Returns an httpx async client, with the OpenAI default settings, that
+        routes every request through the limiter.
+        """
+        async def on_request(request: httpx.Request) -> None:
+            await self.aacquire(self.get_deployment(request), self.estimate_tokens(request))
+
+        async def on_response(response: httpx.Response) -> None:
+            self.update_from_headers(self.get_deployment(response.request), response.status_code, response.headers)
+
+        return DefaultAsyncHttpxClient(event_hooks={"request": [on_request], "response": [on_response]})
@@ -1,11 +1,13 @@
 """
 API entrypoint for backend API.
 """
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from api_models.ai_request import AIRequest
 from cosmic_works.cosmic_works_ai_agent import CosmicWorksAIAgent
+from cosmic_works.agent_pool import AgentPool
 
 app = FastAPI()
 
@@ -23,8 +25,13 @@ app.add_middleware(
 
 
 # Agent pool keyed by session_id to retain memories/history in-memory.
-# Note: the context is lost every time the service is restarted.
-agent_pool = {}
+# The pool is bounded by size and idle time to keep memory use in check.
+# Note: the context is lost every time the service is restarted or an agent is evicted.
+agent_pool = AgentPool(
+    CosmicWorksAIAgent,
+    max_size = int(os.environ.get("AGENT_POOL_MAX_SIZE", "1000")),
+    idle_ttl_seconds = float(os.environ.get("AGENT_POOL_IDLE_TTL_SECONDS", "1800"))
+)
 
 @app.get("/")
 def root():
@@ -33,11 +40,17 @@ def root():
     """
     return {"status": "ready"}
 
+@app.get("/stats")
+def stats():
+    """
+    Runtime statistics endpoint.
+    """
+    return { "agent_pool": agent_pool.stats() }
+
 @app.post("/ai")
 def run_cosmic_works_ai_agent(request: AIRequest):
     """
     Run the Cosmic Works AI agent.
     """
-    if request.session_id not in agent_pool:
-        agent_pool[request.session_id] = CosmicWorksAIAgent(request.session_id)
-    return { "message": agent_pool[request.session_id].run(request.prompt) }
+    agent = agent_pool.get(request.session_id)
+    return { "message": agent.run(request.prompt) }
@@ -0,0 +1,105 @@
+"""
+Class: AgentPool
+Description:
+    The AgentPool class holds AI agents keyed by session id. The pool is
+    bounded by a maximum size (least recently used agents are evicted
+    first) and an idle time to live. An evicted agent is rebuilt by the
+    agent factory the next time its session is used.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+class AgentPool:
+    """
+    A thread-safe LRU/TTL bounded pool of agents keyed by session id.
+    """
+    def __init__(
+            self,
+            agent_factory: Callable[[str], Any],
+            max_size: int = 1000,
+            idle_ttl_seconds: Optional[float] = 1800):
+        """
+        Args:
+            agent_factory: Builds (or rebuilds) the agent for a session id.
+            max_size: Maximum number of agents held in the pool.
+            idle_ttl_seconds: Seconds an agent may stay unused before it is evicted,
+                None disables idle eviction.
+        """
+        self.agent_factory = agent_factory
+        self.max_size = max_size
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._agents: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._lru_evictions = 0
+        self._ttl_evictions = 0
+
+    def get(self, session_id: str) -> Any:
+        """
+        Returns the agent for the session, building it when it isn't pooled.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._agents.get(session_id)
+            if entry is not None:
+                self._agents[session_id] = (now, entry[1])
+                self._agents.move_to_end(session_id)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        # Build the agent outside of the lock so slow construction doesn't block other sessions
+        agent = self.agent_factory(session_id)
+
+        with self._lock:
+            # Another request for the same session may have built the agent in the meantime
+            entry = self._agents.get(session_id)
+            if entry is not None:
+                return entry[1]
+            self._agents[session_id] = (time.monotonic(), agent)
+            while len(self._agents) > self.max_size:
+                self._agents.popitem(last=False)
+                self._lru_evictions += 1
+            return agent
+
+    def _evict_expired(self, now: float) -> None:
+        """
+        Evicts the agents that have been idle longer than the time to live.
+        Agents are ordered by last use, so the scan stops at the first live agent.
+        """
+        if self.idle_ttl_seconds is None:
+            return
+        while self._agents:
+            session_id, (last_used, _) = next(iter(self._agents.items()))
+            if now - last_used <= self.idle_ttl_seconds:
+                return
+            del self._agents[session_id]
+            self._ttl_evictions += 1
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._agents
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._agents)
+
+    def stats(self) -> dict:
+        """
+        Returns the pool size and the hit, miss and eviction counters.
+        """
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return {
+                "size": len(self._agents),
+                "max_size": self.max_size,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "lru_evictions": self._lru_evictions,
+                "ttl_evictions": self._ttl_evictions
+            }